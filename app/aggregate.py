@@ -0,0 +1,142 @@
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, field
+
+"""
+Single pass aggregation of the paper records for the Summary tab.
+
+The dashboard needs about a dozen statistics (collaborators, publication years, funders, affiliations, author positions, ...).
+Computing each of them in its own loop walks over all records again and again. aggregate() walks the records once and
+collects everything into one SummaryStats object, from which the figures and the overview table are built.
+"""
+
+
+@dataclass
+class SummaryStats:
+    """
+    All statistics of the Summary tab for one author and one dataset.
+
+    Attributes:
+        number_papers (int): Number of papers.
+        author_counts (Counter): Number of papers per author name, the searched author included.
+        year_counts (Counter): Number of papers per publication year.
+        funder_counts (Counter): Number of occurrences of each grant.
+        funded_papers (int): Number of papers with at least one grant.
+        affiliation_counts (Counter): Number of occurrences of each affiliation of the searched author.
+        last_author_counts (Counter): Number of papers per last author.
+        positions (list): Position (starting at 1) of the searched author in every author list it appears in.
+        number_authorships (int): Sum of the author list lengths over all papers.
+        number_affiliations (int): Number of affiliations over all authorships.
+        author_papers (int): Number of papers which list the searched author.
+        author_affiliated_papers (int): Number of those papers which contain an affiliation of the searched author.
+        spellings (frozenset): Names in the author lists which are spellings of the searched author, see
+            NameIndex.spellings. The crawler also keeps papers listing such a spelling, so all of them count as the
+            searched author.
+    """
+    number_papers: int = 0
+    author_counts: Counter = field(default_factory=Counter)
+    year_counts: Counter = field(default_factory=Counter)
+    funder_counts: Counter = field(default_factory=Counter)
+    funded_papers: int = 0
+    affiliation_counts: Counter = field(default_factory=Counter)
+    last_author_counts: Counter = field(default_factory=Counter)
+    positions: list = field(default_factory=list)
+    number_authorships: int = 0
+    number_affiliations: int = 0
+    author_papers: int = 0
+    author_affiliated_papers: int = 0
+    spellings: frozenset = frozenset()
+
+    @property
+    def number_unique_collaborators(self):
+        return len(self.author_counts) - len(self.spellings)  # exclude the spellings of the author
+
+    @property
+    def number_first_authorships(self):
+        return self.positions.count(1)
+
+    # The percentages are 0.0 without papers, e.g. for a search without results or a name which matches no author list exactly
+    @property
+    def percentage_funding(self):
+        return self.funded_papers / self.number_papers * 100 if self.number_papers else 0.0
+
+    @property
+    def percentage_affiliation(self):
+        return self.number_affiliations / self.number_authorships * 100 if self.number_authorships else 0.0
+
+    @property
+    def author_percentage_affiliation(self):
+        return self.author_affiliated_papers / self.author_papers * 100 if self.author_papers else 0.0
+
+
+def aggregate(data, author_name, spellings=None):
+    """
+    Computes all statistics of the Summary tab in one pass over the records.
+
+    Parameters:
+        data (list of dict): List of publication data, with each publication as a dictionary.
+        author_name (str): Name of the searched author.
+        spellings (frozenset): Spellings of the searched author, taken from the name index built at ingest (see
+            NameIndex.spellings). Only the exact name by default.
+
+    Returns:
+        SummaryStats: The collected statistics.
+    """
+    stats = SummaryStats()
+    # Values are collected in flat lists and counted once at the end, which is much cheaper than updating a Counter per record
+    authors_all, years, funders, affiliations, last_authors = [], [], [], [], []
+    own = frozenset([author_name]) if spellings is None else frozenset(spellings)
+    affiliation_keys = [f'{name}_AD' for name in own]
+    for i in data:
+        authors = i['FAU']
+        authors_all.extend(authors)
+        stats.number_authorships += len(authors)
+        if authors:
+            last_authors.append(authors[-1])
+        # every affiliation is stored under 'AD' and under the key of its author
+        if 'AD' in i:
+            stats.number_affiliations += len(i['AD'])
+
+        for date in i['DP']:
+            years.append(date.split()[0])
+
+        if 'GR' in i:
+            stats.funded_papers += 1
+            funders.extend(i['GR'])
+
+        if not own.isdisjoint(authors):
+            stats.author_papers += 1
+            affiliated = False
+            for key in affiliation_keys:
+                if key in i:
+                    affiliated = True
+                    affiliations.extend(i[key])
+            stats.author_affiliated_papers += affiliated
+            stats.positions.extend(idx + 1 for idx, author in enumerate(authors) if author in own)
+        else:
+            for key in affiliation_keys:
+                if key in i:
+                    affiliations.extend(i[key])
+    stats.author_counts.update(authors_all)
+    stats.year_counts.update(years)
+    stats.funder_counts.update(funders)
+    stats.affiliation_counts.update(affiliations)
+    stats.last_author_counts.update(last_authors)
+    stats.number_papers = len(data)
+    # only the spellings which occur in the data, the index also knows those of other datasets
+    stats.spellings = frozenset(name for name in own if name in stats.author_counts)
+    return stats
+
+
+def dataset_fingerprint(data):
+    """
+    Identifies a dataset by the set of its PMIDs. The fingerprint changes when papers are added or removed.
+
+    Parameters:
+        data (list of dict): List of publication data, with each publication as a dictionary.
+
+    Returns:
+        str: Hex digest of the sorted PMIDs.
+    """
+    pmids = sorted(i['PMID'][0] for i in data if 'PMID' in i)
+    return hashlib.sha1('\n'.join(pmids).encode('utf-8')).hexdigest()
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request, Response
+from dataset_cache import DatasetCache
+from canonical import Canonicalizer
+from names import NameIndex
+from instrument import span
+
+"""
+Headless HTTP API with the results of the Summary, Author Network and Title Embeddings tabs, for tools which need the numbers
+without the UI. It serves the authors which have been crawled into the results directory and reuses the computations of
+the tabs. Start it with
+
+    uvicorn api:app --port 8000 --workers 4
+
+Every response carries an ETag derived from the fingerprint of the dataset and the query parameters. The summary tag also
+contains the version of the canonicalizers, which change the merged funder and affiliation counts when they link new
+strings. A request with a matching If-None-Match header is answered with 304 before anything is computed. Results are
+cached per ETag, and concurrent requests for the same result wait for one computation. Looking up the dataset (it checks the
+modification time of the files) and the computations run on a bounded thread pool (PUBMED_API_WORKERS), cached results
+are answered on the event loop.
+"""
+
+API_VERSION = '1'
+RESULTS_DIR = os.environ.get('PUBMED_RESULTS_DIR', 'results')
+WORKERS = int(os.environ.get('PUBMED_API_WORKERS', '4'))
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:  # orjson is optional
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+app = FastAPI(title='PubMed Author Investigator API', version=API_VERSION)
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='api')
+_datasets = DatasetCache()
+_canonicalizers = {kind: Canonicalizer(kind) for kind in ['affiliation', 'funder']}
+_name_index = {}  # 'index' and the modification time of its file as 'version'
+_name_index_lock = threading.Lock()
+
+
+class ResultCache:
+    """
+    LRU cache of serialized responses by ETag, with one computation per key at a time.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._computing = {}  # key -> lock of the running computation
+
+    def get(self, key):
+        """
+        Returns the cached result of a key, or None.
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+            return self._results.get(key)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+            key_lock = self._computing.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self._lock:
+                    if key in self._results:
+                        return self._results[key]
+                body = _dumps(compute())
+                with self._lock:
+                    self._results[key] = body
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            return body
+        finally:
+            # also after a failed computation, the next request computes again with a new lock
+            with self._lock:
+                if self._computing.get(key) is key_lock:
+                    del self._computing[key]
+
+
+_results = ResultCache()
+
+
+def author_dir(name):
+    """
+    Returns the directory of the processed papers of an author, or raises 404 if the author has not been crawled.
+    """
+    path = os.path.join(RESULTS_DIR, name.replace(', ', '_'), 'processed')
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f'Author {name!r} has not been searched yet.')
+    return path
+
+
+def load_dataset(name):
+    """
+    Loads the dataset of an author through the shared dataset cache, with the columnar tables.
+    """
+    dir_name = author_dir(name)
+    dataset = _datasets.get(dir_name)
+    if dataset.tables is None:
+        from columnar import load_or_build_tables
+        dataset.tables = load_or_build_tables(os.path.join(os.path.dirname(dir_name), 'tables'), dataset.records)
+    return dataset
+
+
+def spellings(name):
+    """
+    Spellings of an author which are counted as the author, from the name index the crawler extends at ingest (see
+    NameIndex.spellings). The index is loaded again when a crawl has changed it.
+    """
+    path = NameIndex(os.path.join(RESULTS_DIR, '_names')).path
+    version = os.path.getmtime(path) if os.path.exists(path) else None
+    with _name_index_lock:
+        if 'index' not in _name_index or _name_index['version'] != version:
+            _name_index.update(index=NameIndex.load(RESULTS_DIR), version=version)
+        return _name_index['index'].spellings(name)
+
+
+def canonical_version():
+    """
+    Versions of the canonicalizers, part of the ETag of the summary, see Canonicalizer.version.
+    """
+    return {kind: canonicalizer.version for kind, canonicalizer in sorted(_canonicalizers.items())}
+
+
+def summary_result(name, dataset, top):
+    """
+    The statistics of the Summary tab as JSON compatible dict.
+    """
+    from columnar import summary_stats
+    stats = summary_stats(dataset.tables, name, spellings(name))
+    funders = _canonicalizers['funder'].canonical_counts(stats.funder_counts)
+    affiliations = _canonicalizers['affiliation'].canonical_counts(stats.affiliation_counts)
+    return {
+        'author': name,
+        'papers': stats.number_papers,
+        'spellings': {spelling: stats.author_counts[spelling] for spelling in sorted(stats.spellings)},
+        'unique_collaborators': stats.number_unique_collaborators,
+        'first_authorships': stats.number_first_authorships,
+        'percentage_funding': stats.percentage_funding,
+        'percentage_affiliation': stats.percentage_affiliation,
+        'papers_per_year': dict(sorted(stats.year_counts.items())),
+        'positions': {str(position): stats.positions.count(position) for position in sorted(set(stats.positions))},
+        'top_collaborators': [(author, count) for author, count in stats.author_counts.most_common(top + len(stats.spellings)) if author not in stats.spellings][:top],
+        'top_last_authors': stats.last_author_counts.most_common(top),
+        'top_funders': funders.most_common(top),
+        'top_affiliations': affiliations.most_common(top),
+    }
+
+
+def network_result(name, dataset, top, pivots):
+    """
+    Size, communities and centrality metrics of the co-author network of the Author Network tab.
+    """
+    import networkx as nx
+    from metrics import build_graph, compute_metrics
+    G = build_graph(dataset.records)
+    communities = list(nx.algorithms.community.greedy_modularity_communities(G)) if G.number_of_edges() else []
+    metrics_df, _ = compute_metrics(G, k=pivots)
+    central = metrics_df.sort_values('Degree', ascending=False).head(top)
+    return {
+        'author': name,
+        'nodes': G.number_of_nodes(),
+        'edges': G.number_of_edges(),
+        'communities': len(communities),
+        'modularity': nx.algorithms.community.modularity(G, communities) if communities else 0.0,
+        'central_authors': [{'author': author, **row} for author, row in central.to_dict(orient='index').items()],
+    }
+
+
+def embeddings_result(name, dataset, mode):
+    """
+    2D coordinates of every paper as on the Title Embeddings tab, from the fast sparse mode or from BioBERT.
+    """
+    from embedd import get_abstracts_pmid, get_documents, get_sparse_embeddings, get_embeddings, load_model
+    from loader import read_abstracts
+    titles, urls = get_abstracts_pmid(dataset.records, 'https://pubmed.ncbi.nlm.nih.gov/')
+    if mode == 'fast':
+        reduced = get_sparse_embeddings(get_documents(dataset.records, read_abstracts(dataset.dir_name)))
+    else:
+        from sklearn.decomposition import PCA
+        tokenizer, model = load_model()
+        reduced = PCA(n_components=2).fit_transform(get_embeddings(titles, tokenizer, model))
+    return {
+        'author': name,
+        'mode': mode,
+        'papers': [{'url': url, 'x': float(x), 'y': float(y)} for url, (x, y) in zip(urls, reduced)],
+    }
+
+
+async def respond(request, endpoint, name, params, compute):
+    """
+    Answers a request from the cache or computes it on the worker pool, with ETag and conditional response handling.
+    """
+    loop = asyncio.get_running_loop()
+    # loading is cheap when the dataset is cached, but reads files otherwise, so it runs on the pool as well
+    dataset = await loop.run_in_executor(_executor, load_dataset, name)
+    tag = hashlib.sha1(json.dumps([API_VERSION, endpoint, name, dataset.fingerprint, params]).encode('utf-8')).hexdigest()
+    etag = f'"{tag}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in [value.strip() for value in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    def run():
+        with span(f'api.{endpoint}'):
+            return _results.get_or_compute(tag, lambda: compute(dataset))
+
+    body = _results.get(tag)
+    if body is None:
+        body = await loop.run_in_executor(_executor, run)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+@app.get('/authors')
+def authors():
+    """
+    Lists the authors which have been searched and can be queried.
+    """
+    if not os.path.isdir(RESULTS_DIR):
+        return []
+    return [dir_name.replace('_', ', ', 1) for dir_name in sorted(os.listdir(RESULTS_DIR))
+            if os.path.isdir(os.path.join(RESULTS_DIR, dir_name, 'processed'))]
+
+
+@app.get('/authors/{name}/summary')
+async def summary(name: str, request: Request, top: int = 10):
+    # the canonical labels of funders and affiliations change when other datasets link new strings
+    params = {'top': top, 'canonical': canonical_version()}
+    return await respond(request, 'summary', name, params, lambda dataset: summary_result(name, dataset, top))
+
+
+@app.get('/authors/{name}/network')
+async def network(name: str, request: Request, top: int = 10, pivots: int = 100):
+    return await respond(request, 'network', name, {'top': top, 'pivots': pivots}, lambda dataset: network_result(name, dataset, top, pivots))
+
+
+@app.get('/authors/{name}/embeddings')
+async def embeddings(name: str, request: Request, mode: str = 'fast'):
+    if mode not in ('fast', 'biobert'):
+        raise HTTPException(status_code=422, detail='mode must be "fast" or "biobert".')
+    return await respond(request, 'embeddings', name, {'mode': mode}, lambda dataset: embeddings_result(name, dataset, mode))
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
@@ -1,16 +1,44 @@
 import streamlit as st
 import os
-import json
 from pubmed_crawler import SinglePubMedSearcher
+from dataset_cache import DatasetCache
+from export import FORMATS, export_archive
+from aggregate import dataset_fingerprint
+from instrument import span
 
 # Set the page configuration for layout and title in the Streamlit app
 st.set_page_config(layout="wide", page_title="PubMed Author Investigator")
 
+
+@st.cache_resource
+def get_warmup():
+    """
+    Starts the optional background warm-up once per server process, see warmup.py.
+    """
+    from warmup import start_warmup
+    return start_warmup()
+
+
+get_warmup()
+
+
+@st.cache_resource
+def get_prefetcher():
+    """
+    Returns the optional prefetcher of collaborators shared by all sessions of the server process, see prefetch.py.
+    """
+    from prefetch import start_prefetcher
+    return start_prefetcher()
+
+
 # Display the main title of the application
 st.title('PubMed Author Investigator')
 
 # Define the titles for each of the application tabs
-tabs = ["About", "Summary", "Author Network", "Title Embeddings"]
+tabs = ["About", "Summary", "Author Network", "Title Embeddings", "Compare Authors"]
+# The diagnostics tab is hidden unless it is enabled by environment variable or query parameter
+if os.environ.get('PUBMED_DIAGNOSTICS') == '1' or st.query_params.get('diagnostics') == '1':
+    tabs.append("Diagnostics")
 
 # Initialize session state variables if they don’t exist
 if 'selected_tab' not in st.session_state:
@@ -33,98 +61,50 @@ lname = lname.strip()
 
 # The names are not altered futher. It is better to give the user the information that the name must be entered as it appears in the paper. 
 
-# Function to retrieve list of file paths in the specified directory
-def get_paper(dir_name):
-    """
-    Retrieves the list of file paths within a given directory.
-
-    Args:
-        dir_name (str): Directory containing files.
 
-    Returns:
-        list: List of file paths in the directory.
+@st.cache_resource
+def get_dataset_cache():
     """
-    return [os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name)]
-
-
-# Function to get the number of files in a specified directory
-def get_number_of_papers(dir_name):
-    """
-    Counts the number of files in a directory.
-
-    Args:
-        dir_name (str): Directory to count files in.
+    Returns the dataset cache shared by all sessions of the server process.
 
     Returns:
-        int: Number of files in the directory.
+        DatasetCache: The shared cache.
     """
-    return len(os.listdir(dir_name))
-
-
-# Function to read and load data from a list of JSON files
-def get_paper_data(file_names):
-    """
-    Reads JSON files and appends their data into a list.
-
-    Args:
-        file_names (list): List of JSON file paths.
-
-    Returns:
-        list: List containing JSON data from each file.
-    """
-    results = []
-    for file_name in file_names:
-        with open(file_name, 'r') as file:
-            data = json.load(file)
-            results.append(data)
-    return results
-
-
-# Function to package data into a downloadable ZIP archive
-def make_zip(data):
-    """
-    Packages a list of JSON data into a ZIP file for download.
-
-    Args:
-        data (list): JSON serializable data to be archived.
-
-    Returns:
-        bytes: In-memory ZIP file data ready for download.
-    """
-    import io
-    import zipfile
-    zip_buffer = io.BytesIO()  # Create an in-memory buffer for the ZIP file
-    
-    # Add JSON data as a file to the ZIP archive
-    with zipfile.ZipFile(zip_buffer, 'w') as zf:
-        json_file_name = 'info_data.json'
-        zf.writestr(json_file_name, json.dumps(data))
-    
-    zip_buffer.seek(0)  # Move buffer cursor to the beginning
-    return zip_buffer.getvalue()
+    return DatasetCache()
 
 
 # Search and retrieve author data upon button click
 if st.sidebar.button('Search - Update'):
     with st.spinner('Searching PubMed... And Analyzing'):
         # Use PubMed searcher to find specified author data
-        dir_name = SinglePubMedSearcher(f'{lname}, {fname}').search_author()
+        with span('app.search'):
+            dir_name = SinglePubMedSearcher(f'{lname}, {fname}').search_author()
         st.session_state.name = f'{lname}, {fname}'  # Store author name in session state
+        st.session_state.dir_name = dir_name  # Store the directory of the processed files for the export
         
-        # Retrieve list of files and initialize progress bar
-        file_names = get_paper(dir_name)
-        total_files = len(file_names)
-        st.session_state.data = []  # Initialize session state data list
         my_bar = st.progress(0)  # Progress bar for file loading
         
-        # Load data from each file and update the progress bar
-        for i, file_name in enumerate(file_names):
-            data = get_paper_data([file_name])
-            st.session_state.data.extend(data)
-            my_bar.progress((i + 1) / total_files)
+        # Load the files in parallel chunks into the dataset cache shared by all sessions. The session only keeps a reference
+        # to the read-only records, so several users looking at the same author do not hold several copies.
+        with span('app.load_files'):
+            dataset = get_dataset_cache().get(dir_name, on_progress=my_bar.progress)
+        st.session_state.data = dataset.records
         
         my_bar.empty()  # Clear the progress bar when loading is complete
 
+        # Columnar tables of the same papers for the vectorized analytics, stored next to the processed files
+        if dataset.records and dataset.tables is None:
+            from columnar import load_or_build_tables  # pandas is imported on first use, not at start up
+            with span('app.load_tables'):
+                dataset.tables = load_or_build_tables(os.path.join(os.path.dirname(dir_name), 'tables'), dataset.records)
+        st.session_state.tables = dataset.tables
+
+        # Crawl the top collaborators in the background, so clicking through to them does not wait for a crawl
+        prefetcher = get_prefetcher()
+        if prefetcher and dataset.tables is not None:
+            from prefetch import top_collaborators
+            prefetcher.submit(top_collaborators(dataset.tables, st.session_state.name, prefetcher.top_n))
+
         selected_tab = "Summary" 
     # Display an error message if no data is loaded
     if not st.session_state.data:
@@ -137,44 +117,61 @@ if st.sidebar.button('Search - Update'):
             """, 
             unsafe_allow_html=True
         )
-    
-    # Provide a download button for the data in the sidebar if data is loaded
-    with st.sidebar:
-        if st.session_state.data:
-            st.download_button(
-                label="Download Data",
-                data=make_zip(st.session_state.data),
-                file_name='data.zip',
-                mime='application/zip'
-            )
+
+# Provide a download for the data in the sidebar if data is loaded. The archive is only created when it is requested
+# and is streamed from the processed files to disk, where it is cached per dataset and format. The download button is
+# only rendered in the run in which the download was requested, so the archive is not read again on every rerun.
+with st.sidebar:
+    if st.session_state.data and st.session_state.get('dir_name'):
+        export_format = st.selectbox('Download Format', list(FORMATS))
+        if st.button('Prepare Download'):
+            with st.spinner('Creating archive...'):
+                export_path = export_archive(st.session_state.dir_name, dataset_fingerprint(st.session_state.data), FORMATS[export_format])
+            with open(export_path, 'rb') as file:
+                st.download_button(
+                    label="Download Data",
+                    data=file,
+                    file_name=os.path.basename(export_path),
+                    mime='application/zip'
+                )
 
 # about page is not dependent on data.
 if selected_tab == "About":
     import about
     about.show_page()
 
+# the comparison uses all locally stored authors, not the data of the current search.
+if selected_tab == "Compare Authors":
+    import compare
+    compare.show_page()
+
+# diagnostics page is not dependent on data either.
+if selected_tab == "Diagnostics":
+    import diagnostics
+    diagnostics.show_page()
+
 # Display the selected tab module only if data is available
 if st.session_state.data:
     st.write('Read the about page for more details about the app and the data retrieval process.')
     if selected_tab == "Summary":
         import summary
-        summary.show_page(st.session_state.data, st.session_state.name)
+        summary.show_page(st.session_state.data, st.session_state.name, st.session_state.get('tables'))
     elif selected_tab == "Author Network":
         import network
         network.show_page(st.session_state.data)
     elif selected_tab == "Title Embeddings":
         import embedd
-        embedd.show_page(st.session_state.data, st.session_state.name)
+        embedd.show_page(st.session_state.data, st.session_state.name, st.session_state.get('dir_name'))
 
 # Display a message prompting users to enter an author name and search if no data is loaded
-else:
+elif selected_tab != "Compare Authors":
     st.write("Please enter the author's name and click 'Search' to load data.")
 
 
 st.sidebar.markdown('---')
 st.sidebar.warning(
     """
-    **The name must match exactly as it appears in the paper's author list**. Ensure that the author's name is entered accurately; otherwise, the search may return no results or unexpected results.
+    **Enter the name as it appears in the paper's author list ('Last, First')**. Papers listing a spelling without diacritics or with initials (e.g. 'Muller, J' for 'Müller, Jan') are included and counted as the author, so namesakes with a compatible spelling may be mixed in. The Summary tab lists the counted spellings.
     """
 )
 # Footer information for the app
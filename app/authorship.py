@@ -0,0 +1,233 @@
+import os
+import time
+import pandas as pd
+from columnar import build_tables, ROLES
+from coauthor_graph import iter_processed_papers
+
+"""
+Authorship-position index over every paper in the local results directory.
+
+Every authorship (paper, author) is one row with the position in the author list, the team size, the role (first,
+middle, last or single author) and the publication year. The rows of a crawl are taken from its columnar tables and
+written as one more Parquet part when it is ingested, so an ingest never rewrites the stored rows and the index is never
+rebuilt from the JSON files. Once there are more than MAX_PARTS parts they are compacted into one.
+Questions like "first and last author share over time", "typical team size by year" or "most frequent senior author"
+are group-bys over the rows of any author or set of authors.
+
+Writers and readers of the stored index hold the named lock '_authorships', a compaction removes the parts it merged.
+"""
+
+COLUMNS = ['pmid', 'author', 'position', 'n_authors', 'role', 'year']
+MAX_PARTS = 32
+
+
+class AuthorshipIndex:
+    """
+    Authorships of the whole local corpus.
+
+    Attributes:
+        index_dir (str): Directory containing the Parquet parts of the stored index.
+        authorships (pandas.DataFrame): One row per authorship, see COLUMNS.
+        pmids (set): PMIDs of all papers in the index.
+
+    Methods:
+        load(results_dir):
+            Loads the stored index, building it from all processed papers if it does not exist yet.
+
+        ingest(authorships, results_dir):
+            Appends the authorships of a crawl to the stored index without loading its rows.
+
+        add(authorships):
+            Appends the authorships of papers which are not in the index yet and stores them as a new part.
+
+        compact():
+            Merges all stored parts into one.
+    """
+
+    def __init__(self, index_dir='results/_authorships'):
+        self.index_dir = index_dir
+        self.authorships = pd.DataFrame({column: [] for column in COLUMNS})
+        self.pmids = set()
+
+    def parts(self):
+        """
+        Returns the paths of the stored parts, oldest first.
+        """
+        if not os.path.isdir(self.index_dir):
+            return []
+        return [os.path.join(self.index_dir, name) for name in sorted(os.listdir(self.index_dir))
+                if name.endswith('.parquet') and not name.startswith('.')]
+
+    @classmethod
+    def load(cls, results_dir='results'):
+        """
+        Loads the index from disk. If no index has been stored yet, it is built once from all processed papers.
+
+        Args:
+            results_dir (str): Directory containing the crawled authors.
+
+        Returns:
+            AuthorshipIndex: The loaded index.
+        """
+        index = cls(os.path.join(results_dir, '_authorships'))
+        parts = index.parts()
+        if parts:
+            index.authorships = _read(parts)
+            index.pmids = set(index.authorships['pmid'].astype(str).unique())
+        else:
+            index.add(build_tables(list(iter_processed_papers(results_dir)))['authorships'])
+        return index
+
+    @classmethod
+    def ingest(cls, authorships, results_dir='results'):
+        """
+        Appends the authorships of a crawl to the stored index. Only the PMIDs of the stored parts are read, the new
+        rows are written as a new part, and the parts are compacted once there are more than MAX_PARTS of them.
+
+        Args:
+            authorships (pandas.DataFrame): The authorships table of the columnar tables of a crawl.
+            results_dir (str): Directory containing the crawled authors.
+        """
+        index = cls(os.path.join(results_dir, '_authorships'))
+        parts = index.parts()
+        if not parts:
+            # the first ingest builds the index from all processed papers, the crawl is added in case it is not among them
+            cls.load(results_dir).add(authorships)
+            return
+        # the PMIDs of a part are the categories of its pmid column, only the few PMIDs of the crawl are looked up in them
+        pmids = authorships['pmid'].astype(str)
+        candidates = pmids.unique()
+        stored = set()
+        for path in parts:
+            categories = pd.read_parquet(path, columns=['pmid'])['pmid'].astype('category').cat.categories.astype(str)
+            stored.update(categories[categories.isin(candidates)])
+        new = authorships[~pmids.isin(stored)][COLUMNS]
+        if index._write_part(new) and len(index.parts()) > MAX_PARTS:
+            index.compact()
+
+    def add(self, authorships):
+        """
+        Appends authorships, skipping papers which are in the index already, so ingesting the same paper twice
+        does not count it twice. The new rows are stored as a new part.
+
+        Args:
+            authorships (pandas.DataFrame): The authorships table of the columnar tables of a crawl.
+        """
+        new = authorships[~authorships['pmid'].astype(str).isin(self.pmids)][COLUMNS]
+        self.pmids.update(new['pmid'].astype(str))
+        if not self._write_part(new):
+            return
+        # categoricals with different categories are concatenated as plain strings and compacted again
+        self.authorships = _compact(pd.concat([_strings(self.authorships), _strings(new)], ignore_index=True))
+
+    def compact(self):
+        """
+        Merges all stored parts into the newest one and removes the others.
+        """
+        parts = self.parts()
+        if len(parts) < 2:
+            return
+        _save(_read(parts), parts[-1])
+        for path in parts[:-1]:
+            os.remove(path)
+
+    def _write_part(self, new):
+        """
+        Stores new rows as a part, an empty part only if nothing is stored yet so the index is not built again.
+        Returns whether a part was written.
+        """
+        if len(new) == 0 and self.parts():
+            return False
+        _save(_compact(_strings(new)), os.path.join(self.index_dir, f'part-{time.time_ns()}.parquet'))
+        return True
+
+
+def _save(authorships, path):
+    # written to a hidden temporary name first, which parts() skips, and then replaced
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+    authorships.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _read(parts):
+    return _compact(pd.concat([_strings(pd.read_parquet(path)) for path in parts], ignore_index=True))
+
+
+def _strings(authorships):
+    return authorships.astype({column: str for column in ['pmid', 'author', 'role', 'year']})
+
+
+def _compact(authorships):
+    for column in ['pmid', 'author', 'year']:
+        authorships[column] = authorships[column].astype('category')
+    authorships['role'] = pd.Categorical(authorships['role'].astype(str), categories=ROLES)
+    for column in ['position', 'n_authors']:
+        authorships[column] = authorships[column].astype('int32')
+    return authorships
+
+
+def select(authorships, authors=None):
+    """
+    Returns the authorships of a set of authors, all authorships if authors is None.
+    """
+    if authors is None:
+        return authorships
+    return authorships[authorships['author'].isin(list(authors))]
+
+
+def role_share_by_year(authorships, authors=None, per_author=False):
+    """
+    Share of first, middle, last and single authorships per publication year.
+
+    Args:
+        authorships (pandas.DataFrame): Authorships, see AuthorshipIndex.
+        authors (list): Authors to include, all if None.
+        per_author (bool): Whether to compute the shares per author instead of over all selected authors together.
+
+    Returns:
+        pandas.DataFrame: Index year (and author), one column per role, the rows sum up to 1.
+    """
+    rows = select(authorships, authors)
+    rows = rows[rows['year'].astype(str) != '']
+    keys = ['author', 'year'] if per_author else ['year']
+    counts = rows.groupby(keys + ['role'], observed=True).size().unstack('role', fill_value=0)
+    counts = counts.reindex(columns=ROLES, fill_value=0)
+    return counts.div(counts.sum(axis=1), axis=0).sort_index()
+
+
+def team_size_by_year(authorships, authors=None):
+    """
+    Team size of the papers per publication year. Every paper is counted once, also if several selected authors wrote it.
+
+    Returns:
+        pandas.DataFrame: Index year, columns 'papers', 'median' and 'mean' team size.
+    """
+    rows = select(authorships, authors)
+    papers = rows[rows['year'].astype(str) != ''].drop_duplicates('pmid')
+    sizes = papers.groupby('year', observed=True)['n_authors']
+    return pd.DataFrame({'papers': sizes.size(), 'median': sizes.median(), 'mean': sizes.mean().round(1)}).sort_index()
+
+
+def senior_authors(authorships, authors, n=10):
+    """
+    Most frequent last authors of the papers of a set of authors, the authors themselves excluded.
+
+    Returns:
+        pandas.Series: Author -> number of papers as last author, most frequent first.
+    """
+    pmids = select(authorships, authors)['pmid'].unique()
+    rows = authorships[authorships['pmid'].isin(pmids) & (authorships['role'] == 'last') & ~authorships['author'].isin(list(authors))]
+    counts = rows['author'].value_counts()
+    return counts[counts > 0].head(n)
+
+
+def position_counts(authorships, authors):
+    """
+    Number of authorships per position and role of a set of authors.
+
+    Returns:
+        pandas.DataFrame: Columns 'position', 'role' and 'count', sorted by position.
+    """
+    rows = select(authorships, authors)
+    return rows.groupby(['position', 'role'], observed=True).size().reset_index(name='count').sort_values('position')
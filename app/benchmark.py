@@ -0,0 +1,715 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from aggregate import aggregate
+from dataset_cache import DatasetCache
+from loader import iter_records, read_abstracts
+from synthetic import make_records, make_medline, make_author_pool, WORDS
+
+"""
+Offline benchmark suite on synthetic MEDLINE corpora. Run with:
+
+    python benchmark.py --papers 1000 --authors-per-paper 8 --output results.json
+    python benchmark.py --compare results_old.json results.json
+
+Every stage of the pipeline is timed: MEDLINE parsing, storage, the Summary aggregations, the network analysis and the
+title embeddings with a tiny randomly initialized BERT model. Nothing is downloaded. Stages whose packages are not
+installed are reported as skipped. The results are written as JSON together with the git commit, so runs of different
+commits can be compared.
+"""
+
+
+@contextmanager
+def working_directory(path):
+    """
+    Changes the working directory for the enclosed block, the crawler writes relative to it.
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def timed(benchmark, stage, func, *args, repeat=1, **extra):
+    """
+    Runs a stage and returns its result and a result dict with the fastest wall time of the runs.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func(*args)
+        seconds.append(time.perf_counter() - start)
+    return value, {'benchmark': benchmark, 'stage': stage, 'seconds': min(seconds), **extra}
+
+
+def multi_pass_summary(data, author_name):
+    """
+    The statistics of the Summary tab computed the way the tab used to do it: one loop per statistic.
+    Kept as the baseline for the single pass aggregation.
+
+    Args:
+        data (list): Parsed records.
+        author_name (str): The searched author.
+
+    Returns:
+        dict: The statistics.
+    """
+    results = {}
+    authors = []
+    for i in data:
+        authors.extend(i['FAU'])
+    results['unique_authors'] = len(set(authors)) - 1
+    authors = []
+    for i in data:
+        authors.extend(i['FAU'])
+    results['top_authors'] = Counter(authors).most_common(10)
+    dates = []
+    for i in data:
+        dates.extend(i['DP'])
+    results['years'] = Counter([date.split()[0] for date in dates])
+    funders = []
+    for i in data:
+        if 'GR' in i:
+            funders.extend(i['GR'])
+    results['funders'] = Counter(funders).most_common(10)
+    affiliations = []
+    for i in data:
+        try:
+            affiliations.extend(i[f'{author_name}_AD'])
+        except KeyError:
+            pass
+    results['affiliations'] = Counter(affiliations).most_common(10)
+    results['last_author'] = Counter([i['FAU'][-1] for i in data]).most_common(1)[0][0]
+    positions = []
+    for i in data:
+        if author_name in i['FAU']:
+            for idx, author in enumerate(i['FAU']):
+                if author == author_name:
+                    positions.append(idx + 1)
+    results['positions'] = Counter(positions)
+    results['funded'] = sum(1 for i in data if 'GR' in i) / len(data) * 100
+    affiliations, authors = 0, 0
+    for i in data:
+        authors += len(i['FAU'])
+        for author in i['FAU']:
+            try:
+                affiliations += len(i[f'{author}_AD'])
+            except KeyError:
+                pass
+    results['affiliated'] = affiliations / authors * 100
+    affiliations, authors = 0, 0
+    for i in data:
+        if author_name in i['FAU']:
+            authors += 1
+            if f'{author_name}_AD' in i:
+                affiliations += 1
+    results['author_affiliated'] = affiliations / authors * 100
+    return results
+
+
+def single_pass_summary(data, author_name):
+    """
+    The same statistics as multi_pass_summary from one aggregate() call.
+    """
+    stats = aggregate(data, author_name)
+    return {
+        'unique_authors': stats.number_unique_collaborators,
+        'top_authors': stats.author_counts.most_common(10),
+        'years': stats.year_counts,
+        'funders': stats.funder_counts.most_common(10),
+        'affiliations': stats.affiliation_counts.most_common(10),
+        'last_author': stats.last_author_counts.most_common(1)[0][0],
+        'positions': Counter(stats.positions),
+        'funded': stats.percentage_funding,
+        'affiliated': stats.percentage_affiliation,
+        'author_affiliated': stats.author_percentage_affiliation,
+    }
+
+
+def best_of(func, *args, repeat=5):
+    """
+    Returns the fastest wall time in seconds of several runs.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_summary(sizes=(1000, 10000)):
+    """
+    Compares the multi pass and the single pass Summary statistics.
+
+    Args:
+        sizes (tuple): Numbers of papers to benchmark.
+
+    Returns:
+        list: One result dict per size.
+    """
+    author_name = 'Mishra, Neha'
+    results = []
+    for n in sizes:
+        data = make_records(n, author_name=author_name)
+        assert multi_pass_summary(data, author_name) == single_pass_summary(data, author_name)
+        multi = best_of(multi_pass_summary, data, author_name)
+        single = best_of(single_pass_summary, data, author_name)
+        results.append({'benchmark': 'summary', 'papers': n, 'multi_pass_s': multi, 'single_pass_s': single, 'speedup': multi / single})
+    return results
+
+
+def write_records(records, dir_name):
+    """
+    Writes records as processed paper files, like SinglePubMedSearcher.save_chunks.
+    """
+    os.makedirs(dir_name, exist_ok=True)
+    for record in records:
+        with open(os.path.join(dir_name, f"{record['PMID'][0]}.json"), 'w') as file:
+            json.dump(record, file, ensure_ascii=False, indent=4)
+
+
+def resident_mb():
+    """
+    Returns the resident memory of the process in MB, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return None
+
+
+def bench_sessions(n_sessions=10, n_papers=2000):
+    """
+    Load test of N concurrent sessions opening the same author, each loading the data and rendering the Summary statistics.
+    Compares sessions with their own copy of the records against sessions sharing the DatasetCache.
+
+    Args:
+        n_sessions (int): Number of concurrent sessions.
+        n_papers (int): Number of papers of the author.
+
+    Returns:
+        list: One result dict per mode with the memory held by the sessions and the render latencies.
+    """
+    author_name = 'Mishra, Neha'
+    tmp_dir = tempfile.mkdtemp()
+    dir_name = os.path.join(tmp_dir, 'Mishra_Neha', 'processed')
+    write_records(make_records(n_papers, author_name=author_name), dir_name)
+    cache = DatasetCache()
+
+    def isolated_session():
+        start = time.perf_counter()
+        file_names = [os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name)]
+        data = [record for chunk in iter_records(file_names) for record in chunk]
+        aggregate(data, author_name)
+        return data, time.perf_counter() - start
+
+    def shared_session():
+        start = time.perf_counter()
+        data = cache.get(dir_name).records
+        aggregate(data, author_name)
+        return data, time.perf_counter() - start
+
+    results = []
+    try:
+        for mode, session in [('isolated', isolated_session), ('shared', shared_session)]:
+            rss_before = resident_mb()
+            tracemalloc.start()
+            with ThreadPoolExecutor(max_workers=n_sessions) as executor:
+                sessions = list(executor.map(lambda _: session(), range(n_sessions)))
+            # memory still held while all sessions keep their data
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rss_after = resident_mb()
+            latencies = sorted(latency for _, latency in sessions)
+            results.append({'benchmark': 'sessions', 'mode': mode, 'sessions': n_sessions, 'papers': n_papers,
+                            'held_mb': held / 1e6, 'peak_mb': peak / 1e6,
+                            'rss_growth_mb': None if rss_before is None else rss_after - rss_before,
+                            'latency_median_s': latencies[len(latencies) // 2], 'latency_max_s': latencies[-1]})
+            del sessions
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def corpus_kwargs(args):
+    return {
+        'author_name': 'Mishra, Neha',
+        'authors_per_paper': args.authors_per_paper,
+        'abstract_words': args.abstract_words,
+        'grants_per_paper': args.grants,
+        'affiliation_density': args.affiliation_density,
+        'seed': args.seed,
+    }
+
+
+def bench_parse(args):
+    """
+    Parses a synthetic MEDLINE page with PubMedRecord and filters it for the author, like the crawler does per page.
+    """
+    from pubmed_crawler import PubMedRecord
+    kwargs = corpus_kwargs(args)
+    text, _ = make_medline(args.papers, **kwargs)
+    parsed, parse_result = timed('parse', 'PubMedRecord', PubMedRecord, text, repeat=args.repeat, papers=args.papers)
+    _, filter_result = timed('parse', 'filter_abstract_4_names', parsed.filter_abstract_4_names, kwargs['author_name'], repeat=args.repeat, papers=args.papers)
+    return [parse_result, filter_result]
+
+
+def bench_storage(args):
+    """
+    Writes the records with SinglePubMedSearcher.save_chunks, reads them with the loader and stores the columnar tables.
+    """
+    from pubmed_crawler import SinglePubMedSearcher
+    kwargs = corpus_kwargs(args)
+    records = make_records(args.papers, **kwargs)
+    tmp_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        with working_directory(tmp_dir):
+            searcher = SinglePubMedSearcher(kwargs['author_name'])
+            os.makedirs(searcher.output_dir, exist_ok=True)
+            _, result = timed('storage', 'save_chunks', searcher.save_chunks, records, papers=args.papers)
+            results.append(result)
+            file_names = [os.path.join(searcher.output_dir, file_name) for file_name in os.listdir(searcher.output_dir)]
+            _, result = timed('storage', 'iter_records', lambda: [r for chunk in iter_records(file_names) for r in chunk], repeat=args.repeat, papers=args.papers)
+            results.append(result)
+            from columnar import build_tables, save_tables, load_tables
+            tables, result = timed('storage', 'build_tables', build_tables, records, repeat=args.repeat, papers=args.papers)
+            results.append(result)
+            _, result = timed('storage', 'save_tables', save_tables, tables, searcher.table_dir, papers=args.papers)
+            results.append(result)
+            _, result = timed('storage', 'load_tables', load_tables, searcher.table_dir, repeat=args.repeat, papers=args.papers)
+            results.append(result)
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def bench_aggregations(args):
+    """
+    Computes the Summary statistics with the single pass aggregation and with the columnar group-bys, the comparison
+    of 20 authors and the authorship-position queries over their papers.
+    """
+    kwargs = corpus_kwargs(args)
+    records = make_records(args.papers, **kwargs)
+    results = []
+    _, result = timed('summary', 'aggregate', aggregate, records, kwargs['author_name'], repeat=args.repeat, papers=args.papers)
+    results.append(result)
+    from columnar import build_tables, summary_stats
+    tables = build_tables(records)
+    _, result = timed('summary', 'columnar_summary_stats', summary_stats, tables, kwargs['author_name'], repeat=args.repeat, papers=args.papers)
+    results.append(result)
+
+    # comparison of 20 authors of the same field, the papers are split between them
+    from compare import combine_tables, compare_authors
+    names = make_author_pool(20, random.Random(args.seed))
+    per_author = max(50, args.papers // len(names))
+    tables_by_author = {name: build_tables(make_records(per_author, **{**kwargs, 'author_name': name, 'seed': args.seed + i, 'pool_size': 500}))
+                        for i, name in enumerate(names)}
+    _, result = timed('summary', 'compare_20_authors', lambda: compare_authors(combine_tables(tables_by_author)), repeat=args.repeat, papers=per_author * len(names))
+    results.append(result)
+
+    # authorship-position queries over the corpus of the 20 authors, the index is appended crawl by crawl as the
+    # crawler does it, every ingest writing one more part
+    from authorship import AuthorshipIndex, role_share_by_year, team_size_by_year, senior_authors
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        def ingest_all():
+            for tables in tables_by_author.values():
+                AuthorshipIndex.ingest(tables['authorships'], tmp_dir)
+        _, result = timed('summary', 'authorship_index_ingest', ingest_all, papers=per_author * len(names))
+        index, load_result = timed('summary', 'authorship_index_load', lambda: AuthorshipIndex.load(tmp_dir), papers=per_author * len(names))
+        results += [result, {**load_result, 'authorships': len(index.authorships)}]
+    finally:
+        shutil.rmtree(tmp_dir)
+    queries = {
+        'role_share_by_year': lambda: role_share_by_year(index.authorships, names, per_author=True),
+        'team_size_by_year': lambda: team_size_by_year(index.authorships, names),
+        'senior_authors': lambda: [senior_authors(index.authorships, [name]) for name in names],
+    }
+    for stage, query in queries.items():
+        _, result = timed('summary', f'authorship_{stage}', query, repeat=args.repeat, papers=per_author * len(names), authors=len(names))
+        results.append(result)
+    return results
+
+
+def bench_network(args):
+    """
+    Builds and analyzes the co-author network like the Author Network tab, and scrubs through the yearly snapshots.
+    """
+    from network import plot_network
+    from metrics import build_graph, compute_metrics
+    records = make_records(args.papers, **corpus_kwargs(args))
+    G, result = timed('network', 'build_graph', build_graph, records, repeat=args.repeat, papers=args.papers)
+    results = [result]
+    _, result = timed('network', 'plot_network', plot_network, records, papers=args.papers, nodes=G.number_of_nodes(), edges=G.number_of_edges())
+    results.append(result)
+    _, timings = compute_metrics(G)
+    for metric, seconds in timings['Seconds'].items():
+        results.append({'benchmark': 'network', 'stage': f'metric_{metric}', 'seconds': seconds, 'papers': args.papers})
+
+    # scrubbing through all years: incremental snapshots against rebuilding the graph of every year
+    from temporal import TemporalNetwork, paper_year
+    network, result = timed('network', 'temporal_index', TemporalNetwork, records, papers=args.papers)
+    results.append(result)
+
+    def scrub():
+        # like the tab: move to every year and read the snapshot in place
+        for year in network.years:
+            with network.view(year) as G:
+                G.number_of_edges()
+    _, result = timed('network', 'temporal_scrub_incremental', scrub, repeat=args.repeat, papers=args.papers, years=len(network.years))
+    results.append(result)
+    rebuild = lambda: [build_graph([record for record in records if (paper_year(record) or 0) <= year]) for year in network.years]
+    _, result = timed('network', 'temporal_scrub_rebuild', rebuild, repeat=args.repeat, papers=args.papers, years=len(network.years))
+    results.append(result)
+    return results
+
+
+def tiny_model(tmp_dir):
+    """
+    Creates a tiny, randomly initialized BERT model and a tokenizer for the synthetic vocabulary, without any download.
+    The embeddings are meaningless, but the computation is the same as with BioBERT, only smaller.
+    """
+    from transformers import BertConfig, BertModel, BertTokenizer
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '.'] + WORDS
+    vocab_file = os.path.join(tmp_dir, 'vocab.txt')
+    with open(vocab_file, 'w') as file:
+        file.write('\n'.join(vocab) + '\n')
+    tokenizer = BertTokenizer(vocab_file)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2, intermediate_size=128)
+    return tokenizer, BertModel(config).eval()
+
+
+def bench_embeddings(args):
+    """
+    Embeds the titles with get_embeddings and reduces them with PCA like the Title Embeddings tab, and times the fast
+    mode (TF-IDF and hashing vectors of titles and abstracts with a truncated SVD).
+    """
+    from embedd import get_embeddings, get_abstracts_pmid, get_documents, get_sparse_embeddings
+    from sklearn.decomposition import PCA
+    records = make_records(args.papers, **corpus_kwargs(args))
+    titles, _ = get_abstracts_pmid(records, 'https://pubmed.ncbi.nlm.nih.gov/')
+    documents = get_documents(records)
+    # the app loads the records without abstracts, the fast map has to get them from read_abstracts
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        write_records(records, tmp_dir)
+        loaded = [record for chunk in iter_records([os.path.join(tmp_dir, name) for name in os.listdir(tmp_dir)]) for record in chunk]
+        assert sorted(get_documents(loaded, read_abstracts(tmp_dir))) == sorted(documents), 'the fast embeddings lost the abstracts'
+    finally:
+        shutil.rmtree(tmp_dir)
+    results = []
+    for method in ['tfidf', 'hashing']:
+        _, result = timed('embeddings', f'sparse_{method}', get_sparse_embeddings, documents, method, repeat=args.repeat, papers=args.papers)
+        results.append(result)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tokenizer, model = tiny_model(tmp_dir)
+        embeddings, result = timed('embeddings', 'get_embeddings', get_embeddings, titles, tokenizer, model, papers=args.papers)
+        _, pca_result = timed('embeddings', 'pca', PCA(n_components=2).fit_transform, embeddings, repeat=args.repeat, papers=args.papers)
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results + [result, pca_result]
+
+
+def bench_crawl(args):
+    """
+    Crawls an author from the local PubMed stand-in with latency, errors and a rate limit, once with every fetch backend,
+    and reports wall time, requests and retries per backend, and the throughput and queue depths of the crawl pipeline.
+    """
+    from pubmed_crawler import SinglePubMedSearcher
+    results = []
+    from stub_server import StubConfig, start_in_background
+    for backend in ['web', 'eutils']:
+        server = start_in_background(StubConfig(papers=args.papers, latency=0.05, jitter=0.02, error_rate=0.05, rate_limit=3, seed=args.seed))
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with working_directory(tmp_dir):
+                searcher = SinglePubMedSearcher('Mishra, Neha', base_url=server.base_url, delay=(0, 0), backend=backend, eutils_url=server.base_url)
+                output_dir, result = timed('crawl', f'search_author_{backend}', searcher.search_author, papers=args.papers)
+                result.update({'saved_papers': len(os.listdir(output_dir)), **server.state.stats})
+                # throughput of the pipeline stages and how full the queues between them got
+                report = searcher.pipeline_report
+                for stage, stats in report['stages'].items():
+                    result[f'{stage}_busy_s'] = stats['busy_s']
+                    result[f'{stage}_items_per_s'] = stats['items_per_s']
+                for name, stats in report['queues'].items():
+                    result[f'{name}_queue_max_depth'] = stats['max_depth']
+        finally:
+            server.shutdown()
+            shutil.rmtree(tmp_dir)
+        results.append(result)
+    return results
+
+
+def load_test(url, n_requests, concurrency, headers=None):
+    """
+    Sends n_requests GET requests with concurrency parallel clients and measures throughput and latency.
+
+    Returns:
+        dict: Requests per second, median and 95th percentile latency in seconds and the number of responses per status.
+    """
+    import urllib.request
+    import urllib.error
+
+    def fetch(_):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(fetch, range(n_requests)))
+    seconds = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in responses)
+    return {
+        'requests_per_s': n_requests / seconds,
+        'p50_s': latencies[len(latencies) // 2],
+        'p95_s': latencies[int(len(latencies) * 0.95)],
+        **{f'status_{status}': count for status, count in Counter(status for _, status in responses).items()},
+    }
+
+
+def bench_api(args):
+    """
+    Serves a synthetic author with the headless API and measures it with a local load generator: the first (computed)
+    request, cached responses and conditional requests answered with 304.
+    """
+    import socket
+    import urllib.request
+    from urllib.parse import quote
+    import uvicorn
+    records = make_records(args.papers, **corpus_kwargs(args))
+    tmp_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        with working_directory(tmp_dir):
+            write_records(records, os.path.join('results', 'Mishra_Neha', 'processed'))
+            import api
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+            server = uvicorn.Server(uvicorn.Config(api.app, host='127.0.0.1', port=port, log_level='warning'))
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                time.sleep(0.05)
+            try:
+                for endpoint in ['summary', 'network', 'embeddings']:
+                    url = f'http://127.0.0.1:{port}/authors/{quote("Mishra, Neha")}/{endpoint}'
+                    start = time.perf_counter()
+                    with urllib.request.urlopen(url) as response:
+                        etag = response.headers['ETag']
+                        response.read()
+                    results.append({'benchmark': 'api', 'stage': f'{endpoint}_first', 'seconds': time.perf_counter() - start, 'papers': args.papers})
+                    for stage, headers in [('cached', None), ('conditional', {'If-None-Match': etag})]:
+                        report = load_test(url, 200, 16, headers)
+                        results.append({'benchmark': 'api', 'stage': f'{endpoint}_{stage}', 'seconds': report['p50_s'], 'papers': args.papers, **report})
+            finally:
+                server.should_exit = True
+                thread.join()
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def _import_error(stderr):
+    """
+    Turns the error output of a failed subprocess into an ImportError naming the missing module.
+    """
+    message = stderr.strip().splitlines()[-1]
+    name = message.split("'")[1] if 'No module named' in message else message
+    return ImportError(message, name=name)
+
+
+def import_profile(statement):
+    """
+    Runs a statement in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: (wall seconds of the interpreter, list of (cumulative microseconds, module) sorted by cumulative time)
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise _import_error(process.stderr)
+    modules = []
+    for line in process.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, module = line[len('import time:'):].split('|')
+            modules.append((int(cumulative), module.rstrip()))
+    return seconds, sorted(modules, reverse=True)
+
+
+def bench_startup(args):
+    """
+    Measures the import time of the app start and of every tab in a fresh interpreter (-X importtime), and the time to
+    the first render of app.py with the Streamlit test runner.
+    """
+    results = []
+    statements = {
+        'app_start': 'import streamlit, pubmed_crawler, dataset_cache, export, aggregate, instrument',
+        'tab_summary': 'import summary',
+        'tab_network': 'import network',
+        'tab_embeddings': 'import embedd',
+        'embeddings_first_use': 'import torch, transformers, sklearn.decomposition',
+    }
+    for stage, statement in statements.items():
+        seconds, modules = import_profile(statement)
+        # top level modules only, the heaviest ten
+        top = [{'module': module.strip(), 'cumulative_ms': cumulative / 1000} for cumulative, module in modules if not module.startswith('  ')][:10]
+        results.append({'benchmark': 'startup', 'stage': stage, 'seconds': seconds, 'heaviest_imports': top})
+
+    # time to first render of the About page in a fresh interpreter
+    script = 'import time; s = time.perf_counter(); from streamlit.testing.v1 import AppTest; AppTest.from_file("app.py", default_timeout=120).run(); print(time.perf_counter() - s)'
+    process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if process.returncode != 0:
+        raise _import_error(process.stderr)
+    results.append({'benchmark': 'startup', 'stage': 'time_to_first_render', 'seconds': float(process.stdout.strip().splitlines()[-1])})
+    return results
+
+
+def bench_records(args):
+    """
+    Memory of the records as dicts of lists (as loaded from JSON) against the compact Paper model, per 10k records,
+    and the Summary aggregation on the LegacyRecord adapter.
+    """
+    from record import Paper, to_legacy
+    kwargs = corpus_kwargs(args)
+    # round trip through JSON, so the dicts do not share strings with the generator
+    records_json = json.dumps(make_records(args.papers, **kwargs))
+    results = []
+    for stage, build in [('dict_records', lambda: json.loads(records_json)),
+                         ('paper_records', lambda: [Paper.from_dict(record) for record in json.loads(records_json)])]:
+        tracemalloc.start()
+        records = build()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append({'benchmark': 'records', 'stage': stage, 'papers': args.papers, 'mb_per_10k': held / 1e6 * 10000 / args.papers})
+        if stage == 'dict_records':
+            dict_records = records
+        else:
+            legacy = to_legacy(records)
+    assert single_pass_summary(dict_records, kwargs['author_name']) == single_pass_summary(legacy, kwargs['author_name'])
+    _, result = timed('records', 'aggregate_dict', aggregate, dict_records, kwargs['author_name'], repeat=args.repeat, papers=args.papers)
+    results.append(result)
+    _, result = timed('records', 'aggregate_legacy_view', aggregate, legacy, kwargs['author_name'], repeat=args.repeat, papers=args.papers)
+    results.append(result)
+    return results
+
+
+BENCHMARKS = {
+    'records': bench_records,
+    'startup': bench_startup,
+    'crawl': bench_crawl,
+    'parse': bench_parse,
+    'storage': bench_storage,
+    'aggregations': bench_aggregations,
+    'network': bench_network,
+    'embeddings': bench_embeddings,
+    'api': bench_api,
+    # always at 1k and 10k papers as in the original comparison, --papers is added as a third size
+    'summary_passes': lambda args: bench_summary(sizes=tuple(sorted({1000, 10000, args.papers}))),
+    'sessions': lambda args: bench_sessions(n_papers=args.papers),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Runs the selected benchmarks and returns the report.
+    """
+    results = []
+    for name in args.only or list(BENCHMARKS):
+        try:
+            stage_results = BENCHMARKS[name](args)
+        except ImportError as error:
+            stage_results = [{'benchmark': name, 'skipped': f'missing package: {error.name}'}]
+        for result in stage_results:
+            print(json.dumps(result))
+        results.extend(stage_results)
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+
+
+def _result_key(result):
+    return tuple(sorted((key, value) for key, value in result.items() if not isinstance(value, float)))
+
+
+def compare(old_path, new_path):
+    """
+    Prints the time ratio new/old of every stage found in both reports.
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    old_results = {_result_key(result): result for result in old['results'] if 'skipped' not in result}
+    print(f"{'stage':<60} {'old':>10} {'new':>10} {'new/old':>8}")
+    for result in new['results']:
+        key = _result_key(result)
+        if key not in old_results:
+            continue
+        for field, value in result.items():
+            if isinstance(value, float) and isinstance(old_results[key].get(field), float) and old_results[key][field] > 0:
+                label = '/'.join(str(value) for name, value in key if name in ('benchmark', 'stage', 'mode', 'papers')) + f' {field}'
+                print(f'{label:<60} {old_results[key][field]:>10.4f} {value:>10.4f} {value / old_results[key][field]:>8.2f}')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Offline benchmarks on synthetic MEDLINE corpora.')
+    parser.add_argument('--papers', type=int, default=1000, help='Number of papers of the synthetic author.')
+    parser.add_argument('--authors-per-paper', type=int, default=8, help='Average number of authors per paper.')
+    parser.add_argument('--abstract-words', type=int, default=200, help='Number of words per abstract.')
+    parser.add_argument('--grants', type=int, default=2, help='Maximum number of grants per paper.')
+    parser.add_argument('--affiliation-density', type=float, default=0.7, help='Probability that an authorship has an affiliation.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic corpus.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, the fastest run is reported.')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Run only these benchmarks.')
+    parser.add_argument('--output', default='benchmark_results.json', help='Path of the JSON report.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two JSON reports instead of running.')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = run(args)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
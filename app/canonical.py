@@ -0,0 +1,273 @@
+import re
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from names import strip_accents
+
+"""
+Canonicalization of affiliations and funders.
+
+The same institution appears in many spellings: with different departments, street addresses, postcodes and e-mail
+addresses, abbreviated ('Univ.') or reordered ('Heidelberg University'). Grants carry the funding agency between a grant
+number and a country. Every raw string is first reduced to its institution or agency part. The reduced strings are then
+grouped with character n-gram TF-IDF vectors and cosine similarity. To avoid comparing every pair, strings are only
+compared when they share an informative word (blocking), and the similarities of all candidate pairs are computed with one
+sparse product. Every distinct raw string is resolved once, later lookups are dictionary hits.
+
+Nothing is refitted for a new batch of strings: the blocks are extended with the new keys only, the n-grams are hashed
+(no vocabulary to fit), and the document frequencies of the n-grams are counted as keys are added. The IDF weights are
+applied only to the keys of the candidate pairs of the batch.
+"""
+
+_EMAIL = re.compile(r'\S+@\S+|electronic address:?', re.IGNORECASE)
+_DIGITS = re.compile(r'\b[\w-]*\d[\w-]*\b')
+_NON_WORD = re.compile(r'[^\w\s]')
+_SPACES = re.compile(r'\s+')
+# Words marking the organization in a comma separated affiliation, with their priority
+_ORGANIZATION = [(re.compile(r'universi|univ\b|universit', re.IGNORECASE), 3),
+                 (re.compile(r'hospital|clinic|medical school|college|school of medicine|institut|foundation|academy|'
+                             r'council|centre|center|inc\b|ltd\b|gmbh|laborator', re.IGNORECASE), 2)]
+_DEPARTMENT = re.compile(r'^\s*(department|dept|division|unit|section|faculty|program|group|laboratory of|lab of)\b', re.IGNORECASE)
+# Words which are too common to block on
+_STOP_WORDS = frozenset(['of', 'and', 'the', 'for', 'de', 'der', 'und', 'di', 'la', 'du', 'university', 'univ', 'institute',
+                         'hospital', 'center', 'centre', 'school', 'college', 'medical', 'national', 'research', 'health'])
+# Number of hashed character n-gram features
+_N_FEATURES = 2 ** 18
+
+
+def organization(affiliation):
+    """
+    Returns the organization part of an affiliation, e.g. 'Harvard Medical School' of
+    'Department of Medicine, Harvard Medical School, Boston, MA 02115, USA. jdoe@hms.harvard.edu'.
+    """
+    text = _EMAIL.sub(' ', affiliation)
+    segments = [segment.strip(' .') for segment in re.split(r'[,;]', text) if segment.strip(' .')]
+    if not segments:
+        return affiliation.strip()
+    best, best_score = segments[0], -1
+    for segment in segments:
+        score = max([priority for pattern, priority in _ORGANIZATION if pattern.search(segment)], default=0)
+        if _DEPARTMENT.search(segment):
+            score -= 2
+        if score > best_score:
+            best, best_score = segment, score
+    return best
+
+
+def agency(grant):
+    """
+    Returns the funding agency of a grant, e.g. 'NCI NIH HHS' of 'R01 CA123456/CA/NCI NIH HHS/United States'.
+    Grants are written as number/[institute code/]agency[/country], the longest part between number and country is taken.
+    """
+    parts = [part.strip() for part in grant.split('/') if part.strip()]
+    if len(parts) >= 3:
+        parts = parts[1:-1]
+    elif len(parts) == 2:
+        parts = parts[1:]
+    return max(parts, key=len) if parts else grant.strip()
+
+
+def normalize(text):
+    """
+    Lower case text without diacritics, punctuation and numbers (postcodes, street numbers), used for the comparison.
+    """
+    text = strip_accents(text).lower()
+    text = _DIGITS.sub(' ', _NON_WORD.sub(' ', text))
+    return _SPACES.sub(' ', text).strip()
+
+
+class Canonicalizer:
+    """
+    Resolves raw affiliation or grant strings to canonical ids and labels.
+
+    Attributes:
+        kind (str): 'affiliation' or 'funder', selects how the organization part of a raw string is extracted.
+        threshold (float): Minimum cosine similarity of the character 3-gram TF-IDF vectors to merge two strings.
+        max_block (int): Blocks (strings sharing a word) larger than this are not used for candidate pairs, if the string
+            has a more specific word.
+        ids (dict): Raw string -> canonical id, the cache of resolved strings.
+        labels (list): Display label of every canonical id.
+
+    Methods:
+        resolve(strings):
+            Returns the canonical id of every string. Only unseen strings are compared.
+
+        canonical_counts(counts):
+            Merges a Counter of raw strings into a Counter of canonical labels.
+
+        version:
+            Number of resolved strings, changes when labels may have changed.
+    """
+
+    def __init__(self, kind='affiliation', threshold=0.75, max_block=200):
+        if kind not in ('affiliation', 'funder'):
+            raise ValueError(f'Unknown kind {kind!r}, expected "affiliation" or "funder".')
+        self.kind = kind
+        self.threshold = threshold
+        self.max_block = max_block
+        self.ids = {}
+        self.labels = []
+        self._keys = []  # normalized organization of every known key, in order of key index
+        self._key_index = {}  # normalized organization -> key index
+        self._key_ids = []  # canonical id of every key
+        self._label_counts = []  # canonical id -> Counter of display spellings
+        self._blocks = defaultdict(list)  # informative word -> key indices
+        self._vectors = None  # sublinear n-gram counts of every key, sparse matrix in order of key index
+        self._document_frequency = np.zeros(_N_FEATURES, dtype=np.int64)  # n-gram -> number of keys containing it
+        self._lock = threading.Lock()
+
+    def _extract(self, raw):
+        return organization(raw) if self.kind == 'affiliation' else agency(raw)
+
+    def resolve(self, strings):
+        """
+        Returns the canonical ids of raw strings. Strings which were resolved before are looked up in the cache, all new
+        strings are resolved together in one batch.
+
+        Args:
+            strings (iterable): Raw affiliations or grants.
+
+        Returns:
+            list: Canonical id of every string.
+        """
+        strings = list(strings)
+        with self._lock:
+            new = [raw for raw in dict.fromkeys(strings) if raw not in self.ids]
+            if new:
+                self._resolve_new(new)
+            return [self.ids[raw] for raw in strings]
+
+    @property
+    def version(self):
+        """
+        Number of resolved strings. It grows whenever new strings are linked, which can change labels and merged counts.
+        """
+        return len(self.ids)
+
+    def label(self, canonical_id):
+        return self.labels[canonical_id]
+
+    def canonical_counts(self, counts):
+        """
+        Merges the counts of spelling variants.
+
+        Args:
+            counts (Counter): Raw string -> count.
+
+        Returns:
+            Counter: Canonical label -> summed count.
+        """
+        raws = list(counts)
+        merged = Counter()
+        for raw, canonical_id in zip(raws, self.resolve(raws)):
+            merged[self.labels[canonical_id]] += counts[raw]
+        return merged
+
+    def _resolve_new(self, raws):
+        # reduce to the organization part, exact matches of the normalized text share a key
+        displays = [self._extract(raw) for raw in raws]
+        new_keys = []
+        for display in displays:
+            key = normalize(display)
+            if key not in self._key_index:
+                self._key_index[key] = len(self._keys)
+                self._keys.append(key)
+                self._key_ids.append(None)
+                new_keys.append(self._key_index[key])
+        if new_keys:
+            self._link(new_keys)
+        for raw, display in zip(raws, displays):
+            canonical_id = self._key_ids[self._key_index[normalize(display)]]
+            self.ids[raw] = canonical_id
+            self._label_counts[canonical_id][display] += 1
+            self.labels[canonical_id] = self._label_counts[canonical_id].most_common(1)[0][0]
+
+    def _add_keys(self, new_keys):
+        """
+        Adds new keys to the blocks and their hashed n-gram counts to the vectors.
+        """
+        from scipy import sparse
+        from sklearn.feature_extraction.text import HashingVectorizer
+        for index in new_keys:
+            for token in set(self._keys[index].split()) - _STOP_WORDS:
+                if len(token) > 1:
+                    self._blocks[token].append(index)
+        counts = HashingVectorizer(analyzer='char_wb', ngram_range=(3, 3), n_features=_N_FEATURES, alternate_sign=False,
+                                   norm=None).transform([self._keys[index] for index in new_keys])
+        counts.data = 1 + np.log(counts.data)  # sublinear term frequency
+        np.add.at(self._document_frequency, counts.indices, 1)
+        self._vectors = counts if self._vectors is None else sparse.vstack([self._vectors, counts], format='csr')
+
+    def _tfidf(self, indices):
+        """
+        L2 normalized TF-IDF vectors of the keys with the given indices, with the smoothed IDF of all keys so far.
+        """
+        from sklearn.preprocessing import normalize as l2_normalize
+        vectors = self._vectors[indices]
+        vectors.data = vectors.data * (np.log((1 + len(self._keys)) / (1 + self._document_frequency[vectors.indices])) + 1)
+        return l2_normalize(vectors)
+
+    def _candidate_pairs(self, new_keys):
+        """
+        Pairs of key indices which share an informative word, each pair containing at least one new key.
+        """
+        blocks = self._blocks
+        pairs = set()
+        for index in new_keys:
+            tokens = [token for token in set(self._keys[index].split()) - _STOP_WORDS if token in blocks]
+            usable = [token for token in tokens if len(blocks[token]) <= self.max_block]
+            if not usable and tokens:
+                usable = [min(tokens, key=lambda token: len(blocks[token]))]  # only common words, use the rarest
+            for token in usable:
+                for other in blocks[token][:self.max_block]:
+                    if other != index:
+                        pairs.add((min(index, other), max(index, other)))
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    def _link(self, new_keys):
+        """
+        Assigns canonical ids to new keys: greedy single linkage over the candidate pairs, strongest pairs first. Keys
+        which were resolved before keep their id and two existing ids are never merged, so ids stay stable.
+        """
+        self._add_keys(new_keys)
+        pairs = self._candidate_pairs(new_keys)
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        # canonical id of a component, None for components of new keys only
+        component_id = {}
+        if len(pairs):
+            # only the keys of the candidate pairs are weighted, rows are looked up by their position in indices
+            indices = np.unique(pairs)
+            vectors = self._tfidf(indices)
+            rows = np.searchsorted(indices, pairs)
+            # cosine similarity of every candidate pair in one sparse product (rows are L2 normalized)
+            similarity = np.asarray(vectors[rows[:, 0]].multiply(vectors[rows[:, 1]]).sum(axis=1)).ravel()
+            order = np.argsort(-similarity)
+            for (a, b), value in zip(pairs[order], similarity[order]):
+                if value < self.threshold:
+                    break
+                root_a, root_b = find(a), find(b)
+                if root_a == root_b:
+                    continue
+                id_a = component_id.get(root_a, self._key_ids[a] if root_a == a else None)
+                id_b = component_id.get(root_b, self._key_ids[b] if root_b == b else None)
+                if id_a is not None and id_b is not None and id_a != id_b:
+                    continue
+                parent[root_a] = root_b
+                component_id[root_b] = id_a if id_a is not None else id_b
+        for index in new_keys:
+            root = find(index)
+            canonical_id = component_id.get(root, self._key_ids[root])
+            if canonical_id is None:
+                canonical_id = len(self.labels)
+                self.labels.append('')
+                self._label_counts.append(Counter())
+                component_id[root] = canonical_id
+            self._key_ids[index] = canonical_id
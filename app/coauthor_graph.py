@@ -0,0 +1,266 @@
+import os
+import json
+from collections import deque
+import numpy as np
+from scipy import sparse
+
+"""
+Global co-authorship graph over every paper in the local results directory.
+
+The graph is stored on disk as a weighted edge table (src, dst, weight with src < dst) plus the list of author names,
+so it can be loaded without parsing any paper JSON. Everything is in one file which is replaced at once, so a reader never
+sees the edges of one version with the author list of another. New papers are merged into the edge table when they are
+ingested. The graph also records the crawled author directories it contains, so authors whose ingest did not reach the
+graph (e.g. the update failed after the crawl was stored) are merged when the graph is loaded.
+For queries the edge table is turned into a symmetric CSR matrix, on which ego networks and shortest collaboration
+paths are simple breadth first searches.
+"""
+
+
+class CoauthorGraph:
+    """
+    Incrementally maintained co-authorship graph of the whole local corpus.
+
+    Attributes:
+        graph_dir (str): Directory containing the stored graph.
+        authors (list): Author names, the position in the list is the author id.
+        author_ids (dict): Author name -> author id.
+        pmids (set): PMIDs of all papers already merged into the graph.
+        ingested (set): Directory names of the crawled authors merged into the graph.
+        src, dst, weight (np.ndarray): Edge table, one row per author pair, weight is the number of shared papers.
+
+    Methods:
+        load(results_dir):
+            Loads the stored graph, building it from all processed papers if it does not exist yet.
+
+        add_papers(records, dir_name):
+            Merges new papers into the edge table and stores it.
+
+        ego_network(author, radius):
+            Returns the authors and weighted edges within radius steps of an author.
+
+        shortest_path(author_a, author_b):
+            Returns the shortest chain of co-authors connecting two authors.
+    """
+
+    def __init__(self, graph_dir='results/_graph'):
+        self.graph_dir = graph_dir
+        self.authors = []
+        self.author_ids = {}
+        self.pmids = set()
+        self.ingested = set()
+        self.src = np.zeros(0, dtype=np.int64)
+        self.dst = np.zeros(0, dtype=np.int64)
+        self.weight = np.zeros(0, dtype=np.int64)
+        self._csr = None
+
+    @classmethod
+    def load(cls, results_dir='results'):
+        """
+        Loads the global graph from disk. If no graph has been stored yet, it is built once from all processed papers.
+        Crawled authors which are missing in the stored graph are merged in memory; they are stored with the next
+        add_papers.
+
+        Args:
+            results_dir (str): Directory containing the crawled authors.
+
+        Returns:
+            CoauthorGraph: The loaded graph.
+        """
+        graph = cls(os.path.join(results_dir, '_graph'))
+        path = graph_path(results_dir)
+        if not os.path.exists(path):
+            graph.add_papers(iter_processed_papers(results_dir), crawled_authors(results_dir))
+            return graph
+        with np.load(path) as stored:
+            graph.authors = stored['authors'].tolist()
+            graph.pmids = set(stored['pmids'].tolist())
+            graph.ingested = set(stored['ingested'].tolist())
+            graph.src, graph.dst, graph.weight = stored['src'], stored['dst'], stored['weight']
+        graph.author_ids = {name: i for i, name in enumerate(graph.authors)}
+        missing = [dir_name for dir_name in crawled_authors(results_dir) if dir_name not in graph.ingested]
+        if missing:
+            graph._merge(iter_processed_papers(results_dir, missing), missing)
+        return graph
+
+    def _author_id(self, name):
+        if name not in self.author_ids:
+            self.author_ids[name] = len(self.authors)
+            self.authors.append(name)
+        return self.author_ids[name]
+
+    def add_papers(self, records, dir_names=()):
+        """
+        Merges papers into the graph and stores it. Papers which were merged before are skipped, so ingesting the same
+        paper twice does not change the weights.
+
+        Args:
+            records (iterable): Parsed PubMed records containing 'PMID' and 'FAU'.
+            dir_names (list): Directory names of the crawled authors the papers belong to.
+        """
+        changed = self._merge(records, dir_names)
+        if changed or not os.path.exists(os.path.join(self.graph_dir, 'graph.npz')):
+            self.save()
+
+    def _merge(self, records, dir_names=()):
+        """
+        Merges papers into the edge table in memory. Returns whether the graph changed.
+        """
+        changed = not self.ingested.issuperset(dir_names)
+        self.ingested.update(dir_names)
+        new_src, new_dst = [], []
+        for record in records:
+            pmid = record.get('PMID', [None])[0]
+            if pmid is None or pmid in self.pmids:
+                continue
+            self.pmids.add(pmid)
+            changed = True
+            ids = sorted({self._author_id(name) for name in record.get('FAU', [])})
+            for i in range(len(ids)):
+                for j in range(i + 1, len(ids)):
+                    new_src.append(ids[i])
+                    new_dst.append(ids[j])
+        if not changed:
+            return False
+
+        # Merge the new pairs into the edge table by summing the weights of identical pairs
+        n = max(len(self.authors), 1)
+        keys = np.concatenate([self.src * n + self.dst, np.asarray(new_src, dtype=np.int64) * n + np.asarray(new_dst, dtype=np.int64)])
+        weights = np.concatenate([self.weight, np.ones(len(new_src), dtype=np.int64)])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        self.src, self.dst = unique_keys // n, unique_keys % n
+        self.weight = np.bincount(inverse, weights=weights, minlength=len(unique_keys)).astype(np.int64)
+        self._csr = None
+        return True
+
+    def save(self):
+        """
+        Stores the graph in one file. It is written to a temporary name first and then replaced, so a reader never
+        sees a partially written graph or the edges of one version with the authors of another.
+        """
+        os.makedirs(self.graph_dir, exist_ok=True)
+        path = os.path.join(self.graph_dir, 'graph.npz')
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, src=self.src, dst=self.dst, weight=self.weight, authors=np.array(self.authors, dtype=str),
+                     pmids=np.array(sorted(self.pmids), dtype=str), ingested=np.array(sorted(self.ingested), dtype=str))
+        os.replace(path + '.tmp', path)
+
+    def csr(self):
+        """
+        Returns the symmetric CSR adjacency matrix, weighted by the number of shared papers.
+
+        Returns:
+            scipy.sparse.csr_matrix: Adjacency matrix indexed by author id.
+        """
+        if self._csr is None:
+            n = len(self.authors)
+            rows = np.concatenate([self.src, self.dst])
+            cols = np.concatenate([self.dst, self.src])
+            data = np.concatenate([self.weight, self.weight])
+            self._csr = sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+        return self._csr
+
+    def ego_network(self, author, radius=1):
+        """
+        Extracts the ego network of an author.
+
+        Args:
+            author (str): Author name as it appears in 'FAU'.
+            radius (int): Maximum number of co-author steps from the author.
+
+        Returns:
+            tuple: (authors, edges) where authors is a list of names and edges is a list of
+                   (author, author, number of shared papers) between authors of the ego network.
+        """
+        if author not in self.author_ids:
+            return [], []
+        A = self.csr()
+        ids = {self.author_ids[author]}
+        frontier = list(ids)
+        for _ in range(radius):
+            frontier = [int(j) for i in frontier for j in A.indices[A.indptr[i]:A.indptr[i + 1]] if j not in ids]
+            ids.update(frontier)
+        ids = np.array(sorted(ids))
+        sub = sparse.triu(A[ids][:, ids], k=1).tocoo()
+        edges = [(self.authors[ids[i]], self.authors[ids[j]], int(w)) for i, j, w in zip(sub.row, sub.col, sub.data)]
+        return [self.authors[i] for i in ids], edges
+
+    def shortest_path(self, author_a, author_b):
+        """
+        Finds the shortest chain of co-authors connecting two authors with a bidirectional breadth first search.
+
+        Args:
+            author_a (str): First author name.
+            author_b (str): Second author name.
+
+        Returns:
+            list: Author names from author_a to author_b, or an empty list if they are not connected.
+        """
+        if author_a not in self.author_ids or author_b not in self.author_ids:
+            return []
+        A = self.csr()
+        start, goal = self.author_ids[author_a], self.author_ids[author_b]
+        if start == goal:
+            return [author_a]
+        parents = [{start: None}, {goal: None}]
+        queues = [deque([start]), deque([goal])]
+        while queues[0] and queues[1]:
+            # Always expand the smaller frontier
+            side = 0 if len(queues[0]) <= len(queues[1]) else 1
+            for _ in range(len(queues[side])):
+                node = queues[side].popleft()
+                for neighbour in A.indices[A.indptr[node]:A.indptr[node + 1]].tolist():
+                    if neighbour in parents[side]:
+                        continue
+                    parents[side][neighbour] = node
+                    if neighbour in parents[1 - side]:
+                        return self._join_path(parents, neighbour)
+                    queues[side].append(neighbour)
+        return []
+
+    def _join_path(self, parents, meeting):
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = parents[0][node]
+        path.reverse()
+        node = parents[1][meeting]
+        while node is not None:
+            path.append(node)
+            node = parents[1][node]
+        return [self.authors[i] for i in path]
+
+
+def graph_path(results_dir='results'):
+    """
+    Returns the path of the stored global graph. Its modification time changes with every ingest.
+    """
+    return os.path.join(results_dir, '_graph', 'graph.npz')
+
+
+def crawled_authors(results_dir='results'):
+    """
+    Returns the directory names of the crawled authors in the results directory.
+    """
+    if not os.path.isdir(results_dir):
+        return []
+    return [dir_name for dir_name in sorted(os.listdir(results_dir)) if os.path.isdir(os.path.join(results_dir, dir_name, 'processed'))]
+
+
+def iter_processed_papers(results_dir='results', dir_names=None):
+    """
+    Yields every processed paper of every crawled author in the results directory.
+
+    Args:
+        results_dir (str): Directory containing the crawled authors.
+        dir_names (list): Directory names of the authors to read, all crawled authors by default.
+
+    Yields:
+        dict: A parsed PubMed record.
+    """
+    for author_dir in (crawled_authors(results_dir) if dir_names is None else dir_names):
+        processed = os.path.join(results_dir, author_dir, 'processed')
+        for file_name in sorted(os.listdir(processed)):
+            with open(os.path.join(processed, file_name), 'r') as file:
+                yield json.load(file)
@@ -0,0 +1,316 @@
+import os
+from collections import Counter, defaultdict
+import numpy as np
+import pandas as pd
+from aggregate import SummaryStats
+
+"""
+Columnar representation of the parsed PubMed records.
+
+The records are dicts of lists with one dynamically named '<author>_AD' key per author. For analytics they are
+normalized into flat tables, stored as Parquet next to the processed JSON files:
+
+    papers:             pmid, title, date, year, n_authors, journal, journal_abbreviation, language
+    authorships:        pmid, author, position, n_authors, role ('first', 'middle', 'last', 'single'), year
+    affiliations:       pmid, author, affiliation
+    grants:             pmid, grant
+    mesh:               pmid, term (MeSH heading, 'MH')
+    keywords:           pmid, keyword ('OT')
+    publication_types:  pmid, publication_type ('PT')
+
+Repeated strings (authors, affiliations, grants) are stored as categoricals, so every distinct string is kept only once
+in memory. The Summary statistics are then computed as group-bys over these tables instead of Python loops.
+Filters like "only reviews since 2015" are answered from an inverted index (value -> set of PMIDs) built from the tables.
+"""
+
+TABLES = ['papers', 'authorships', 'affiliations', 'grants', 'mesh', 'keywords', 'publication_types']
+
+# Role of an authorship in the author list, 'single' for papers with one author
+ROLES = ['first', 'middle', 'last', 'single']
+
+# Multi valued MEDLINE tags stored in their own table: tag -> (table, column)
+LIST_FIELDS = {'MH': ('mesh', 'term'), 'OT': ('keywords', 'keyword'), 'PT': ('publication_types', 'publication_type')}
+
+
+def build_tables(records):
+    """
+    Normalizes parsed records into the columnar tables.
+
+    Args:
+        records (list): Parsed PubMed records (dicts of lists).
+
+    Returns:
+        dict: Table name -> pandas DataFrame.
+    """
+    papers = {'pmid': [], 'title': [], 'date': [], 'year': [], 'n_authors': [], 'journal': [], 'journal_abbreviation': [], 'language': []}
+    authorships = {'pmid': [], 'author': [], 'position': [], 'n_authors': [], 'year': []}
+    affiliations = {'pmid': [], 'author': [], 'affiliation': []}
+    grants = {'pmid': [], 'grant': []}
+    lists = {table: {'pmid': [], column: []} for table, column in LIST_FIELDS.values()}
+    for record in records:
+        pmid = record['PMID'][0]
+        authors = record.get('FAU', [])
+        date = record.get('DP', [''])[0]
+        papers['pmid'].append(pmid)
+        papers['title'].append(record.get('TI', [''])[0])
+        papers['date'].append(date)
+        year = date.split()[0] if date else ''
+        papers['year'].append(year)
+        papers['n_authors'].append(len(authors))
+        papers['journal'].append(record.get('JT', [''])[0])
+        papers['journal_abbreviation'].append(record.get('TA', [''])[0])
+        papers['language'].append(record.get('LA', [''])[0])
+        for position, author in enumerate(authors, start=1):
+            authorships['pmid'].append(pmid)
+            authorships['author'].append(author)
+            authorships['position'].append(position)
+            authorships['n_authors'].append(len(authors))
+            authorships['year'].append(year)
+        # affiliations are stored per author name, so an author listed twice still has one set of affiliations
+        for author in dict.fromkeys(authors):
+            for affiliation in record.get(f'{author}_AD', []):
+                affiliations['pmid'].append(pmid)
+                affiliations['author'].append(author)
+                affiliations['affiliation'].append(affiliation)
+        for grant in record.get('GR', []):
+            grants['pmid'].append(pmid)
+            grants['grant'].append(grant)
+        for tag, (table, column) in LIST_FIELDS.items():
+            for value in record.get(tag, []):
+                lists[table]['pmid'].append(pmid)
+                lists[table][column].append(value)
+
+    tables = {
+        'papers': pd.DataFrame(papers),
+        'authorships': with_roles(pd.DataFrame(authorships)),
+        'affiliations': pd.DataFrame(affiliations),
+        'grants': pd.DataFrame(grants),
+        **{table: pd.DataFrame(columns) for table, columns in lists.items()},
+    }
+    return _compact(tables)
+
+
+def with_roles(authorships):
+    """
+    Adds the role of every authorship, derived from position and team size.
+    """
+    position, n_authors = authorships['position'].to_numpy(), authorships['n_authors'].to_numpy()
+    role = np.select([n_authors == 1, position == 1, position == n_authors], ['single', 'first', 'last'], default='middle')
+    authorships['role'] = pd.Categorical(role, categories=ROLES)
+    return authorships
+
+
+def _compact(tables):
+    """
+    Converts repeated strings to categoricals and positions to small integers.
+    """
+    for name, df in tables.items():
+        for column in ['pmid', 'author', 'affiliation', 'grant', 'term', 'keyword', 'publication_type', 'journal', 'journal_abbreviation', 'language', 'year']:
+            if column in df:
+                df[column] = df[column].astype('category')
+        for column in ['position', 'n_authors']:
+            if column in df:
+                df[column] = df[column].astype('int32')
+    return tables
+
+
+def save_tables(tables, table_dir):
+    """
+    Stores the tables as Parquet files. Each file is written to a temporary name and renamed afterwards.
+
+    Args:
+        tables (dict): Table name -> pandas DataFrame.
+        table_dir (str): Directory for the Parquet files.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    for name, df in tables.items():
+        path = os.path.join(table_dir, f'{name}.parquet')
+        df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def load_tables(table_dir):
+    """
+    Loads the tables from Parquet files.
+
+    Args:
+        table_dir (str): Directory containing the Parquet files.
+
+    Returns:
+        dict: Table name -> pandas DataFrame, or None if the tables do not exist.
+    """
+    paths = {name: os.path.join(table_dir, f'{name}.parquet') for name in TABLES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    tables = {name: pd.read_parquet(path) for name, path in paths.items()}
+    authorships = tables['authorships']
+    if 'year' not in authorships:  # stored before roles and years were added to the authorships
+        years = tables['papers'].set_index(tables['papers']['pmid'].astype(str))['year'].astype(str)
+        authorships['year'] = authorships['pmid'].astype(str).map(years).fillna('')
+    if 'role' not in authorships:
+        with_roles(authorships)
+    return _compact(tables)
+
+
+def load_or_build_tables(table_dir, records):
+    """
+    Loads the stored tables, or builds and stores them if they are missing or do not match the records.
+
+    Args:
+        table_dir (str): Directory containing the Parquet files.
+        records (list): Parsed PubMed records of the same dataset.
+
+    Returns:
+        dict: Table name -> pandas DataFrame.
+    """
+    tables = load_tables(table_dir)
+    if tables is None or len(tables['papers']) != len(records):
+        tables = build_tables(records)
+        save_tables(tables, table_dir)
+    return tables
+
+
+def _counts(series):
+    """
+    Counts the values of a series into a Counter, without the unused categories of categorical columns.
+    """
+    counts = series.value_counts(sort=False)
+    return Counter(counts[counts > 0].to_dict())
+
+
+def year_histogram(papers):
+    """
+    Returns the number of papers per publication year, sorted by year.
+    """
+    return papers.groupby('year', observed=True).size().sort_index()
+
+
+def top_funders(grants, n=10):
+    """
+    Returns the n most frequent grants with their number of occurrences.
+    """
+    return grants['grant'].value_counts().head(n)
+
+
+def first_authorship_counts(authorships):
+    """
+    Returns the number of first authorships per author.
+    """
+    first = authorships[authorships['position'] == 1]
+    counts = first.groupby('author', observed=True).size()
+    return counts.sort_values(ascending=False)
+
+
+def summary_stats(tables, author_name, spellings=None):
+    """
+    Computes the SummaryStats of the Summary tab with vectorized group-bys over the tables.
+    The result is identical to aggregate.aggregate() on the same records.
+
+    Args:
+        tables (dict): Table name -> pandas DataFrame.
+        author_name (str): Name of the searched author.
+        spellings (frozenset): Spellings of the searched author, see aggregate.aggregate. Only the exact name by default.
+
+    Returns:
+        SummaryStats: The collected statistics.
+    """
+    papers, authorships = tables['papers'], tables['authorships']
+    affiliations, grants = tables['affiliations'], tables['grants']
+    own = [author_name] if spellings is None else list(spellings)
+    is_author = authorships['author'].isin(own)
+    author_affiliations = affiliations[affiliations['author'].isin(own)]
+    last = authorships[authorships['position'] == authorships['n_authors']]
+
+    return SummaryStats(
+        number_papers=len(papers),
+        author_counts=_counts(authorships['author']),
+        year_counts=_counts(papers['year']),
+        funder_counts=_counts(grants['grant']),
+        funded_papers=grants['pmid'].nunique(),
+        affiliation_counts=_counts(author_affiliations['affiliation']),
+        last_author_counts=_counts(last['author']),
+        positions=authorships.loc[is_author, 'position'].tolist(),
+        number_authorships=len(authorships),
+        number_affiliations=len(affiliations),
+        author_papers=authorships.loc[is_author, 'pmid'].nunique(),
+        author_affiliated_papers=author_affiliations['pmid'].nunique(),
+        spellings=frozenset(authorships.loc[is_author, 'author'].astype(str).unique()),
+    )
+
+
+# Fields of the inverted index: name -> (table, column)
+INDEX_FIELDS = {
+    'year': ('papers', 'year'),
+    'journal': ('papers', 'journal'),
+    'language': ('papers', 'language'),
+    'mesh': ('mesh', 'term'),
+    'keyword': ('keywords', 'keyword'),
+    'publication_type': ('publication_types', 'publication_type'),
+}
+
+
+def build_index(tables):
+    """
+    Builds an inverted index from the tables, mapping every value of the indexed fields to the set of PMIDs having it.
+
+    Args:
+        tables (dict): Table name -> pandas DataFrame.
+
+    Returns:
+        dict: Field name (see INDEX_FIELDS) -> {value: frozenset of PMIDs}.
+    """
+    index = {}
+    for field, (table, column) in INDEX_FIELDS.items():
+        df = tables[table]
+        postings = defaultdict(set)
+        for value, pmid in zip(df[column].astype(str), df['pmid'].astype(str)):
+            if value:
+                postings[value].add(pmid)
+        index[field] = {value: frozenset(pmids) for value, pmids in postings.items()}
+    index['all'] = frozenset(tables['papers']['pmid'].astype(str))
+    return index
+
+
+def select_pmids(index, since=None, until=None, **filters):
+    """
+    Selects papers with index lookups. Values of one field are combined with OR, different fields with AND.
+
+    Args:
+        index (dict): Inverted index, see build_index.
+        since (int): First publication year to include.
+        until (int): Last publication year to include.
+        **filters: Field name -> list of values, e.g. publication_type=['Review'].
+
+    Returns:
+        frozenset: The selected PMIDs.
+    """
+    selected = index['all']
+    if since is not None or until is not None:
+        years = [year for year in index['year'] if year.isdigit() and (since is None or int(year) >= since) and (until is None or int(year) <= until)]
+        selected = selected & frozenset().union(*(index['year'][year] for year in years))
+    for field, values in filters.items():
+        if values:
+            selected = selected & frozenset().union(*(index[field].get(value, frozenset()) for value in values))
+    return selected
+
+
+def breakdown(tables, field, pmids=None, n=10):
+    """
+    Counts the values of an indexed field over the selected papers.
+
+    Args:
+        tables (dict): Table name -> pandas DataFrame.
+        field (str): Field name, see INDEX_FIELDS.
+        pmids (frozenset): Selected PMIDs, or None for all papers.
+        n (int): Number of most frequent values to return.
+
+    Returns:
+        pandas.Series: Value -> number of papers, the most frequent first.
+    """
+    table, column = INDEX_FIELDS[field]
+    df = tables[table]
+    if pmids is not None:
+        df = df[df['pmid'].astype(str).isin(pmids)]
+    counts = df[column].value_counts()
+    counts = counts[(counts > 0) & (counts.index != '')]
+    return counts.head(n)
@@ -0,0 +1,232 @@
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+from scipy import sparse
+from columnar import load_tables, build_tables, save_tables
+from canonical import agency
+from loader import iter_records
+from authorship import AuthorshipIndex, role_share_by_year, senior_authors
+from instrument import span
+from locks import named_lock
+from summary import load_name_index
+
+"""
+Side by side comparison of several authors from the local results directory.
+
+The columnar tables of all selected authors are concatenated into one table per kind with a 'searched' column, and all
+metrics are computed with group-bys over the combined tables. The collaborator and funder overlaps are products of sparse
+author x collaborator (funder) incidence matrices, so comparing 20 or more authors needs one matrix product instead of a
+loop over all pairs of authors.
+"""
+
+
+def local_authors(results_dir='results'):
+    """
+    Returns the authors with a completed crawl in the results directory.
+
+    Returns:
+        dict: Author name ('Last, First') -> directory of the author.
+    """
+    if not os.path.isdir(results_dir):
+        return {}
+    authors = {}
+    for dir_name in sorted(os.listdir(results_dir)):
+        if os.path.isdir(os.path.join(results_dir, dir_name, 'processed')):
+            authors[dir_name.replace('_', ', ', 1)] = os.path.join(results_dir, dir_name)
+    return authors
+
+
+@st.cache_resource(max_entries=64)
+def get_author_tables(author_dir, version):
+    """
+    Loads the columnar tables of an author, or builds and stores them from the processed files.
+
+    Parameters:
+        author_dir (str): Directory of the author in the results directory.
+        version (float): Modification time of the processed directory, the tables are reloaded when it changes.
+    """
+    table_dir = os.path.join(author_dir, 'tables')
+    tables = load_tables(table_dir)
+    if tables is None:
+        processed = os.path.join(author_dir, 'processed')
+        file_names = [os.path.join(processed, file_name) for file_name in os.listdir(processed)]
+        tables = build_tables([record for chunk in iter_records(file_names) for record in chunk])
+        save_tables(tables, table_dir)
+    return tables
+
+
+@st.cache_resource(max_entries=1)
+def get_authorship_index(results_dir, version):
+    """
+    Loads the authorship-position index of all locally stored papers.
+
+    Parameters:
+        results_dir (str): Directory of the crawled authors.
+        version (float): Modification time of the directory of the stored index, which is updated with every ingest.
+    """
+    # a crawl writing a new part or compacting the parts holds the same lock
+    with named_lock('_authorships', os.path.join(results_dir, '.locks')):
+        return AuthorshipIndex.load(results_dir)
+
+
+def combine_tables(tables_by_author):
+    """
+    Concatenates the tables of several authors into one table per kind, with the searched author in the column 'searched'.
+
+    Args:
+        tables_by_author (dict): Author name -> tables, see columnar.build_tables.
+
+    Returns:
+        dict: Table name -> combined DataFrame, for 'papers', 'authorships' and 'grants'.
+    """
+    authors = list(tables_by_author)
+    combined = {}
+    for name in ['papers', 'authorships', 'grants']:
+        frames = []
+        for author in authors:
+            df = tables_by_author[author][name]
+            # plain strings, categoricals with different categories would be concatenated as object columns anyway
+            df = df.astype({column: str for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+            frames.append(df.assign(searched=author))
+        df = pd.concat(frames, ignore_index=True)
+        df['searched'] = pd.Categorical(df['searched'], categories=authors)
+        combined[name] = df
+    return combined
+
+
+def incidence(rows, columns, row_labels):
+    """
+    Builds a binary sparse matrix with a one for every (row, column) pair.
+
+    Args:
+        rows (pandas.Series): Row label of every pair, a categorical with row_labels as categories.
+        columns (pandas.Series): Column label of every pair.
+        row_labels (list): Labels of the rows in matrix order.
+
+    Returns:
+        scipy.sparse.csr_matrix: The matrix, rows in the order of row_labels.
+    """
+    column_codes, _ = pd.factorize(columns)
+    matrix = sparse.csr_matrix((np.ones(len(column_codes)), (rows.cat.codes.to_numpy(), column_codes)),
+                               shape=(len(row_labels), column_codes.max() + 1 if len(column_codes) else 0))
+    matrix.data[:] = 1  # duplicate pairs were summed up
+    return matrix
+
+
+def overlap(matrix, labels):
+    """
+    Returns the number of shared columns and the Jaccard similarity of every pair of rows of a binary matrix.
+    """
+    shared = (matrix @ matrix.T).toarray()
+    sizes = np.diag(shared)
+    union = sizes[:, None] + sizes[None, :] - shared
+    jaccard = np.divide(shared, union, out=np.zeros(shared.shape), where=union > 0)
+    return pd.DataFrame(shared.astype(int), index=labels, columns=labels), pd.DataFrame(jaccard, index=labels, columns=labels)
+
+
+def compare_authors(combined, spellings=None):
+    """
+    Computes the comparison metrics of all authors in one pass over the combined tables.
+
+    Args:
+        combined (dict): Combined tables, see combine_tables.
+        spellings (dict): Author -> spellings counted as the author, see NameIndex.spellings. Only the exact names by default.
+
+    Returns:
+        dict: 'metrics' (one row per author), 'years' (papers per year and author), 'collaborators' and 'funders'
+              (shared counts and Jaccard similarity between the authors).
+    """
+    papers, authorships, grants = combined['papers'], combined['authorships'], combined['grants']
+    authors = list(papers['searched'].cat.categories)
+    # the searched author may be listed under several spellings
+    own_names = {author: spellings[author] if spellings else [author] for author in authors}
+    own_pairs = pd.MultiIndex.from_arrays([[author for author in authors for _ in own_names[author]],
+                                           [name for author in authors for name in own_names[author]]])
+    own = pd.MultiIndex.from_arrays([authorships['searched'].astype(str), authorships['author'].astype(str)]).isin(own_pairs)
+    collaborations = authorships[~own]
+    funders = grants.assign(funder=grants['grant'].map(agency))
+
+    metrics = pd.DataFrame({
+        'Papers': papers.groupby('searched', observed=False).size(),
+        'First Authorships': authorships[own & (authorships['position'] == 1)].groupby('searched', observed=False).size(),
+        'Last Authorships': authorships[own & (authorships['position'] == authorships['n_authors']) & (authorships['n_authors'] > 1)].groupby('searched', observed=False).size(),
+        'Unique Collaborators': collaborations.groupby('searched', observed=False)['author'].nunique(),
+        'Mean Team Size': papers.groupby('searched', observed=False)['n_authors'].mean().round(1),
+        'Funding Agencies': funders.groupby('searched', observed=False)['funder'].nunique(),
+    }).fillna(0)
+    years = papers[papers['year'] != ''].groupby(['year', 'searched'], observed=False).size().unstack(fill_value=0)
+
+    collaborator_matrix = incidence(collaborations['searched'], collaborations['author'], authors)
+    funder_matrix = incidence(funders['searched'], funders['funder'], authors)
+    return {
+        'metrics': metrics,
+        'years': years.sort_index(),
+        'collaborators': overlap(collaborator_matrix, authors),
+        'funders': overlap(funder_matrix, authors),
+    }
+
+
+def show_page(results_dir='results'):
+    """
+    Displays the comparison of several locally stored authors.
+
+    Parameters:
+        results_dir (str): Directory of the crawled authors.
+    """
+    st.write('## Compare Authors')
+    st.write('Compare authors which have been searched in this app before. The metrics are computed from the locally stored papers.')
+    authors = local_authors(results_dir)
+    if len(authors) < 2:
+        st.write('Search at least two authors first.')
+        return
+    selected = st.multiselect('Authors', list(authors), default=list(authors)[:min(5, len(authors))])
+    if len(selected) < 2:
+        st.write('Select at least two authors.')
+        return
+
+    with st.spinner('Comparing authors...'):
+        with span('compare.load'):
+            tables_by_author = {}
+            for author in selected:
+                processed = os.path.join(authors[author], 'processed')
+                tables_by_author[author] = get_author_tables(authors[author], os.path.getmtime(processed))
+        # the same spellings as on the Summary tab count as the author, see NameIndex.spellings
+        name_index = load_name_index()
+        own_names = {author: sorted(name_index.spellings(author)) for author in selected}
+        with span('compare.metrics'):
+            result = compare_authors(combine_tables(tables_by_author), own_names)
+
+    st.dataframe(result['metrics'], use_container_width=True)
+
+    st.write('## Papers per Year')
+    years = result['years'].reset_index().melt(id_vars='year', var_name='Author', value_name='Number of Papers')
+    fig = px.line(years, x='year', y='Number of Papers', color='Author', labels={'year': 'Year'})
+    st.plotly_chart(fig, key='compare_years', use_container_width=True)
+
+    similarity = st.radio('Overlap', ['Shared', 'Jaccard Similarity'], horizontal=True,
+                          help='Shared counts the collaborators (funding agencies) two authors have in common. The Jaccard similarity divides this by the number of collaborators (funding agencies) of both together.')
+    index = 0 if similarity == 'Shared' else 1
+    for key, title in [('collaborators', 'Collaborator Overlap'), ('funders', 'Shared Funding Agencies')]:
+        st.write(f'## {title}')
+        matrix = result[key][index]
+        fig = px.imshow(matrix, text_auto='.2f' if index else True, color_continuous_scale='Viridis', aspect='auto')
+        fig.update_layout(height=max(400, 30 * len(selected)))
+        st.plotly_chart(fig, key=f'compare_{key}', use_container_width=True)
+
+    st.write('## First and Last Authorships over Time')
+    st.write('Share of first and last authorships of every author per year, and the most frequent last authors of their papers (often the group leaders). Taken from the authorship index of all locally stored papers, so papers stored with other authors count as well.')
+    index_dir = os.path.join(results_dir, '_authorships')
+    with span('compare.authorship_index'):
+        index = get_authorship_index(results_dir, os.path.getmtime(index_dir) if os.path.exists(index_dir) else None)
+    with span('compare.roles'):
+        # all spellings of an author are counted under the searched name, as in the metrics above
+        shares = pd.concat({author: role_share_by_year(index.authorships, own_names[author]) for author in selected}, names=['author'])[['first', 'last']]
+        seniors = {author: senior_authors(index.authorships, own_names[author], n=3) for author in selected}
+    shares = shares.reset_index().melt(id_vars=['author', 'year'], var_name='Role', value_name='Share')
+    fig = px.line(shares, x='year', y='Share', color='author', line_dash='Role', labels={'year': 'Year', 'author': 'Author'})
+    fig.update_layout(yaxis_tickformat='.0%')
+    st.plotly_chart(fig, key='compare_roles', use_container_width=True)
+    st.dataframe(pd.DataFrame({'Most Frequent Senior Authors': {author: ', '.join(f'{name} ({count})' for name, count in counts.items())
+                                                                  for author, counts in seniors.items()}}), use_container_width=True)
@@ -0,0 +1,245 @@
+import time
+import queue
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from instrument import collect, record
+
+"""
+Staged crawl pipeline.
+
+Fetching a page is bound by the network and the rate limit, parsing it by the CPU and storing the records by the disk. The
+pipeline runs the three stages concurrently, connected by bounded queues:
+
+    fetch (thread) --queue--> parse (process pool) --queue--> write (calling thread, batched)
+
+While the fetch stage waits for the next page (or the pause between two pages), the previous pages are parsed and written.
+A full queue blocks the stage in front of it (backpressure), so a slow disk never lets parsed pages pile up in memory.
+The report contains items, busy time and throughput per stage, the time a stage was blocked and the depth of the queues.
+
+The parse processes are shared by all crawls of the app and started once. They are started with forkserver (spawn where it
+is not available) instead of fork, a fork of the app would copy its threads, locks and caches into every worker. The
+spans of a parse run in the worker, they are returned with its result and recorded in the app.
+"""
+
+_DONE = object()  # marks the end of a stream
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+class StageQueue(queue.Queue):
+    """
+    Bounded queue which records its depth at every put.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.depths = []
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.depths.append(self.qsize())
+
+    def report(self):
+        return {
+            'max_depth': max(self.depths, default=0),
+            'mean_depth': sum(self.depths) / len(self.depths) if self.depths else 0.0,
+            'capacity': self.maxsize,
+        }
+
+
+class StageStats:
+    """
+    Counters of one stage: processed items, time spent working and time spent blocked on a full or empty queue.
+    The busy time of the parse stage is the summed time of the parse calls in the workers.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+
+    def report(self):
+        return {
+            'items': self.items,
+            'busy_s': self.busy_s,
+            'blocked_s': self.blocked_s,
+            'items_per_s': self.items / self.busy_s if self.busy_s else 0.0,
+        }
+
+
+def _timed(parse, item):
+    """
+    Runs parse and returns the result together with the time it took and the measurements of its spans, see
+    instrument.collect.
+    """
+    with collect() as spans:
+        start = time.perf_counter()
+        result = parse(item)
+        seconds = time.perf_counter() - start
+    return result, seconds, spans
+
+
+def parse_pool(workers):
+    """
+    Returns the process pool shared by all crawls, with at least the given number of workers. The pool is replaced if a
+    crawl needs more workers or a worker died, the old pool finishes its pending parses first.
+
+    Args:
+        workers (int): Number of parse processes.
+
+    Returns:
+        ProcessPoolExecutor: The shared pool.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers or getattr(_pool, '_broken', False):
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(_START_METHOD))
+            _pool_workers = workers
+        return _pool
+
+
+def run_pipeline(source, parse, write, parse_workers=2, queue_size=4, batch_size=2):
+    """
+    Runs fetch, parse and write concurrently.
+
+    Args:
+        source (iterable): Yields the fetched items, e.g. result pages. It is consumed on a background thread.
+        parse (callable): Turns an item into its result. Runs in a process pool, so it must be a picklable module level
+            function (functools.partial works). Items and results are pickled between the processes. Spans opened by
+            parse are recorded in this process.
+        write (callable): Called with a list of (item, result) pairs in the order of the source, at most batch_size at a time.
+        parse_workers (int): Number of parse processes of the shared pool, see parse_pool. 0 parses on a thread of this
+            process instead.
+        queue_size (int): Capacity of each queue.
+        batch_size (int): Number of parsed items which are written together.
+
+    Returns:
+        dict: Report with 'wall_s', 'stages' (fetch, parse, write) and 'queues' (fetched, parsed).
+    """
+    fetched, parsed = StageQueue(queue_size), StageQueue(queue_size)
+    stats = {name: StageStats(name) for name in ['fetch', 'parse', 'write']}
+    errors = []
+    futures = []  # parses of this crawl in the shared pool, cancelled when the crawl ends early
+    stop = threading.Event()
+
+    def put(q, item, stage):
+        # blocks on a full queue, but gives up when the writer failed and nobody consumes anymore
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.blocked_s += time.perf_counter() - start
+
+    def get(q, stage):
+        # waits for the next item, or ends the stream when the pipeline is stopped
+        start = time.perf_counter()
+        item = _DONE
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop.is_set():
+                    break
+        stage.blocked_s += time.perf_counter() - start
+        return item
+
+    def fetch_stage():
+        stage = stats['fetch']
+        try:
+            items = iter(source)
+            while not stop.is_set():
+                start = time.perf_counter()
+                item = next(items, _DONE)
+                stage.busy_s += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stage.items += 1
+                put(fetched, item, stage)
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            put(fetched, _DONE, stage)
+
+    def parse_stage(pool):
+        # submits the items in order, the bounded queue limits the number of pages in flight
+        stage = stats['parse']
+        task = functools.partial(_timed, parse)
+        while True:
+            item = get(fetched, stage)
+            if item is _DONE:
+                break
+            if pool is not None:
+                try:
+                    future = pool.submit(task, item)
+                except BrokenProcessPool:  # a worker died, e.g. killed for its memory
+                    future = parse_pool(parse_workers).submit(task, item)
+                futures.append(future)
+            else:
+                future = Future()
+                try:
+                    future.set_result(task(item))
+                except Exception as error:
+                    future.set_exception(error)
+            put(parsed, (item, future), stage)
+        put(parsed, _DONE, stage)
+
+    start_wall = time.perf_counter()
+    pool = parse_pool(parse_workers) if parse_workers else None
+    threads = [threading.Thread(target=fetch_stage, name='crawl-fetch', daemon=True),
+               threading.Thread(target=parse_stage, args=(pool,), name='crawl-parse', daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        stage = stats['write']
+        batch = []
+        while True:
+            entry = get(parsed, stage)
+            if entry is not _DONE:
+                item, future = entry
+                # waiting for the parse result counts as blocked time of the writer
+                start = time.perf_counter()
+                result, seconds, spans = future.result()
+                stage.blocked_s += time.perf_counter() - start
+                stats['parse'].items += 1
+                stats['parse'].busy_s += seconds
+                for measurement in spans:
+                    record(*measurement)
+                batch.append((item, result))
+            if batch and (entry is _DONE or len(batch) >= batch_size):
+                start = time.perf_counter()
+                write(batch)
+                stage.busy_s += time.perf_counter() - start
+                stage.items += len(batch)
+                batch = []
+            if entry is _DONE:
+                break
+    finally:
+        stop.set()
+        # drain the queues so that blocked stages can finish
+        for q in (fetched, parsed):
+            while not q.empty():
+                q.get_nowait()
+        for thread in threads:
+            thread.join()
+        for future in futures:
+            future.cancel()
+    if errors:
+        raise errors[0]
+
+    return {
+        'wall_s': time.perf_counter() - start_wall,
+        'stages': {name: stage.report() for name, stage in stats.items()},
+        'queues': {'fetched': fetched.report(), 'parsed': parsed.report()},
+    }
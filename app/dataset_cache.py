@@ -0,0 +1,189 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from aggregate import dataset_fingerprint
+from loader import iter_records
+from record import Paper, LegacyRecord, to_legacy
+
+"""
+Process wide, read-only cache of loaded datasets.
+
+Without it every session keeps its own copy of all records of an author. With it the records of an author are loaded once
+per server process and the sessions only hold references to the shared, immutable tuple. Datasets are evicted in least
+recently used order when the estimated memory of all cached datasets exceeds the bound. The memory of the papers is
+estimated from the deep size of a sample of them, the memory of the columnar tables from pandas. A dataset is reloaded
+when the files of the author change, e.g. after a new crawl.
+"""
+
+
+def _deep_size(obj, seen):
+    """
+    Size in bytes of an object and everything it references, objects in seen are not counted again.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__') and not isinstance(obj, str):
+        size += sum(_deep_size(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def estimate_nbytes(papers, sample_size=256):
+    """
+    Estimates the memory of papers and their LegacyRecord views from an evenly spaced sample. Strings shared within the
+    sample (interned names, dates, journals) are counted once, so shared strings are counted roughly once per sample.
+
+    Args:
+        papers (tuple): The papers.
+        sample_size (int): Number of papers to measure.
+
+    Returns:
+        int: Estimated bytes.
+    """
+    if not papers:
+        return 0
+    step = max(len(papers) // sample_size, 1)
+    sample = papers[::step]
+    seen = set()
+    sample_bytes = sum(_deep_size(paper, seen) for paper in sample)
+    view_bytes = sys.getsizeof(LegacyRecord(papers[0]))
+    return int(sample_bytes / len(sample) * len(papers)) + view_bytes * len(papers) + sys.getsizeof(papers)
+
+
+def tables_nbytes(tables):
+    """
+    Memory of the columnar tables in bytes, categories included.
+    """
+    return int(sum(df.memory_usage(deep=True).sum() for df in tables.values()))
+
+
+class Dataset:
+    """
+    The loaded papers of one author.
+
+    Attributes:
+        dir_name (str): Directory of the processed paper files.
+        papers (tuple): The papers in the compact record model. Shared between sessions, so they are immutable.
+        records (tuple): Read-only views of the papers in the dict-of-lists layout the tabs work on.
+        fingerprint (str): Fingerprint of the records, see aggregate.dataset_fingerprint.
+        version (tuple): Number of files and modification time of the directory when the records were loaded.
+        nbytes (int): Estimated memory of the papers, their views and the tables.
+        tables (dict): Columnar tables of the records, see columnar.build_tables. Set by the first session that needs them.
+    """
+
+    def __init__(self, dir_name, papers, version):
+        self.dir_name = dir_name
+        self.papers = tuple(papers)
+        self.records = tuple(to_legacy(self.papers))
+        self.fingerprint = dataset_fingerprint(self.records)
+        self.version = version
+        self.papers_nbytes = estimate_nbytes(self.papers)
+        self.tables_nbytes = 0
+        self._tables = None
+
+    @property
+    def tables(self):
+        return self._tables
+
+    @tables.setter
+    def tables(self, tables):
+        self._tables = tables
+        self.tables_nbytes = tables_nbytes(tables) if tables is not None else 0
+
+    @property
+    def nbytes(self):
+        return self.papers_nbytes + self.tables_nbytes
+
+
+def _version(dir_name):
+    return len(os.listdir(dir_name)), os.path.getmtime(dir_name)
+
+
+class DatasetCache:
+    """
+    LRU cache of datasets with a memory bound.
+
+    Attributes:
+        max_bytes (int): Maximum estimated memory of all cached datasets.
+        size (int): Current estimated memory of all cached datasets. Tables added to a cached dataset are counted from
+            the next get().
+
+    Methods:
+        get(dir_name, on_progress):
+            Returns the dataset of a directory, loading it if it is not cached or outdated.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}  # dir_name -> lock, so concurrent sessions load the same author only once
+
+    def get(self, dir_name, on_progress=None):
+        """
+        Returns the dataset of a directory. Concurrent calls for the same directory wait for a single load.
+
+        Args:
+            dir_name (str): Directory of the processed paper files.
+            on_progress (callable): Called with the fraction of loaded files while loading.
+
+        Returns:
+            Dataset: The shared dataset.
+        """
+        version = _version(dir_name)
+        with self._lock:
+            dataset = self._datasets.get(dir_name)
+            if dataset is not None and dataset.version == version:
+                self._datasets.move_to_end(dir_name)
+                self._evict()  # the tables may have been added since the last call
+                return dataset
+            load_lock = self._loading.setdefault(dir_name, threading.Lock())
+
+        with load_lock:
+            try:
+                # Another session may have loaded the dataset while this one was waiting
+                with self._lock:
+                    dataset = self._datasets.get(dir_name)
+                    if dataset is not None and dataset.version == version:
+                        return dataset
+                dataset = self._load(dir_name, version, on_progress)
+                self._put(dataset)
+            finally:
+                # later calls find the dataset in the cache, sessions already waiting hold a reference to the lock
+                with self._lock:
+                    if self._loading.get(dir_name) is load_lock:
+                        del self._loading[dir_name]
+        return dataset
+
+    def _load(self, dir_name, version, on_progress):
+        file_names = [os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name)]
+        papers = []
+        for chunk in iter_records(file_names):
+            papers.extend(Paper.from_dict(record) for record in chunk)
+            if on_progress is not None:
+                on_progress(len(papers) / len(file_names))
+        return Dataset(dir_name, papers, version)
+
+    @property
+    def size(self):
+        return sum(dataset.nbytes for dataset in self._datasets.values())
+
+    def _put(self, dataset):
+        with self._lock:
+            self._datasets.pop(dataset.dir_name, None)
+            self._datasets[dataset.dir_name] = dataset
+            self._evict()
+
+    def _evict(self):
+        """
+        Evicts the least recently used datasets. Sessions still holding a reference keep their copy alive until they load
+        another author. Called with the lock held.
+        """
+        size = self.size
+        while size > self.max_bytes and len(self._datasets) > 1:
+            _, evicted = self._datasets.popitem(last=False)
+            size -= evicted.nbytes
@@ -0,0 +1,29 @@
+import streamlit as st
+import pandas as pd
+import instrument
+
+def show_page():
+    """
+    Displays the timing and memory statistics of the pipeline stages recorded by the instrument module.
+    The page is hidden and only shown with PUBMED_DIAGNOSTICS=1 or the query parameter ?diagnostics=1.
+    """
+    st.write('## Diagnostics')
+    st.write('Wall time, CPU time and memory peak of each pipeline stage since the server started. The memory peak is only recorded with PUBMED_TRACE_MEMORY=1, and only for calls which did not overlap with stages running on other threads.')
+
+    stats = instrument.snapshot()
+    if not stats:
+        st.write('No stages have been recorded yet.')
+        return
+
+    df = pd.DataFrame.from_dict(stats, orient='index')
+    df.index.name = 'Stage'
+    df['mean_wall_s'] = df['wall_s'] / df['count']
+    df['peak_mb'] = df['peak_bytes'] / 1e6
+    st.dataframe(df[['count', 'wall_s', 'mean_wall_s', 'max_wall_s', 'last_wall_s', 'cpu_s', 'peak_mb']].sort_values('wall_s', ascending=False), use_container_width=True)
+
+    col_json, col_prometheus, col_reset = st.columns(3)
+    col_json.download_button('Export JSON', data=instrument.export_json(), file_name='diagnostics.json', mime='application/json')
+    col_prometheus.download_button('Export Prometheus', data=instrument.export_prometheus(), file_name='diagnostics.prom', mime='text/plain')
+    if col_reset.button('Reset'):
+        instrument.reset()
+        st.rerun()
@@ -2,51 +2,79 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import torch
-from transformers import AutoTokenizer, AutoModel
-from sklearn.decomposition import PCA
+from functools import lru_cache
+from instrument import span, traced
+from loader import read_abstracts
 
 """
 Warning: Running this code in a docker enviroment leads to following warning:
     Examining the path of torch.classes raised: Tried to instantiate class '__path__._path', but it does not exist! Ensure that it is registered via torch::class_
 
 I was not able to fix this problem. The code works fine in a local enviroment. But the functionality is not affected by this warning.
+
+torch, transformers and sklearn take seconds to import. They are therefore only imported on first use, see warmup.py for preloading them at server start.
+
+BioBERT takes minutes on a CPU for authors with many papers. The fast mode (get_sparse_embeddings) represents every paper by a
+sparse TF-IDF or hashing vector of its title and abstract and reduces it with a truncated SVD, which takes well below a second.
+The page always shows the fast map first and replaces it with the BioBERT map once that is ready.
 """
 
+MODEL_NAME = "dmis-lab/biobert-v1.1"
+
+# Load the model once per process, it is shared by all sessions and reruns
+@lru_cache(maxsize=2)
+def load_model(model_name=MODEL_NAME):
+    """
+    Loads tokenizer and model. The result is cached, so the model is only loaded once per process.
+
+    Parameters:
+    - model_name: name of the model on the Hugging Face hub
+
+    Returns:
+    - tokenizer, model
+    """
+    from transformers import AutoTokenizer, AutoModel
+    with span('embedd.load_model'):
+        tokenizer = AutoTokenizer.from_pretrained(model_name)  # Load tokenizer
+        model = AutoModel.from_pretrained(model_name)  # Load model
+    return tokenizer, model
+
 # Function to plot embeddings using Plotly
-def plot_embeddings_with_plotly(embeddings, urls):
+def plot_embeddings_with_plotly(embeddings, urls, method='PCA'):
     """
     Plots a 2D scatter plot of embeddings using Plotly, with annotations and URL hover info.
 
     Parameters:
     - embeddings: numpy array of reduced embeddings for each document
     - urls: list of URLs corresponding to each document
+    - method: name of the dimensionality reduction, used for the axis titles
 
     Returns:
     - fig: Plotly figure object for the scatter plot
     """
+    x, y = f'{method} Component 1', f'{method} Component 2'
     # Create a DataFrame to hold embeddings and document URLs
     df = pd.DataFrame({
-        'PCA Component 1': embeddings[:, 0],
-        'PCA Component 2': embeddings[:, 1],
+        x: embeddings[:, 0],
+        y: embeddings[:, 1],
         'URL': urls
     })
 
     # Create scatter plot of embeddings with Plotly
     fig = px.scatter(
         df, 
-        x='PCA Component 1', 
-        y='PCA Component 2', 
+        x=x, 
+        y=y, 
         hover_data={'URL': True},  # Show URL on hover
-        labels={'PCA Component 1': 'PCA Component 1', 'PCA Component 2': 'PCA Component 2'},
+        labels={x: x, y: y},
         template='plotly_white'
     )
     
     # Annotate each point with "Doc {number}"
     for i in range(len(df)):
         fig.add_annotation(
-            x=df['PCA Component 1'][i],
-            y=df['PCA Component 2'][i],
+            x=df[x][i],
+            y=df[y][i],
             text=f'Doc {i + 1}',  # Document number starting from 1
             showarrow=True,
             arrowhead=2,
@@ -81,7 +109,65 @@ def get_abstracts_pmid(paper_data, pubmed_endpoint):
             pass  # Skip papers without title or PMID
     return abstracts, pmids
 
+# Function to extract the texts for the fast mode
+def get_documents(paper_data, abstracts=None):
+    """
+    Extracts title and, if available, abstract of every paper, in the same order as get_abstracts_pmid.
+
+    Parameters:
+    - paper_data: list of dictionaries containing paper details
+    - abstracts: dict PMID -> abstract, see loader.read_abstracts. The records loaded by the app do not contain the
+      abstracts ('AB'), without this dict only records which still contain them get their abstract.
+
+    Returns:
+    - documents: list of texts, one per paper
+    """
+    documents = []
+    for data in paper_data:
+        if 'TI' in data and 'PMID' in data:
+            pmid = list(data['PMID'])[0]
+            abstract = [abstracts[pmid]] if abstracts and pmid in abstracts else list(data.get('AB', []))
+            documents.append(' '.join(list(data['TI']) + abstract))
+    return documents
+
+# Function to generate sparse vectors and reduce them to 2D
+@traced('embedd.sparse_embeddings')
+def get_sparse_embeddings(documents, method='tfidf', n_features=2 ** 18):
+    """
+    Fast alternative to get_embeddings and PCA: TF-IDF or hashing vectors of the words, reduced to 2D with a truncated SVD.
+    The sparse matrix is never densified.
+
+    Parameters:
+    - documents: list of text documents
+    - method: 'tfidf' (vocabulary of the documents) or 'hashing' (fixed number of hashed features, no vocabulary)
+    - n_features: number of features of the hashing vectorizer
+
+    Returns:
+    - numpy array with two coordinates per document, all zeros if there are no words to compare (no documents, only stop
+      words or a single distinct word)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer
+    from sklearn.decomposition import TruncatedSVD
+    reduced = np.zeros((len(documents), 2))
+    if method == 'tfidf':
+        try:
+            vectors = TfidfVectorizer(stop_words='english', sublinear_tf=True).fit_transform(documents)
+        except ValueError:  # empty vocabulary
+            return reduced
+    elif method == 'hashing':
+        counts = HashingVectorizer(stop_words='english', n_features=n_features, alternate_sign=False, norm=None).transform(documents)
+        vectors = TfidfTransformer(sublinear_tf=True).fit_transform(counts)
+    else:
+        raise ValueError(f'Unknown method {method!r}, expected "tfidf" or "hashing".')
+    # the SVD needs more documents and more used features than components, tiny corpora keep zeros in the missing
+    # components (the hashing vectors have n_features columns, but only the columns of words in the documents count)
+    n_components = min(2, vectors.shape[0] - 1, len(np.unique(vectors.indices)) - 1)
+    if n_components >= 1:
+        reduced[:, :n_components] = TruncatedSVD(n_components=n_components, random_state=0).fit_transform(vectors)
+    return reduced
+
 # Function to generate embeddings for a list of documents
+@traced('embedd.embeddings')
 def get_embeddings(documents, tokenizer, model):
     """
     Generates embeddings for a list of documents using a pre-trained model.
@@ -94,6 +180,7 @@ def get_embeddings(documents, tokenizer, model):
     Returns:
     - numpy array of embeddings for each document
     """
+    import torch
     all_embeddings = []
     # Process documents in batches for efficiency
     for i in range(0, len(documents), 8):  # Batch size of 8
@@ -106,44 +193,31 @@ def get_embeddings(documents, tokenizer, model):
     return np.array(all_embeddings)
 
 # Main function to display the page content
-def show_page(data, name):
+def show_page(data, name, dir_name=None):
     """
     Displays the page content, which includes generating embeddings, reducing dimensions, 
     plotting, and adding interactivity.
 
     Parameters:
     - data: list of dictionaries containing paper details for analysis
+    - name: name of the author
+    - dir_name: directory of the processed paper files, the fast map reads the abstracts from there
     """
-    st.info('The embeddings may take too long. In case it does not load, try a different author with less papers.')
-    with st.spinner('Create Embeddings...'):
-        # To make sure new athors are loaded
-        dummy = None
-        # Check if embeddings are already in session state
-        if 'embeddings' not in st.session_state or dummy != name:
-            pubmed_endpoint = 'https://pubmed.ncbi.nlm.nih.gov/'
-            
-            # Load BioBERT model and tokenizer for biomedical text processing
-            model_name = "dmis-lab/biobert-v1.1"
-            tokenizer = AutoTokenizer.from_pretrained(model_name)  # Load tokenizer
-            model = AutoModel.from_pretrained(model_name)  # Load model
+    pubmed_endpoint = 'https://pubmed.ncbi.nlm.nih.gov/'
+    mode = st.radio('Embeddings', ['Fast (TF-IDF)', 'BioBERT'], index=1, horizontal=True,
+                    help='The fast mode compares the words of titles and abstracts and is ready instantly. BioBERT understands the biomedical language better but can take minutes. With BioBERT the fast map is shown until the BioBERT map is ready.')
 
-            # Extract titles (abstracts) and URLs for each document
-            titles, urls = get_abstracts_pmid(data, pubmed_endpoint)
-            # Generate embeddings for the titles
-            embeddings = get_embeddings(titles, tokenizer, model)
-
-            # Apply PCA for dimensionality reduction to 2D for visualization
-            pca = PCA(n_components=2)
-            reduced_embeddings = pca.fit_transform(embeddings)
-
-            # Store results in session state to avoid recalculating
-            st.session_state.embeddings = reduced_embeddings
-            st.session_state.urls = urls  # Store URLs
-
-            # Plot the embeddings using Plotly
-            fig = plot_embeddings_with_plotly(st.session_state.embeddings, st.session_state.urls)
-            st.session_state.fig = fig
-            dummy = name
+    # The figures are kept per author and mode, so switching back and forth does not recompute them
+    if st.session_state.get('embeddings_author') != name:
+        st.session_state.embeddings_author = name
+        st.session_state.embedding_figs = {}
+        # Extract titles (abstracts) and URLs for each document
+        st.session_state.titles, st.session_state.urls = get_abstracts_pmid(data, pubmed_endpoint)
+    figs = st.session_state.embedding_figs
+    if 'fast' not in figs:
+        abstracts = read_abstracts(dir_name) if dir_name else None
+        reduced_embeddings = get_sparse_embeddings(get_documents(data, abstracts))
+        figs['fast'] = plot_embeddings_with_plotly(reduced_embeddings, st.session_state.urls, method='SVD')
 
     # Markdown description of the application overview
     description = """
@@ -153,9 +227,11 @@ def show_page(data, name):
     1. **Embedding Creation**:
     - The app retrieves the titles (abstracts) of the provided papers and converts them into numerical representations called embeddings using a model known as [BioBERT](https://huggingface.co/dmis-lab/biobert-v1.1). This model is particularly effective for biomedical text.
     - Embeddings are calculated in batches for efficiency.
+    - In the fast mode, every paper is instead represented by the TF-IDF weights of the words in its title and abstract. Papers sharing rare words end up close to each other.
 
     2. **Dimensionality Reduction**:
     - Once the embeddings are generated, the app applies Principal Component Analysis (PCA) to reduce the high-dimensional embeddings into two dimensions. This allows us to visualize the data easily on a scatter plot.
+    - The fast mode uses a truncated singular value decomposition (SVD), which works directly on the sparse word vectors.
 
     3. **Visualization**:
     - The reduced embeddings are displayed as a scatter plot using Plotly. Each point on the plot represents a document, and hovering over a point will show the corresponding URL for the paper.
@@ -170,8 +246,12 @@ def show_page(data, name):
     st.write(description)
     st.warning('I am not a domain expert. Therefore it was not possible for me to validate the results. The only thing I did was too ask chatgpt to compare the topics of the papers.')
     
-    # Display the scatter plot
-    st.plotly_chart(st.session_state.fig, key = 'embedd', use_container_width=True)
+    # Display the scatter plot, the fast map first until the BioBERT map is ready
+    chart = st.empty()
+    if mode == 'BioBERT' and 'biobert' in figs:
+        chart.plotly_chart(figs['biobert'], key='embedd_biobert', use_container_width=True)
+    else:
+        chart.plotly_chart(figs['fast'], key='embedd_fast', use_container_width=True)
 
     # Dropdown selection to view a specific document
     selected_index = st.selectbox("Select a paper to open:", range(len(st.session_state.urls)), format_func=lambda x: f"Document {x + 1}")
@@ -183,3 +263,21 @@ def show_page(data, name):
     # Display the selected document link
     if 'selected_url' in st.session_state:
         st.write(f"You can view the paper [here]({st.session_state.selected_url}).")
+
+    if mode == 'BioBERT' and 'biobert' not in figs:
+        st.info('The embeddings may take too long. In case it does not load, try a different author with less papers.')
+        with st.spinner('Create Embeddings...'):
+            # Load BioBERT model and tokenizer for biomedical text processing
+            tokenizer, model = load_model()
+            # Generate embeddings for the titles
+            embeddings = get_embeddings(st.session_state.titles, tokenizer, model)
+
+            # Apply PCA for dimensionality reduction to 2D for visualization
+            with span('embedd.pca'):
+                from sklearn.decomposition import PCA
+                pca = PCA(n_components=2)
+                reduced_embeddings = pca.fit_transform(embeddings)
+
+            # Plot the embeddings using Plotly and swap it in for the fast map
+            figs['biobert'] = plot_embeddings_with_plotly(reduced_embeddings, st.session_state.urls)
+        chart.plotly_chart(figs['biobert'], key='embedd_biobert', use_container_width=True)
@@ -0,0 +1,132 @@
+import os
+import csv
+import io
+import json
+import zipfile
+import tempfile
+from loader import read_record
+
+"""
+Export of an author's papers as a compressed archive.
+
+The archive is written record by record straight from the processed files into the compressed ZIP stream on disk,
+so neither the serialized dataset nor the archive is ever held in memory as a whole. Archives are cached per dataset
+fingerprint and format and are only created when a download is requested. The cache keeps at most MAX_ARCHIVES archives
+and MAX_CACHE_BYTES bytes, the least recently requested archives are deleted first.
+"""
+
+MAX_ARCHIVES = int(os.environ.get('PUBMED_EXPORT_MAX_ARCHIVES', '20'))
+MAX_CACHE_BYTES = int(os.environ.get('PUBMED_EXPORT_MAX_BYTES', str(2 * 1024 ** 3)))
+
+FORMATS = {
+    'JSON Lines': 'jsonl',
+    'CSV': 'csv',
+    'Parquet': 'parquet',
+}
+
+
+def _write_jsonl(zf, file_names):
+    with zf.open('info_data.jsonl', 'w') as raw:
+        for file_name in file_names:
+            raw.write(json.dumps(read_record(file_name, fields=None), ensure_ascii=False).encode('utf-8'))
+            raw.write(b'\n')
+
+
+def _write_csv(zf, file_names):
+    with zf.open('info_data.csv', 'w') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(['PMID', 'Title', 'Date', 'Journal', 'Authors', 'Grants'])
+        for file_name in file_names:
+            record = read_record(file_name, fields=None)
+            writer.writerow([
+                record.get('PMID', [''])[0],
+                record.get('TI', [''])[0],
+                record.get('DP', [''])[0],
+                record.get('JT', [''])[0],
+                '; '.join(record.get('FAU', [])),
+                '; '.join(record.get('GR', [])),
+            ])
+        text.flush()
+        text.detach()
+
+
+def _write_parquet(zf, table_dir):
+    for file_name in sorted(os.listdir(table_dir)):
+        if file_name.endswith('.parquet'):
+            # zipfile copies the file in chunks into the archive
+            zf.write(os.path.join(table_dir, file_name), arcname=file_name)
+
+
+def evict_archives(cache_dir, keep=None):
+    """
+    Deletes the least recently requested archives until the cache is within MAX_ARCHIVES and MAX_CACHE_BYTES.
+
+    Args:
+        cache_dir (str): Directory of the cached archives.
+        keep (str): Path of an archive which is not deleted, the one just requested.
+    """
+    archives = []
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if file_name.endswith('.zip'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # deleted by another session
+                continue
+            archives.append((stat.st_mtime, stat.st_size, path))
+    archives.sort()
+    total = sum(size for _, size, _ in archives)
+    count = len(archives)
+    for _, size, path in archives:
+        if count <= MAX_ARCHIVES and total <= MAX_CACHE_BYTES:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        count -= 1
+        total -= size
+
+
+def export_archive(dir_name, fingerprint, fmt='jsonl', cache_dir='results/_exports'):
+    """
+    Returns the path of a ZIP archive with the papers of an author, creating it if it is not cached yet.
+
+    Args:
+        dir_name (str): Directory of the processed paper files of the author.
+        fingerprint (str): Fingerprint of the dataset, see aggregate.dataset_fingerprint.
+        fmt (str): One of 'jsonl', 'csv' or 'parquet'. Parquet exports the columnar tables stored next to dir_name.
+        cache_dir (str): Directory for the cached archives.
+
+    Returns:
+        str: Path of the ZIP archive.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{fingerprint}.{fmt}.zip')
+    if os.path.exists(path):
+        os.utime(path)  # the modification time orders the archives for the eviction
+        return path
+
+    file_names = sorted(os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name))
+    # a unique temporary file per call, sessions are threads of one process and may export the same dataset at once
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{fingerprint}.{fmt}.', suffix='.tmp', dir=cache_dir)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            if fmt == 'jsonl':
+                _write_jsonl(zf, file_names)
+            elif fmt == 'csv':
+                _write_csv(zf, file_names)
+            elif fmt == 'parquet':
+                _write_parquet(zf, os.path.join(os.path.dirname(dir_name), 'tables'))
+            else:
+                raise ValueError(f'Unknown export format: {fmt}')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):  # the archive could not be written
+            os.remove(tmp_path)
+    evict_archives(cache_dir, keep=path)
+    return path
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+
+"""
+Process wide cache of serialized Plotly figures.
+
+Every widget interaction reruns the Streamlit script and the Summary figures used to be rebuilt each time. The cache stores
+each figure as its JSON serialization, keyed by author, dataset fingerprint and figure name, so all reruns and all sessions
+showing the same author reuse them. The least recently used figures are evicted when the memory bound is exceeded and a new
+fingerprint for an author drops exactly the figures of the old dataset of that author.
+"""
+
+
+class FigureCache:
+    """
+    LRU cache of serialized figures with a memory bound.
+
+    Attributes:
+        max_bytes (int): Maximum total size of the serialized figures.
+        size (int): Current total size of the serialized figures.
+
+    Methods:
+        get_or_build(author, fingerprint, name, builder):
+            Returns a cached figure or builds, stores and returns it.
+
+        invalidate(author, fingerprint):
+            Drops all figures of an author which do not belong to the given fingerprint.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # (author, fingerprint, name) -> (figure json, extra values)
+        self._fingerprints = {}  # author -> fingerprint of the current dataset
+        self._lock = threading.Lock()
+
+    def get_or_build(self, author, fingerprint, name, builder):
+        """
+        Returns the cached figure, or calls the builder and caches its result.
+
+        Args:
+            author (str): Name of the author.
+            fingerprint (str): Fingerprint of the dataset the figure is built from.
+            name (str): Name of the figure.
+            builder (callable): Builds the figure. Returns either a figure or a tuple (figure, *extra values).
+
+        Returns:
+            The figure, or the tuple (figure, *extra values) exactly like the builder.
+        """
+        self.invalidate(author, fingerprint)
+        key = (author, fingerprint, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            result = builder()
+            fig, extra = (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+            entry = (fig.to_json(), extra)
+            self._put(key, entry)
+        fig = pio.from_json(entry[0])
+        return fig if entry[1] is None else (fig, *entry[1])
+
+    def _put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self.size += len(entry[0])
+            # Evict the least recently used figures until the cache fits into the memory bound again
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, (old_json, _) = self._entries.popitem(last=False)
+                self.size -= len(old_json)
+
+    def invalidate(self, author, fingerprint):
+        """
+        Drops the figures of an author which were built from another dataset than the given fingerprint.
+
+        Args:
+            author (str): Name of the author.
+            fingerprint (str): Fingerprint of the current dataset of the author.
+        """
+        with self._lock:
+            if self._fingerprints.get(author) == fingerprint:
+                return
+            self._fingerprints[author] = fingerprint
+            for key in [key for key in self._entries if key[0] == author and key[1] != fingerprint]:
+                self.size -= len(self._entries.pop(key)[0])
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+"""
+Lightweight instrumentation of the pipeline stages.
+
+Every stage is wrapped in a span, which records wall time, CPU time of the thread and, if memory tracing is enabled, the peak of
+the memory allocated during the span (tracemalloc). The spans are aggregated per name and can be exported as JSON or in the
+Prometheus text format. Memory tracing slows Python down noticeably, so it is only enabled with PUBMED_TRACE_MEMORY=1.
+
+tracemalloc has one peak for the whole process. The peak of a span is therefore only measured while no other thread has an
+open span (e.g. a crawl, the prefetch or an API request next to a Streamlit script run); spans which overlap with spans of
+other threads record no memory peak.
+
+Spans in worker processes are recorded in the statistics of the worker. collect() gathers them instead, so the worker
+can return them with its result and the parent adds them with record().
+"""
+
+_lock = threading.Lock()
+_stats = {}  # span name -> aggregated statistics
+_local = threading.local()  # stack of the open spans of the current thread
+_active_threads = 0  # number of threads with open spans
+_overlaps = 0  # incremented whenever a thread opens a span while another thread has open spans
+
+if os.environ.get('PUBMED_TRACE_MEMORY') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+@contextmanager
+def span(name):
+    """
+    Measures the enclosed block and adds the measurement to the statistics of the span name.
+
+    Args:
+        name (str): Name of the stage, e.g. 'crawler.fetch'.
+    """
+    global _active_threads, _overlaps
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    with _lock:
+        if not stack:
+            _active_threads += 1
+            if _active_threads > 1:
+                _overlaps += 1
+        alone, epoch = _active_threads == 1, _overlaps
+    tracing = alone and tracemalloc.is_tracing()
+    if tracing:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        # remember the peak the enclosing span has seen so far, the reset below would lose it
+        if stack:
+            stack[-1] = max(stack[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(0)
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+        child_peak = stack.pop()
+        with _lock:
+            exclusive = _overlaps == epoch  # no other thread opened a span in the meantime
+            if not stack:
+                _active_threads -= 1
+        peak = 0
+        if tracing and exclusive and tracemalloc.is_tracing():
+            absolute_peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+            peak = max(absolute_peak - start_memory, 0)
+            if stack:
+                stack[-1] = max(stack[-1], absolute_peak)
+        _record(name, wall, cpu, peak)
+
+
+def traced(name):
+    """
+    Decorator which wraps every call of the function in a span.
+
+    Args:
+        name (str): Name of the stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(name, wall, cpu, peak):
+    sink = getattr(_local, 'sink', None)
+    if sink is not None:
+        sink.append((name, wall, cpu, peak))
+        return
+    with _lock:
+        stats = _stats.setdefault(name, {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'max_wall_s': 0.0, 'last_wall_s': 0.0, 'peak_bytes': 0})
+        stats['count'] += 1
+        stats['wall_s'] += wall
+        stats['cpu_s'] += cpu
+        stats['max_wall_s'] = max(stats['max_wall_s'], wall)
+        stats['last_wall_s'] = wall
+        stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+
+
+def record(name, wall, cpu=0.0, peak=0):
+    """
+    Adds a measurement which was taken outside of a span, e.g. in a worker process.
+
+    Args:
+        name (str): Name of the stage.
+        wall (float): Wall time in seconds.
+        cpu (float): CPU time in seconds.
+        peak (int): Memory peak in bytes.
+    """
+    _record(name, wall, cpu, peak)
+
+
+@contextmanager
+def collect():
+    """
+    Collects the measurements of the spans of the current thread in a list instead of adding them to the statistics.
+
+    Yields:
+        list: (name, wall, cpu, peak) per finished span, the arguments of record().
+    """
+    measurements = []
+    _local.sink = measurements
+    try:
+        yield measurements
+    finally:
+        _local.sink = None
+
+
+def snapshot():
+    """
+    Returns a copy of the aggregated statistics.
+
+    Returns:
+        dict: Span name -> dict with count, wall_s, cpu_s, max_wall_s, last_wall_s and peak_bytes.
+    """
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def reset():
+    """
+    Removes all recorded statistics.
+    """
+    with _lock:
+        _stats.clear()
+
+
+def export_json():
+    """
+    Returns the statistics as a JSON string.
+    """
+    return json.dumps(snapshot(), indent=4, sort_keys=True)
+
+
+def export_prometheus():
+    """
+    Returns the statistics in the Prometheus text exposition format.
+    """
+    metrics = [
+        ('pubmed_span_calls_total', 'counter', 'Number of calls of the stage.', 'count'),
+        ('pubmed_span_wall_seconds_total', 'counter', 'Total wall time of the stage.', 'wall_s'),
+        ('pubmed_span_cpu_seconds_total', 'counter', 'Total CPU time of the stage.', 'cpu_s'),
+        ('pubmed_span_wall_seconds_max', 'gauge', 'Longest wall time of one call of the stage.', 'max_wall_s'),
+        ('pubmed_span_peak_bytes', 'gauge', 'Largest memory peak of one call of the stage (needs PUBMED_TRACE_MEMORY=1).', 'peak_bytes'),
+    ]
+    stats = snapshot()
+    lines = []
+    for metric, kind, description, field in metrics:
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name in sorted(stats):
+            lines.append(f'{metric}{{span="{name}"}} {stats[name][field]}')
+    return '\n'.join(lines) + '\n'
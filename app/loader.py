@@ -0,0 +1,83 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Loading of the processed paper files.
+
+The files are read in chunks on a thread pool and decoded with orjson if it is installed. Only the fields the tabs use are kept,
+which drops the abstracts and the rarely used MEDLINE tags from memory. Only the fast Title Embeddings map compares the
+abstracts, it reads them separately with read_abstracts(). iter_records() is a generator, so the caller gets the
+first chunk of records while the remaining files are still being read. The app uses this only for the progress bar: the tabs
+render from the complete dataset, since their statistics, the dataset fingerprint and the columnar tables are computed over
+all records.
+"""
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, the standard library decoder gives the same result
+    _loads = json.loads
+
+# Fields used by the Summary, Author Network and Title Embeddings tabs. The per author affiliation keys '<author>_AD' are kept as well.
+TAB_FIELDS = frozenset(['PMID', 'TI', 'DP', 'FAU', 'GR', 'AD', 'JT', 'TA', 'LA', 'PT', 'MH', 'OT'])
+
+
+def read_record(file_name, fields=TAB_FIELDS):
+    """
+    Reads one processed paper file.
+
+    Args:
+        file_name (str): Path of the JSON file.
+        fields (frozenset): Fields to keep, or None to keep all fields.
+
+    Returns:
+        dict: The parsed record.
+    """
+    with open(file_name, 'rb') as file:
+        record = _loads(file.read())
+    if fields is None:
+        return record
+    return {key: value for key, value in record.items() if key in fields or key.endswith('_AD')}
+
+
+def read_abstracts(dir_name):
+    """
+    Reads the abstracts of the processed paper files of an author, which the tab records do not keep.
+
+    Args:
+        dir_name (str): Directory of the processed paper files.
+
+    Returns:
+        dict: PMID -> abstract, for the papers which have one.
+    """
+    file_names = [os.path.join(dir_name, file_name) for file_name in os.listdir(dir_name)]
+    abstracts = {}
+    for chunk in iter_records(file_names, fields=frozenset(['PMID', 'AB'])):
+        for record in chunk:
+            if record.get('PMID') and record.get('AB'):
+                abstracts[record['PMID'][0]] = ' '.join(record['AB'])
+    return abstracts
+
+
+def _read_chunk(file_names, fields):
+    return [read_record(file_name, fields) for file_name in file_names]
+
+
+def iter_records(file_names, fields=TAB_FIELDS, workers=8, chunk_size=64):
+    """
+    Reads paper files in parallel and yields them chunk by chunk in the order of file_names.
+
+    Args:
+        file_names (list): Paths of the JSON files.
+        fields (frozenset): Fields to keep, or None to keep all fields.
+        workers (int): Number of reader threads.
+        chunk_size (int): Number of files per chunk.
+
+    Yields:
+        list: The records of the next chunk.
+    """
+    chunks = [file_names[i:i + chunk_size] for i in range(0, len(file_names), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map submits all chunks at once and returns the results in order as soon as they are ready
+        yield from executor.map(_read_chunk, chunks, [fields] * len(chunks))
@@ -0,0 +1,45 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, only the lock table of the process is used there
+    fcntl = None
+
+"""
+Named locks shared by the threads of the server process and, through lock files, by other processes on the same machine.
+
+A crawl of an author holds the lock of the author, so two sessions searching the same new author at the same time do not
+fetch the same pages twice: the second one waits until the first has finished and then uses its results.
+"""
+
+_table_lock = threading.Lock()
+_locks = {}  # name -> threading.Lock
+
+
+def _thread_lock(name):
+    with _table_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+
+@contextmanager
+def named_lock(name, lock_dir='results/.locks'):
+    """
+    Holds the lock of a name, waiting until other holders have released it.
+
+    Args:
+        name (str): Name of the lock, e.g. the directory name of an author.
+        lock_dir (str): Directory of the lock files.
+    """
+    with _thread_lock(name):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f'{name}.lock'), 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
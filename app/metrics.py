@@ -0,0 +1,307 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
+from instrument import traced
+
+"""
+Centrality metrics for the co-author graph.
+
+Exact betweenness and closeness are O(VE), which is far too slow for authors with thousands of collaborators.
+This module therefore uses pivot sampling for betweenness and closeness, sparse power iteration for PageRank and
+eigenvector centrality and a batched peeling for the k-core numbers. Every metric is timed and the results are cached
+per graph hash, so a rerun of the Streamlit script does not compute anything twice.
+
+The co-author graph of a set of papers is built here as well, so the API and the benchmarks use it without importing
+the Streamlit page.
+"""
+
+# Number of (graph, metric, pivots) results kept, the least recently used are dropped
+CACHE_SIZE = 64
+# Cache of computed metrics, keyed by (graph hash, metric name, parameters)
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def get_authors(data):
+    """
+    Extracts authors from the given data.
+    Args:
+        data (list): A list of dictionaries containing author information.
+    Returns:
+        list: A list of authors.
+    """
+    authors = []
+    for entry in data:
+        authors.append(entry['FAU'])
+    return authors
+
+
+@traced('network.build_graph')
+def build_graph(data):
+    """
+    Builds the co-author graph. Each edge stores in 'papers' the number of papers the two authors share.
+    Args:
+        data (list): A list of dictionaries containing author information.
+    Returns:
+        nx.Graph: The co-author graph.
+    """
+    G = nx.Graph()
+    # Construct the graph by adding edges between authors in the same list
+    for author_list in get_authors(data):
+        for i in range(len(author_list)):
+            for j in range(i + 1, len(author_list)):
+                if G.has_edge(author_list[i], author_list[j]):
+                    G[author_list[i]][author_list[j]]['papers'] += 1
+                else:
+                    G.add_edge(author_list[i], author_list[j], papers=1)
+    return G
+
+
+def graph_hash(G):
+    """
+    Computes a stable hash of the graph structure, independent of the insertion order of nodes and edges.
+
+    Args:
+        G (nx.Graph): The co-author graph.
+
+    Returns:
+        str: Hex digest identifying the graph.
+    """
+    h = hashlib.sha1()
+    for node in sorted(G.nodes()):
+        h.update(node.encode('utf-8'))
+        h.update(b'\0')
+    h.update(b'\1')
+    for u, v in sorted(tuple(sorted(edge)) for edge in G.edges()):
+        h.update(f'{u}\0{v}\0'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def to_csr(G):
+    """
+    Converts the graph into a node list and an unweighted, symmetric CSR adjacency matrix.
+
+    Args:
+        G (nx.Graph): The co-author graph.
+
+    Returns:
+        tuple: (nodes, A) where nodes is the list of node names and A the scipy CSR matrix in the same order.
+    """
+    nodes = list(G.nodes())
+    if G.number_of_edges() == 0:  # networkx raises for a graph without nodes
+        return nodes, sparse.csr_matrix((len(nodes), len(nodes)), dtype=np.float64)
+    A = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, format='csr').astype(np.float64)
+    return nodes, sparse.csr_matrix(A)
+
+
+def sampled_betweenness(G, k=100, seed=42):
+    """
+    Approximates betweenness centrality by accumulating shortest paths from k random pivots (Brandes & Pich).
+
+    Args:
+        G (nx.Graph): The co-author graph.
+        k (int): Number of pivots. If the graph has fewer nodes, the exact value is computed.
+        seed (int): Seed for the pivot selection to keep results reproducible.
+
+    Returns:
+        dict: Node name -> betweenness centrality.
+    """
+    n = G.number_of_nodes()
+    if n <= k:
+        return nx.betweenness_centrality(G)
+    return nx.betweenness_centrality(G, k=k, seed=seed)
+
+
+def sampled_closeness(nodes, A, k=100, seed=42):
+    """
+    Approximates closeness centrality from the BFS distances of k random pivots (Eppstein & Wang).
+    For graphs with at most k nodes the result is exact and uses the same Wasserman-Faust scaling as networkx.
+
+    Args:
+        nodes (list): Node names in matrix order.
+        A (scipy.sparse.csr_matrix): Adjacency matrix.
+        k (int): Number of pivots.
+        seed (int): Seed for the pivot selection.
+
+    Returns:
+        dict: Node name -> closeness centrality.
+    """
+    n = A.shape[0]
+    if n < 2:
+        return {node: 0.0 for node in nodes}
+    rng = np.random.default_rng(seed)
+    pivots = np.arange(n) if n <= k else rng.choice(n, size=k, replace=False)
+    # Distances from every pivot to every node, inf where unreachable
+    dist = csgraph.shortest_path(A, method='D', unweighted=True, directed=False, indices=pivots)
+    reachable = np.isfinite(dist) & (dist > 0)
+    reached = reachable.sum(axis=0)
+    total = np.where(reachable, dist, 0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Fraction of the pivots which reach the node scales the estimate for disconnected graphs
+        scale = reached / len(pivots) * (n - 1) if n > k else reached
+        closeness = np.where(total > 0, (reached / total) * (scale / (n - 1)), 0.0)
+    return dict(zip(nodes, closeness.tolist()))
+
+
+def pagerank(nodes, A, alpha=0.85, tol=1e-8, max_iter=100):
+    """
+    Computes PageRank by power iteration on the sparse, row-normalized adjacency matrix.
+
+    Args:
+        nodes (list): Node names in matrix order.
+        A (scipy.sparse.csr_matrix): Adjacency matrix.
+        alpha (float): Damping factor.
+        tol (float): L1 convergence threshold.
+        max_iter (int): Maximum number of iterations.
+
+    Returns:
+        dict: Node name -> PageRank score.
+    """
+    n = A.shape[0]
+    if n == 0:
+        return {}
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    # Transition matrix transposed, so one step is a single sparse matrix-vector product
+    P = sparse.diags(inv_degree) @ A
+    PT = P.T.tocsr()
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_prev = x
+        x = alpha * (PT @ x_prev + x_prev[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - x_prev).sum() < n * tol:
+            break
+    return dict(zip(nodes, (x / x.sum()).tolist()))
+
+
+def eigenvector(nodes, A, tol=1e-8, max_iter=200):
+    """
+    Computes eigenvector centrality by sparse power iteration. The matrix is shifted by the identity, which keeps the
+    iteration from oscillating on bipartite components without changing the leading eigenvector.
+
+    Args:
+        nodes (list): Node names in matrix order.
+        A (scipy.sparse.csr_matrix): Adjacency matrix.
+        tol (float): L1 convergence threshold.
+        max_iter (int): Maximum number of iterations.
+
+    Returns:
+        dict: Node name -> eigenvector centrality (euclidean norm 1), 0 for nodes without edges.
+    """
+    n = A.shape[0]
+    if n == 0:
+        return {}
+    # isolated nodes keep their start value under the shift, they are 0 in the leading eigenvector
+    connected = np.asarray(A.sum(axis=1)).ravel() > 0
+    if not connected.any():
+        return {node: 0.0 for node in nodes}
+    x = np.where(connected, 1.0 / n, 0.0)
+    for _ in range(max_iter):
+        x_prev = x
+        x = A @ x_prev + x_prev
+        norm = np.linalg.norm(x)
+        if norm == 0:
+            break
+        x = x / norm
+        if np.abs(x - x_prev).sum() < n * tol:
+            break
+    return dict(zip(nodes, x.tolist()))
+
+
+def core_numbers(nodes, A):
+    """
+    Computes the k-core number of every node by batched peeling. Instead of removing one node at a time, all nodes whose
+    remaining degree is at most k are removed at once and the degrees are updated with one sparse matrix-vector product.
+
+    Args:
+        nodes (list): Node names in matrix order.
+        A (scipy.sparse.csr_matrix): Adjacency matrix without self loops.
+
+    Returns:
+        dict: Node name -> core number.
+    """
+    n = A.shape[0]
+    A = A.copy()
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A.data[:] = 1
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    core = np.zeros(n, dtype=np.int64)
+    remaining = np.ones(n, dtype=bool)
+    k = 0
+    while remaining.any():
+        peel = remaining & (degree <= k)
+        if not peel.any():
+            # Jump straight to the next degree that can be peeled
+            k = int(degree[remaining].min())
+            continue
+        core[peel] = k
+        remaining &= ~peel
+        degree = degree - A @ peel.astype(np.float64)
+    return dict(zip(nodes, core.tolist()))
+
+
+METRICS = {
+    'Degree': lambda G, nodes, A, k: nx.degree_centrality(G),
+    'Betweenness': lambda G, nodes, A, k: sampled_betweenness(G, k=k),
+    'Closeness': lambda G, nodes, A, k: sampled_closeness(nodes, A, k=k),
+    'PageRank': lambda G, nodes, A, k: pagerank(nodes, A),
+    'Eigenvector': lambda G, nodes, A, k: eigenvector(nodes, A),
+    'Core Number': lambda G, nodes, A, k: core_numbers(nodes, A),
+}
+
+
+def compute_metrics(G, k=100, metrics=None):
+    """
+    Computes the requested centrality metrics. Each metric is timed and cached per graph hash and pivot count, the cache
+    keeps the CACHE_SIZE most recently used results.
+
+    Args:
+        G (nx.Graph): The co-author graph.
+        k (int): Number of pivots for the sampled metrics.
+        metrics (list): Names from METRICS to compute. Defaults to all of them.
+
+    Returns:
+        tuple: (metrics_df, timings_df) where metrics_df has one column per metric indexed by author and
+               timings_df contains the computation time of each metric in seconds.
+    """
+    metrics = list(METRICS) if metrics is None else metrics
+    if G.number_of_nodes() == 0:  # e.g. an author with single-author papers only
+        metrics_df = pd.DataFrame({name: pd.Series(dtype=np.float64) for name in metrics})
+        metrics_df.index.name = 'Author'
+        timings_df = pd.DataFrame({'Seconds': [0.0] * len(metrics)}, index=pd.Index(metrics, name='Metric'))
+        return metrics_df, timings_df
+    key = graph_hash(G)
+    nodes, A = None, None
+    columns = {}
+    timings = []
+    for name in metrics:
+        cache_key = (key, name, k)
+        with _CACHE_LOCK:
+            cached = _CACHE.get(cache_key)
+            if cached is not None:
+                _CACHE.move_to_end(cache_key)
+        if cached is None:
+            if A is None:
+                nodes, A = to_csr(G)
+            start = time.perf_counter()
+            cached = (METRICS[name](G, nodes, A, k), time.perf_counter() - start)
+            with _CACHE_LOCK:
+                _CACHE[cache_key] = cached
+                while len(_CACHE) > CACHE_SIZE:
+                    _CACHE.popitem(last=False)
+        values, seconds = cached
+        columns[name] = values
+        timings.append((name, seconds))
+
+    metrics_df = pd.DataFrame(columns)
+    metrics_df.index.name = 'Author'
+    timings_df = pd.DataFrame(timings, columns=['Metric', 'Seconds']).set_index('Metric')
+    return metrics_df, timings_df
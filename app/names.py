@@ -0,0 +1,327 @@
+import os
+import re
+import json
+import unicodedata
+from collections import defaultdict
+
+"""
+Author name normalization and disambiguation.
+
+PubMed lists the same person under several spellings ('Müller, Anna', 'Muller, Anna M', 'Müller, A') and different
+people under the same name. Names are therefore normalized (no diacritics, case or punctuation) and blocked by last name
+plus first initial. All lookups are hash lookups into these blocks and only the few names within a block are compared.
+Within a block, authorships are clustered into persons by compatible first names plus a shared co-author or affiliation.
+The index of the whole local corpus is extended when a crawl is ingested and stored in results/_names, so the Summary tab
+loads it instead of reading every processed paper.
+"""
+
+_PUNCTUATION = re.compile(r'[^\w\s-]')
+_SPACES = re.compile(r'[\s-]+')
+# Words which carry no information about the institution of an affiliation
+_STOP_WORDS = frozenset(['of', 'and', 'the', 'for', 'de', 'der', 'und', 'department', 'dept', 'institute', 'university', 'center', 'centre', 'school'])
+
+
+def strip_accents(text):
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+
+def split_name(name):
+    """
+    Normalizes a 'Last, First Middle' name.
+
+    Args:
+        name (str): Author name as in 'FAU'.
+
+    Returns:
+        tuple: (last, firsts) with the normalized last name and the list of normalized first and middle names or initials.
+    """
+    last, _, first = strip_accents(name).lower().partition(',')
+    last = _SPACES.sub(' ', _PUNCTUATION.sub('', last)).strip()
+    first = _SPACES.sub(' ', _PUNCTUATION.sub(' ', first)).strip()
+    return last, first.split() if first else []
+
+
+def name_key(name):
+    """
+    Returns the normalized full name, equal for spellings which only differ in diacritics, case or punctuation.
+    """
+    last, firsts = split_name(name)
+    return f'{last}|{" ".join(firsts)}'
+
+
+def block_key(name):
+    """
+    Returns the blocking key, the normalized last name and the first initial. All variants of a name share it.
+    """
+    last, firsts = split_name(name)
+    return f'{last}|{firsts[0][0] if firsts else ""}'
+
+
+def compatible(name_a, name_b):
+    """
+    Checks whether two names can belong to the same person: same last name and every first or middle name of one is
+    equal to, or abbreviated by, the name at the same position of the other ('Smith, J' and 'Smith, John A').
+
+    Args:
+        name_a (str): First name in 'Last, First' form.
+        name_b (str): Second name in 'Last, First' form.
+
+    Returns:
+        bool: Whether the names are compatible.
+    """
+    last_a, firsts_a = split_name(name_a)
+    last_b, firsts_b = split_name(name_b)
+    if last_a != last_b:
+        return False
+    for a, b in zip(firsts_a, firsts_b):
+        if not (a == b or (len(a) == 1 and b.startswith(a)) or (len(b) == 1 and a.startswith(b))):
+            return False
+    return True
+
+
+def affiliation_tokens(affiliations):
+    """
+    Returns the informative words of affiliations, used as the affiliation signature of an authorship.
+    """
+    tokens = set()
+    for affiliation in affiliations:
+        for token in _SPACES.split(_PUNCTUATION.sub(' ', strip_accents(affiliation).lower())):
+            if len(token) > 2 and token not in _STOP_WORDS and not token.isdigit() and '@' not in token:
+                tokens.add(token)
+    return frozenset(tokens)
+
+
+class NameIndex:
+    """
+    Index of all authorships of a corpus by normalized name.
+
+    Attributes:
+        names (list): Name of every authorship as in 'FAU'.
+        pmids (list): PMID of every authorship.
+        coauthors (list): Block keys of the co-authors of every authorship (frozenset).
+        affiliations (list): Affiliation signature of every authorship (frozenset).
+        blocks (dict): Block key -> list of authorship ids.
+        keys (dict): Normalized full name -> list of authorship ids.
+        index_dir (str): Directory of the stored index.
+        ingested (set): Directory names of the crawled authors in the index.
+
+    Methods:
+        load(results_dir):
+            Loads the stored index, building it from all processed papers if it does not exist yet.
+
+        add(record):
+            Adds the authorships of a paper.
+
+        add_papers(records, dir_names):
+            Adds the authorships of papers and stores the index.
+
+        spellings(name):
+            Returns the compatible spellings of a name in the index.
+
+        lookup(name, variants):
+            Returns the authorship ids of a name, optionally including compatible variants.
+
+        cluster(name):
+            Separates the authorships of a name block into persons.
+    """
+
+    def __init__(self, index_dir='results/_names'):
+        self.index_dir = index_dir
+        self.ingested = set()
+        self.names = []
+        self.pmids = []
+        self.coauthors = []
+        self.affiliations = []
+        self.blocks = defaultdict(list)
+        self.keys = defaultdict(list)
+        self._seen = set()
+
+    @classmethod
+    def from_records(cls, records):
+        index = cls()
+        for record in records:
+            index.add(record)
+        return index
+
+    @property
+    def path(self):
+        return os.path.join(self.index_dir, 'names.json')
+
+    @classmethod
+    def load(cls, results_dir='results'):
+        """
+        Loads the index from disk. If no index has been stored yet, it is built once from all processed papers. Crawled
+        authors missing in the stored index are added in memory, they are stored with the next add_papers.
+
+        Args:
+            results_dir (str): Directory containing the crawled authors.
+
+        Returns:
+            NameIndex: The loaded index.
+        """
+        # Imported here, coauthor_graph imports numpy and scipy which the crawler processes do not need
+        from coauthor_graph import crawled_authors, iter_processed_papers
+        index = cls(os.path.join(results_dir, '_names'))
+        if not os.path.exists(index.path):
+            index.add_papers(iter_processed_papers(results_dir), crawled_authors(results_dir))
+            return index
+        with open(index.path, 'r') as file:
+            stored = json.load(file)
+        for authorship, (name, pmid, coauthors, affiliations) in enumerate(zip(stored['names'], stored['pmids'], stored['coauthors'], stored['affiliations'])):
+            index.names.append(name)
+            index.pmids.append(pmid)
+            index.coauthors.append(frozenset(coauthors))
+            index.affiliations.append(frozenset(affiliations))
+            index.blocks[block_key(name)].append(authorship)
+            index.keys[name_key(name)].append(authorship)
+        index._seen = set(index.pmids)
+        index.ingested = set(stored['ingested'])
+        missing = [dir_name for dir_name in crawled_authors(results_dir) if dir_name not in index.ingested]
+        for record in iter_processed_papers(results_dir, missing):
+            index.add(record)
+        index.ingested.update(missing)
+        return index
+
+    def add_papers(self, records, dir_names=()):
+        """
+        Adds the authorships of papers and stores the index.
+
+        Args:
+            records (iterable): Parsed PubMed records.
+            dir_names (list): Directory names of the crawled authors the papers belong to.
+        """
+        for record in records:
+            self.add(record)
+        self.ingested.update(dir_names)
+        self.save()
+
+    def save(self):
+        """
+        Stores the index in one JSON file, written to a temporary name first and then replaced.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump({
+                'names': self.names,
+                'pmids': self.pmids,
+                'coauthors': [sorted(coauthors) for coauthors in self.coauthors],
+                'affiliations': [sorted(tokens) for tokens in self.affiliations],
+                'ingested': sorted(self.ingested),
+            }, file, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+
+    def add(self, record):
+        """
+        Adds the authorships of a paper. Papers which were added before are skipped.
+
+        Args:
+            record (dict): Parsed PubMed record.
+        """
+        pmid = record.get('PMID', [None])[0]
+        if pmid in self._seen:
+            return
+        self._seen.add(pmid)
+        authors = record.get('FAU', [])
+        blocks = [block_key(author) for author in authors]
+        for author, block in zip(authors, blocks):
+            authorship = len(self.names)
+            self.names.append(author)
+            self.pmids.append(pmid)
+            self.coauthors.append(frozenset(blocks) - {block})
+            self.affiliations.append(affiliation_tokens(record.get(f'{author}_AD', [])))
+            self.blocks[block].append(authorship)
+            self.keys[name_key(author)].append(authorship)
+
+    def lookup(self, name, variants=False):
+        """
+        Returns the authorships of a name.
+
+        Args:
+            name (str): Author name in 'Last, First' form.
+            variants (bool): Include compatible spellings, e.g. initials instead of first names.
+
+        Returns:
+            list: Authorship ids.
+        """
+        if not variants:
+            return list(self.keys.get(name_key(name), []))
+        return [authorship for authorship in self.blocks.get(block_key(name), []) if compatible(name, self.names[authorship])]
+
+    def papers(self, name, variants=False):
+        """
+        Returns the PMIDs of the papers of a name, see lookup.
+        """
+        return sorted({self.pmids[authorship] for authorship in self.lookup(name, variants)})
+
+    def spellings(self, name):
+        """
+        Returns the spellings of a name in the index which the crawler counts as the same author, the names compatible
+        with it (see compatible). Only the names in the block of the name are compared.
+
+        Args:
+            name (str): Author name in 'Last, First' form.
+
+        Returns:
+            frozenset: The compatible names, name itself included.
+        """
+        candidates = {self.names[authorship] for authorship in self.blocks.get(block_key(name), [])}
+        return frozenset(other for other in candidates if compatible(name, other)) | {name}
+
+    def cluster(self, name, min_affiliation_overlap=0.3):
+        """
+        Separates the authorships compatible with a name into persons. Two authorships are merged if their names are
+        compatible and they share a co-author or their affiliation signatures overlap (Jaccard >= min_affiliation_overlap).
+
+        Args:
+            name (str): Author name in 'Last, First' form.
+            min_affiliation_overlap (float): Minimum Jaccard similarity of the affiliation signatures.
+
+        Returns:
+            list: One dict per person with 'names' (spellings and their counts) and 'pmids', the largest first.
+        """
+        ids = self.lookup(name, variants=True)
+        parent = {authorship: authorship for authorship in ids}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        # Link authorships through shared co-authors and affiliation words, compatible names only
+        by_coauthor = defaultdict(list)
+        by_token = defaultdict(list)
+        for authorship in ids:
+            for coauthor in self.coauthors[authorship]:
+                by_coauthor[coauthor].append(authorship)
+            for token in self.affiliations[authorship]:
+                by_token[token].append(authorship)
+        candidates = set()
+        for group in list(by_coauthor.values()) + list(by_token.values()):
+            # chain authorships with the same spelling and pair them with one authorship of every other spelling
+            representatives = {}
+            for authorship in group:
+                key = name_key(self.names[authorship])
+                others = [representatives[key]] if key in representatives else list(representatives.values())
+                for other in others:
+                    candidates.add((other, authorship))
+                representatives[key] = authorship
+        for a, b in candidates:
+            if find(a) == find(b) or not compatible(self.names[a], self.names[b]):
+                continue
+            shared_coauthor = bool(self.coauthors[a] & self.coauthors[b])
+            union = self.affiliations[a] | self.affiliations[b]
+            overlap = len(self.affiliations[a] & self.affiliations[b]) / len(union) if union else 0
+            if shared_coauthor or overlap >= min_affiliation_overlap:
+                parent[find(a)] = find(b)
+
+        clusters = defaultdict(list)
+        for authorship in ids:
+            clusters[find(authorship)].append(authorship)
+        persons = []
+        for members in clusters.values():
+            spellings = defaultdict(int)
+            for authorship in members:
+                spellings[self.names[authorship]] += 1
+            persons.append({'names': dict(spellings), 'pmids': sorted({self.pmids[authorship] for authorship in members})})
+        return sorted(persons, key=lambda person: len(person['pmids']), reverse=True)
@@ -1,46 +1,37 @@
+import os
 import streamlit as st
 import pandas as pd
 import networkx as nx
 import plotly.graph_objects as go
+from metrics import compute_metrics, build_graph
+from coauthor_graph import CoauthorGraph, graph_path
+from aggregate import dataset_fingerprint
+from temporal import TemporalNetwork
+from instrument import span
 
-def get_authors(data):
-    """
-    Extracts authors from the given data.
-    Args:
-        data (list): A list of dictionaries containing author information.
-    Returns:
-        list: A list of authors.
-    """
-    authors = []
-    for entry in data:
-        authors.append(entry['FAU'])
-    return authors
+# Largest ego network which is drawn, larger ones keep the authors with the most shared papers
+MAX_EGO_NODES = 300
 
-def plot_network(data):
+def plot_network(data, G=None):
     """
     Constructs a network graph from author data and visualizes it.
     Args:
         data (list): A list of dictionaries containing author information.
+        G (nx.Graph): The co-author graph of the data, if it has been built already.
     Returns:
         go.Figure: A Plotly figure object representing the network graph.
     """
-    # Get the authors from the data
-    authors = get_authors(data)
-    
-    # Initialize the graph
-    G = nx.Graph()
-    
-    # Construct the graph by adding edges between authors in the same list
-    for author_list in authors:
-        for i in range(len(author_list)):
-            for j in range(i + 1, len(author_list)):
-                G.add_edge(author_list[i], author_list[j])
+    # Build the co-author graph from the data
+    if G is None:
+        G = build_graph(data)
 
     # Detect communities within the graph
-    communities = list(nx.algorithms.community.greedy_modularity_communities(G))
-    
-    # Modularity Calculation
-    modularity = nx.algorithms.community.modularity(G, communities)
+    with span('network.communities'):
+        # a graph without edges (only single-author papers) has no communities, its modularity is not defined
+        communities = list(nx.algorithms.community.greedy_modularity_communities(G)) if G.number_of_edges() else []
+        
+        # Modularity Calculation
+        modularity = nx.algorithms.community.modularity(G, communities) if communities else 0.0
     
     # Create results DataFrame
     results_df = pd.DataFrame({
@@ -56,9 +47,25 @@ def plot_network(data):
     most_centered_nodes_score = [centrality for node, centrality in sorted_centrality]
     
     # Prepare network plot
-    pos = nx.spring_layout(G, seed=42, k=0.15, iterations=50)
+    with span('network.layout'):
+        pos = nx.spring_layout(G, seed=42, k=0.15, iterations=50)
+    fig = draw_network(G, pos, most_centered_nodes)
+    return fig, results_df
+
+
+def draw_network(G, pos, labeled_nodes, height=800):
+    """
+    Draws the network with nodes sized and colored by their degree.
+    Args:
+        G (nx.Graph): The co-author graph.
+        pos (dict): Node -> (x, y) position.
+        labeled_nodes (list): Nodes which get a name label.
+        height (int): Height of the figure in pixels.
+    Returns:
+        go.Figure: A Plotly figure object representing the network graph.
+    """
     node_degree = [G.degree(n) for n in G.nodes()]
-    max_degree = max(node_degree)
+    max_degree = max(node_degree, default=0) or 1
     node_sizes = [10 + 40 * (deg / max_degree) for deg in node_degree]
     
     # Create edge traces for the network
@@ -106,7 +113,7 @@ def plot_network(data):
     # Create the final figure
     fig = go.Figure(data=[edge_trace, node_trace],
                     layout=go.Layout(
-                        height=800,
+                        height=height,
                         showlegend=False,
                         hovermode='closest',
                         margin=dict(b=0, l=0, r=0, t=40),
@@ -116,7 +123,7 @@ def plot_network(data):
                 )
     
     # Add annotations for center nodes
-    for node in most_centered_nodes:
+    for node in labeled_nodes:
         if node in G.nodes():
             x, y = pos[node]
             fig.add_annotation(
@@ -128,7 +135,7 @@ def plot_network(data):
                 opacity=0.9,
             )
     
-    return fig, results_df
+    return fig
 
 
 def show_page(data):
@@ -136,8 +143,9 @@ def show_page(data):
     # make a green box for text, which says that the network analysis is being performed
 
     with st.spinner("Please wait..."):
-        # Display the network plot
-        fig_network, results_df = plot_network(data)
+        # Display the network plot. The graph is built once and reused for the centrality metrics below.
+        G = build_graph(data)
+        fig_network, results_df = plot_network(data, G)
 
     st.dataframe(results_df, use_container_width=True)
 
@@ -206,3 +214,143 @@ def show_page(data):
         This plot reveals collaboration patterns, highlighting key individuals, core groups, and peripheral members in the network.
     """)
     st.plotly_chart(fig_network, use_container_width=True)
+
+    st.markdown("""
+        ## Centrality Metrics
+        Besides the degree, the following metrics describe how central an author is in the network:
+        - **Betweenness**: How often an author lies on the shortest path between two other authors. For large networks this is estimated from a sample of pivot authors.
+        - **Closeness**: How close an author is to all other authors. For large networks this is also estimated from pivot authors.
+        - **PageRank / Eigenvector**: An author is central if they are connected to other central authors.
+        - **Core Number**: The largest k for which the author belongs to a group in which everyone has at least k collaborators in the group.
+    """)
+    pivots = st.slider('Number of pivot authors for the sampled metrics', min_value=10, max_value=500, value=100, step=10)
+    with st.spinner("Computing centrality metrics..."):
+        with span('network.metrics'):
+            metrics_df, timings_df = compute_metrics(G, k=pivots)
+    metric = st.selectbox('Sort by metric', list(metrics_df.columns))
+    st.dataframe(metrics_df.sort_values(metric, ascending=False).head(10), use_container_width=True)
+    with st.expander('Computation time of the metrics'):
+        st.dataframe(timings_df, use_container_width=True)
+
+    show_temporal_network(data)
+
+    st.markdown("""
+        ## How Are Two Authors Connected?
+        This uses the co-author graph of all authors that have been searched in this app so far, not only the papers of the current author.
+        It shows the shortest chain of co-authorships between two authors.
+    """)
+    col_a, col_b = st.columns(2)
+    author_a = col_a.text_input('Author A (Last, First)', value=st.session_state.get('name', ''))
+    author_b = col_b.text_input('Author B (Last, First)')
+    if author_a and author_b:
+        path = load_global_graph().shortest_path(author_a.strip(), author_b.strip())
+        if path:
+            st.write(' → '.join(path) + f' ({len(path) - 1} steps)')
+        else:
+            st.write('These authors are not connected in the local data.')
+
+    st.markdown("""
+        ## Ego Network
+        The co-authors of an author in the co-author graph of all authors searched so far, with two steps also the
+        co-authors of the co-authors. Large ego networks are reduced to the authors with the most shared papers.
+    """)
+    col_ego, col_radius = st.columns([3, 1])
+    ego = col_ego.text_input('Ego network of (Last, First)', value=st.session_state.get('name', ''))
+    radius = col_radius.selectbox('Co-author steps', [1, 2])
+    if ego:
+        with span('network.ego'):
+            fig_ego = plot_ego_network(load_global_graph(), ego.strip(), radius)
+        if fig_ego is None:
+            st.write('This author is not in the local data.')
+        else:
+            st.plotly_chart(fig_ego, use_container_width=True)
+
+
+def plot_ego_network(graph, author, radius=1, max_nodes=MAX_EGO_NODES):
+    """
+    Draws the ego network of an author in the global co-author graph.
+    Args:
+        graph (CoauthorGraph): The global co-author graph.
+        author (str): Author name as it appears in 'FAU'.
+        radius (int): Maximum number of co-author steps from the author.
+        max_nodes (int): Maximum number of drawn authors, the author included.
+    Returns:
+        go.Figure: The network, or None if the author is not in the graph.
+    """
+    authors, edges = graph.ego_network(author, radius)
+    if not authors:
+        return None
+    G = nx.Graph()
+    G.add_nodes_from(authors)
+    G.add_weighted_edges_from(edges, weight='papers')
+    if G.number_of_nodes() > max_nodes:
+        shared = dict(G.degree(weight='papers'))
+        keep = sorted((node for node in G.nodes() if node != author), key=shared.get, reverse=True)[:max_nodes - 1]
+        G = G.subgraph(keep + [author]).copy()
+    pos = nx.spring_layout(G, seed=42)
+    return draw_network(G, pos, [author], height=600)
+
+
+@st.cache_resource(max_entries=4)
+def get_temporal_network(fingerprint, _data):
+    """
+    Builds the per-year co-author snapshots of a dataset once. They are shared by all sessions, so the cached communities
+    and centrality of every year are computed only once.
+    Args:
+        fingerprint (str): Fingerprint of the dataset, see aggregate.dataset_fingerprint.
+        _data (list): The papers of the dataset, not hashed.
+    Returns:
+        TemporalNetwork: The snapshots.
+    """
+    return TemporalNetwork(_data)
+
+
+def show_temporal_network(data):
+    """
+    Shows the co-author network of a selected year, cumulative or of a window of years.
+    Args:
+        data (list): A list of dictionaries containing author information.
+    """
+    st.markdown("""
+        ## Network Over Time
+        The co-author network of the papers published up to the selected year, or only within a window of years before it.
+        Authors keep their position of the complete network, so it is easy to see how the network grew.
+    """)
+    network = get_temporal_network(dataset_fingerprint(data), data)
+    if len(network.years) < 2:
+        st.write('The papers of this author do not span several years.')
+        return
+    col_mode, col_window = st.columns(2)
+    mode = col_mode.radio('Snapshot', ['Cumulative', 'Window'], horizontal=True)
+    window = col_window.slider('Window (years)', min_value=1, max_value=10, value=3) if mode == 'Window' else None
+    end = st.slider('Year', min_value=network.years[0], max_value=network.years[-1], value=network.years[-1])
+
+    with st.spinner('Computing the snapshot...'):
+        stats = network.stats(end, window)
+        pos = network.layout()
+        labeled_nodes = [node for node, _, _ in stats['central']]
+        # drawn from the live graph, copying it for every step of the slider would be slower than rebuilding it
+        with network.view(end, window) as G:
+            fig = draw_network(G, pos, labeled_nodes, height=600)
+    st.dataframe(pd.DataFrame({
+        'Metric': ['Authors', 'Co-author Pairs', 'New Authors in this Year', 'Number of Communities', 'Modularity'],
+        'Value': [stats['nodes'], stats['edges'], stats['new_authors'], len(stats['communities']), round(stats['modularity'], 3)],
+    }).set_index('Metric'), use_container_width=True)
+    st.plotly_chart(fig, key='temporal_network', use_container_width=True)
+    st.dataframe(pd.DataFrame(stats['central'], columns=['Author', 'Degree Centrality', 'PageRank']), use_container_width=True)
+    timeline = pd.DataFrame(network.timeline(window), columns=['Year', 'Authors', 'Co-author Pairs'])
+    st.line_chart(timeline.set_index('Year'))
+
+
+def load_global_graph():
+    """
+    Loads the global co-author graph once per session. It is reloaded when new papers were ingested.
+    Returns:
+        CoauthorGraph: The global co-author graph.
+    """
+    path = graph_path()
+    version = os.path.getmtime(path) if os.path.exists(path) else None
+    if st.session_state.get('global_graph_version') != version or 'global_graph' not in st.session_state:
+        st.session_state.global_graph = CoauthorGraph.load()
+        st.session_state.global_graph_version = os.path.getmtime(path) if os.path.exists(path) else None
+    return st.session_state.global_graph
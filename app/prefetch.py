@@ -0,0 +1,215 @@
+import os
+import threading
+from collections import deque
+from time import monotonic
+from pubmed_crawler import SinglePubMedSearcher, RateLimiter, foreground
+from instrument import span
+
+"""
+Optional speculative prefetch of the top collaborators of a loaded author. With PUBMED_PREFETCH=N the app starts a
+background thread on the first script run. After an author has been loaded, the N collaborators with the most shared
+papers which have not been searched yet are queued and crawled one after another, so clicking through to one of them
+usually finds the results on disk.
+
+The prefetch runs at low priority:
+    - its requests are spaced by PUBMED_PREFETCH_RATE requests per second, on top of the crawler's own delays and the
+      shared E-utilities rate limit,
+    - at most PUBMED_PREFETCH_BUDGET requests are sent per hour,
+    - pages are parsed on the crawl thread instead of a process pool,
+    - a user search preempts it: the background crawl aborts at its next request, and the author is crawled again from
+      the start once no user search is running anymore.
+"""
+
+PREFETCH_AUTHORS = int(os.environ.get('PUBMED_PREFETCH', '0'))
+PREFETCH_BUDGET = int(os.environ.get('PUBMED_PREFETCH_BUDGET', '120'))
+PREFETCH_RATE = float(os.environ.get('PUBMED_PREFETCH_RATE', '0.5'))
+# Seconds without a user search before a preempted prefetch continues
+RESUME_DELAY = 5
+
+
+class Preempted(Exception):
+    """
+    Raised before a request of a background crawl when a user search is running.
+    """
+
+
+class BudgetExhausted(Preempted):
+    """
+    Raised before a request of a background crawl when the request budget of the hour is used up.
+    """
+
+
+def top_collaborators(tables, author, n=5):
+    """
+    Returns the collaborators with the most shared papers, the same ranking as the Summary tab.
+
+    Args:
+        tables (dict): Columnar tables of the author, see columnar.build_tables.
+        author (str): The searched author, who is left out.
+        n (int): Number of collaborators.
+
+    Returns:
+        list: Names of the collaborators, most shared papers first.
+    """
+    authorships = tables['authorships']
+    # every collaborator is counted once per paper, as in aggregate.aggregate
+    counts = authorships[['pmid', 'author']].drop_duplicates()['author'].value_counts()
+    return [name for name in counts.index if name != author][:n]
+
+
+class Prefetcher:
+    """
+    Crawls queued authors one at a time on a daemon thread, within a request budget and giving way to user searches.
+
+    Attributes:
+        top_n (int): Number of collaborators queued per loaded author.
+        budget (int): Maximum number of requests per hour.
+        rate_limiter (RateLimiter): Spaces the requests of the prefetch.
+        backend (str): Fetch backend, see SinglePubMedSearcher.
+        max_records (int): Maximum number of records fetched per author.
+        queue (deque): Authors waiting to be crawled.
+        done (list): Authors crawled by the prefetch.
+        failed (dict): Author -> error of crawls which failed.
+        requests (int): Number of requests sent.
+        preemptions (int): Number of crawls aborted for a user search or the budget.
+
+    Methods:
+        submit(authors):
+            Queues the authors which have not been searched yet.
+
+        status():
+            Returns the queue, the crawled authors and the used budget.
+    """
+
+    def __init__(self, top_n=PREFETCH_AUTHORS, budget=PREFETCH_BUDGET, rate=PREFETCH_RATE, backend=None, max_records=1000):
+        self.top_n = top_n
+        self.budget = budget
+        self.rate_limiter = RateLimiter(rate)
+        self.backend = backend
+        self.max_records = max_records
+        self.queue = deque()
+        self.done = []
+        self.failed = {}
+        self.requests = 0
+        self.preemptions = 0
+        self._sent = deque()  # times of the requests of the last hour
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @staticmethod
+    def _searched(author):
+        return os.path.exists(os.path.join('results', author.replace(', ', '_'), 'processed'))
+
+    def submit(self, authors):
+        """
+        Queues authors for the prefetch, at most top_n. Authors which have been searched, are queued or have failed
+        before are skipped. The newest submission goes first, it belongs to the author the user is looking at now.
+
+        Args:
+            authors (list): Author names ('Last, First'), most important first.
+        """
+        with self._condition:
+            new = [author for author in authors[:self.top_n]
+                   if author not in self.queue and author not in self.failed and not self._searched(author)]
+            self.queue.extendleft(reversed(new))
+            if new:
+                self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='prefetch')
+                self._thread.start()
+
+    def status(self):
+        with self._condition:
+            return {'queued': list(self.queue), 'done': list(self.done), 'failed': dict(self.failed),
+                    'requests': self.requests, 'requests_last_hour': len(self._sent), 'preemptions': self.preemptions}
+
+    def _budget_wait(self):
+        """
+        Returns the seconds until the budget allows the next request, 0 if it does now.
+        """
+        now = monotonic()
+        while self._sent and self._sent[0] <= now - 3600:
+            self._sent.popleft()
+        return 0 if len(self._sent) < self.budget else self._sent[0] + 3600 - now
+
+    def _on_request(self):
+        """
+        Called by the crawler before every request of a background crawl.
+        """
+        if foreground.active():
+            raise Preempted()
+        with self._condition:
+            if self._budget_wait():
+                raise BudgetExhausted()
+        self.rate_limiter.wait()
+        if foreground.active():  # a user search started while waiting
+            raise Preempted()
+        with self._condition:
+            self._sent.append(monotonic())
+            self.requests += 1
+
+    def _wait_for_turn(self):
+        """
+        Waits until no user search has run for RESUME_DELAY seconds and the budget allows a request.
+        """
+        while True:
+            foreground.wait_idle()
+            if not self._sleep_unless_searching(RESUME_DELAY):
+                continue
+            with self._condition:
+                wait = self._budget_wait()
+            if not wait:
+                return
+            self._sleep_unless_searching(wait)
+
+    @staticmethod
+    def _sleep_unless_searching(seconds):
+        """
+        Sleeps, returns False early if a user search starts.
+        """
+        with foreground.condition:
+            return not foreground.condition.wait_for(foreground.active, seconds)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.queue)
+                author = self.queue[0]
+            self._wait_for_turn()
+            if self._searched(author):  # searched by a user in the meantime
+                self._finish(author)
+                continue
+            searcher = SinglePubMedSearcher(author, backend=self.backend, max_records=self.max_records, parse_workers=0,
+                                            on_request=self._on_request, background=True)
+            try:
+                with span('prefetch.crawl'):
+                    searcher.search_author()
+            except Preempted:
+                with self._condition:
+                    self.preemptions += 1
+                continue  # the author stays first in the queue
+            except Exception as error:
+                self._finish(author, error)
+                continue
+            self._finish(author, done=True)
+
+    def _finish(self, author, error=None, done=False):
+        with self._condition:
+            if author in self.queue:
+                self.queue.remove(author)
+            if error is not None:
+                self.failed[author] = repr(error)
+            elif done:
+                self.done.append(author)
+
+
+def start_prefetcher():
+    """
+    Creates the prefetcher if PUBMED_PREFETCH is set to the number of collaborators to prefetch per author.
+
+    Returns:
+        Prefetcher: The prefetcher, or None if the prefetch is disabled.
+    """
+    if PREFETCH_AUTHORS <= 0:
+        return None
+    return Prefetcher()
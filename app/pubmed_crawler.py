@@ -3,8 +3,25 @@ import os
 import json
 import requests
 import random
-from time import sleep
+import shutil
+import tempfile
+import threading
+import functools
+from time import sleep, monotonic
+from contextlib import contextmanager
 from bs4 import BeautifulSoup
+from instrument import span, traced, record
+from crawl_pipeline import run_pipeline
+from locks import named_lock
+from names import block_key, compatible, NameIndex
+
+# Base URL of the PubMed search. Can be pointed at a local stand-in (see stub_server.py) for load tests.
+PUBMED_BASE_URL = os.environ.get('PUBMED_BASE_URL', 'https://pubmed.ncbi.nlm.nih.gov/')
+# Base URL of the NCBI E-utilities, used by the 'eutils' backend. NCBI_API_KEY raises the allowed rate from 3 to 10 requests per second.
+EUTILS_BASE_URL = os.environ.get('PUBMED_EUTILS_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/')
+NCBI_API_KEY = os.environ.get('NCBI_API_KEY')
+# Fetch backend of SinglePubMedSearcher: 'web' scrapes the search pages, 'eutils' uses ESearch and EFetch
+PUBMED_BACKEND = os.environ.get('PUBMED_BACKEND', 'web')
 
 class PubMedRecord:
     """
@@ -36,23 +53,30 @@ class PubMedRecord:
         self.parsed_raw = self._extract_all()
         self.parsed = self._sim_id_to_list()
     
-    def filter_abstract_4_names(self, author):
+    def filter_abstract_4_names(self, author, variants=False):
         """
         Filters the parsed data to retrieve entries associated with the specified author. Different people with the same name result can not be filtered easily.
 
         Args:
             author (str): The name of the author to filter by.
+            variants (bool): Also match spellings of the name which differ in diacritics, case or initials, see names.compatible.
 
         Returns:
             tuple: (filtered_chunks, index) where filtered_chunks is a list of records by the author,
                    and index is the position of the last non-matching author entry.
         """
-        filtered_chunks = [entry for entry in self.parsed if author in entry['FAU']]
+        if variants:
+            # Only names in the same block (last name and first initial) are compared
+            block = block_key(author)
+            matches = [any(block_key(name) == block and compatible(author, name) for name in entry.get('FAU', [])) for entry in self.parsed]
+        else:
+            matches = [author in set(entry.get('FAU', [])) for entry in self.parsed]
+        filtered_chunks = [entry for entry, match in zip(self.parsed, matches) if match]
         
         # Locate the last chunk that does not contain the author, to end further scraping if needed
         index = 0
-        for entry in self.parsed:
-            if author not in entry['FAU']:
+        for match in matches:
+            if not match:
                 break
             index += 1
         return filtered_chunks, index 
@@ -122,31 +146,265 @@ class PubMedRecord:
         return self.parsed
 
 
+def parse_page(page, author, variants=True):
+    """
+    Parses a fetched page into the records of the author. Runs in the parse processes of the crawl pipeline.
+
+    Args:
+        page (tuple): (page, raw, extension) as yielded by SinglePubMedSearcher.web_pages or eutils_pages.
+        author (str): The name of the author to filter by.
+        variants (bool): Also keep records listing a compatible spelling of the name, see names.compatible.
+
+    Returns:
+        list: The records of the author on the page.
+    """
+    _, raw, extension = page
+    with span('crawler.html_parse'):
+        text = BeautifulSoup(raw, 'html.parser').get_text() if extension == 'html' else raw
+    with span('crawler.record_parse'):
+        filtered_chunks, index = PubMedRecord(text).filter_abstract_4_names(author, variants)
+    return filtered_chunks
+
+
+def has_records(raw):
+    """
+    Checks whether a fetched page contains any record.
+    """
+    return re.search(r'\bPMID\s*-\s*\d+', raw) is not None
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1 / rate seconds apart. Shared by all threads using the same limiter.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            sleep(wait)
+
+
+_rate_limiters = {}  # (base URL, API key) -> RateLimiter
+_rate_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(base_url, api_key):
+    """
+    Returns the rate limiter of an E-utilities endpoint and API key. NCBI limits the requests per key (or IP address), so
+    all clients of the process using the same key share one limiter.
+    """
+    with _rate_limiters_lock:
+        key = (base_url, api_key)
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(10 if api_key else 3)
+        return _rate_limiters[key]
+
+
+class ForegroundSearches:
+    """
+    Counts the searches started by users in this process. Background crawls (see prefetch.py) check it before every
+    request and give way while a user search is running.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def search(self):
+        with self.condition:
+            self.running += 1
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
+
+    def active(self):
+        return self.running > 0
+
+    def wait_idle(self, timeout=None):
+        """
+        Waits until no user search is running. Returns False if the timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.running == 0, timeout)
+
+
+foreground = ForegroundSearches()
+
+
+class EUtilsClient:
+    """
+    Client of the NCBI E-utilities. ESearch stores the result of a query on the history server (usehistory=y) and EFetch
+    downloads it in batches of batch_size records as plain MEDLINE text, the format PubMedRecord parses.
+
+    Attributes:
+        base_url (str): Base URL of the E-utilities, EUTILS_BASE_URL by default.
+        api_key (str): NCBI API key, NCBI_API_KEY by default. Without a key NCBI allows 3 requests per second, with one 10.
+        batch_size (int): Number of records per EFetch request (NCBI allows up to 10000).
+        max_retries (int): Number of retries of a request after a 429 or 5xx response.
+        requests (int): Number of requests sent, retries included.
+        on_request (callable): Called before every request, see SinglePubMedSearcher.
+
+    Methods:
+        search(term):
+            Runs ESearch and returns the number of results and the history server keys.
+
+        fetch(webenv, query_key, start, size):
+            Runs EFetch for one batch of a stored search and returns the MEDLINE text.
+
+        iter_batches(term, max_records):
+            Yields the MEDLINE text of all results of a query, batch by batch.
+    """
+
+    def __init__(self, base_url=None, api_key=None, batch_size=500, max_retries=3):
+        self.base_url = base_url or EUTILS_BASE_URL
+        self.api_key = api_key or NCBI_API_KEY
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.rate_limiter = shared_rate_limiter(self.base_url, self.api_key)
+        self.session = requests.Session()
+        self.requests = 0
+        self.on_request = None
+
+    def _get(self, utility, params):
+        """
+        Sends one request within the rate limit and retries throttled (429) and failed (5xx) requests.
+        """
+        params = {'db': 'pubmed', **params}
+        if self.api_key:
+            params['api_key'] = self.api_key
+        for attempt in range(self.max_retries + 1):
+            if self.on_request:
+                self.on_request()
+            self.rate_limiter.wait()
+            self.requests += 1
+            with span(f'crawler.{utility}'):
+                response = self.session.get(f'{self.base_url}{utility}.fcgi', params=params)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response
+            if attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After', '')
+                sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+        response.raise_for_status()
+
+    def search(self, term):
+        """
+        Runs ESearch with usehistory=y.
+
+        Args:
+            term (str): PubMed query, e.g. 'Mishra, Neha[author]'.
+
+        Returns:
+            tuple: (count, webenv, query_key) with the number of results and the keys of the search on the history server.
+        """
+        result = self._get('esearch', {'term': term, 'usehistory': 'y', 'retmax': 0, 'retmode': 'json'}).json()['esearchresult']
+        return int(result['count']), result['webenv'], result['querykey']
+
+    def fetch(self, webenv, query_key, start, size):
+        """
+        Runs EFetch for the records start to start + size of a stored search.
+
+        Returns:
+            str: The records in MEDLINE format.
+        """
+        params = {'WebEnv': webenv, 'query_key': query_key, 'retstart': start, 'retmax': size, 'rettype': 'medline', 'retmode': 'text'}
+        return self._get('efetch', params).text
+
+    def iter_batches(self, term, max_records=None):
+        """
+        Yields the results of a query as MEDLINE text, one string per batch.
+
+        Args:
+            term (str): PubMed query.
+            max_records (int): Maximum number of records to fetch, all by default.
+        """
+        count, webenv, query_key = self.search(term)
+        if max_records is not None:
+            count = min(count, max_records)
+        for start in range(0, count, self.batch_size):
+            yield self.fetch(webenv, query_key, start, min(self.batch_size, count - start))
+
+
 class SinglePubMedSearcher:
     """
     Searches PubMed for publications by a specified author and stores results.
 
     Attributes:
         author (str): The name of the author to search for.
+        author_dir (str): Directory of the author's results. It only exists once a crawl has completed.
         output_dir (str): Directory path to store processed results.
         raw_dir (str): Directory path to store raw HTML response files.
+        table_dir (str): Directory path to store the columnar Parquet tables of the processed results.
+        base_url (str): Base URL of the PubMed search, PUBMED_BASE_URL by default.
+        max_retries (int): Number of retries of a page after a 429 or 5xx response.
+        delay (tuple): Range in seconds of the random pause between two pages.
+        backend (str): 'web' to scrape the search pages or 'eutils' to use the E-utilities, PUBMED_BACKEND by default.
+        eutils (EUtilsClient): Client of the 'eutils' backend.
+        max_records (int): Maximum number of records fetched per author.
+        parse_workers (int): Number of processes parsing the fetched pages, 0 parses on a thread.
+        match_variants (bool): Whether records listing a compatible spelling of the name ('Muller, J' for 'Müller, Jan')
+            are kept as well.
+        pipeline_report (dict): Queue depths and throughput of the stages of the last crawl, see crawl_pipeline.run_pipeline.
+        tables (dict): Columnar tables of the records of the last crawl, see columnar.build_tables.
+        on_request (callable): Called before every request to PubMed. An exception raised by it aborts the crawl, nothing of
+            the author is stored then. Used by the prefetcher to count its budget and to give way to user searches.
+        background (bool): Whether the search runs in the background. Other searches are counted as user searches,
+            see ForegroundSearches.
 
     Methods:
         author_url(page):
             Constructs a PubMed search URL for the given author and page.
 
-        save_chunks(filtered_chunks):
+        save_chunks(filtered_chunks, output_dir):
             Saves filtered PubMed records to JSON files.
 
+        crawl(staging_dir):
+            Fetches, parses and stores the records of the author in a staging directory.
+
         search_author():
             Searches PubMed for records by the specified author, saving results in structured JSON format.
+            Concurrent searches of the same author share one crawl.
     """
     
-    def __init__(self, author):
+    page_size = 200  # records per search page of the 'web' backend
+
+    def __init__(self, author, base_url=None, max_retries=3, delay=(1, 2), backend=None, eutils_url=None, api_key=None, max_records=1000, parse_workers=2, on_request=None, background=False, match_variants=True):
         self.author = author
-        self.output_dir = f'results/{author.replace(", ", "_")}/processed'
-        self.raw_dir = f'results/{author.replace(", ", "_")}/raw'
-        os.makedirs(self.raw_dir, exist_ok=True)
+        self.base_url = base_url or PUBMED_BASE_URL
+        self.max_retries = max_retries
+        self.delay = delay
+        self.backend = backend or PUBMED_BACKEND
+        if self.backend not in ('web', 'eutils'):
+            raise ValueError(f'Unknown backend {self.backend!r}, expected "web" or "eutils".')
+        self.eutils = EUtilsClient(eutils_url, api_key, max_retries=max_retries) if self.backend == 'eutils' else None
+        self.on_request = on_request
+        self.background = background
+        if self.eutils:
+            self.eutils.on_request = on_request
+        self.max_records = max_records
+        self.parse_workers = parse_workers
+        self.match_variants = match_variants
+        self.pipeline_report = None
+        self.tables = None
+        self.results_dir = 'results'
+        self.dir_name = author.replace(", ", "_")
+        self.author_dir = f'results/{self.dir_name}'
+        self.output_dir = f'results/{self.dir_name}/processed'
+        self.raw_dir = f'results/{self.dir_name}/raw'
+        self.table_dir = f'results/{self.dir_name}/tables'
 
     def author_url(self, page):
         """
@@ -158,32 +416,59 @@ class SinglePubMedSearcher:
         Returns:
             str: The URL for the author's PubMed search results.
         """
-        return f'https://pubmed.ncbi.nlm.nih.gov/?term={self.author.replace(" ", "+")}%5Bauthor%5D&format=pubmed&size=200&page={page}'
+        return f'{self.base_url}?term={self.author.replace(" ", "+")}%5Bauthor%5D&format=pubmed&size={self.page_size}&page={page}'
+
+    def fetch_page(self, url, headers):
+        """
+        Requests a result page. Throttled (429) and failed (5xx) requests are retried after the time given in the
+        Retry-After header or an exponential backoff.
+
+        Args:
+            url (str): URL of the result page.
+            headers (dict): Request headers.
 
-    def save_chunks(self, filtered_chunks):
+        Returns:
+            requests.Response: The last response.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.on_request:
+                self.on_request()
+            with span('crawler.fetch'):
+                response = requests.get(url, headers=headers)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After', '')
+                sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+        return response
+
+    @traced('crawler.save_chunks')
+    def save_chunks(self, filtered_chunks, output_dir=None):
         """
         Saves filtered PubMed records to JSON files in the output directory.
 
         Args:
             filtered_chunks (list): List of filtered records to save.
+            output_dir (str): Directory to save to, output_dir by default.
         """
+        output_dir = output_dir or self.output_dir
         for chunk in filtered_chunks:
             pmid = chunk.get('PMID', None)
             
             if pmid is not None:
                 pmid_cleaned = ''.join(filter(str.isalnum, pmid[0]))  # Clean the PMID
-                file_path = os.path.join(self.output_dir, f'{pmid_cleaned}.json')
+                file_path = os.path.join(output_dir, f'{pmid_cleaned}.json')
 
                 with open(file_path, 'w') as file:
                     json.dump(chunk, file, ensure_ascii=False, indent=4)  # Save as pretty JSON
 
 
-    def search_author(self):
+    def web_pages(self):
         """
-        Searches for publications by the specified author on PubMed and saves them.
+        Yields the result pages of the author from the PubMed search ('web' backend), until a page contains no record.
 
-        Returns:
-            str: Path to the output directory with saved JSON files.
+        Yields:
+            tuple: (page, raw, extension) with the page number, the raw response and the file extension for storing it.
         """
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
@@ -191,34 +476,111 @@ class SinglePubMedSearcher:
             'Accept-Encoding': 'gzip, deflate, br',
             'Connection': 'keep-alive'
         }
-        
+        for current_page in range(1, -(-self.max_records // self.page_size) + 1):
+            if current_page > 1:
+                sleep(random.uniform(*self.delay))  # Simulate human-like delay
+            response = self.fetch_page(self.author_url(current_page), headers)
+            if response.status_code != 200 or not has_records(response.text):
+                break  # No more results
+            yield current_page, response.text, 'html'
+
+    def eutils_pages(self):
+        """
+        Yields the records of the author from ESearch and EFetch in batches ('eutils' backend), see web_pages.
+        """
+        for batch, text in enumerate(self.eutils.iter_batches(f'{self.author}[author]', self.max_records), start=1):
+            if not has_records(text):
+                break
+            yield batch, text, 'txt'
+
+    def crawl(self, staging_dir):
+        """
+        Fetches, parses and stores the records of the author in the processed, raw and tables subdirectories of staging_dir.
+
+        Args:
+            staging_dir (str): Directory the results are written to.
+
+        Returns:
+            list: All saved records.
+        """
+        output_dir, raw_dir = os.path.join(staging_dir, 'processed'), os.path.join(staging_dir, 'raw')
+        os.makedirs(output_dir)
+        os.makedirs(raw_dir)
+        ingested = []
+
+        def write(batch):
+            for (current_page, raw, extension), filtered_chunks in batch:
+                self.save_chunks(filtered_chunks, output_dir)  # Save filtered results
+                ingested.extend(filtered_chunks)
+                # Save raw response
+                with open(os.path.join(raw_dir, f'{current_page}.{extension}'), 'w') as file:
+                    file.write(raw)
+
+        # Pages are parsed and written while the next page is fetched, see crawl_pipeline
+        pages = self.eutils_pages() if self.backend == 'eutils' else self.web_pages()
+        self.pipeline_report = run_pipeline(pages, functools.partial(parse_page, author=self.author, variants=self.match_variants), write, parse_workers=self.parse_workers)
+        for stage, stats in self.pipeline_report['stages'].items():
+            record(f'crawler.pipeline.{stage}', stats['busy_s'])
+
+        # Imported here, pandas is only needed after a crawl and would slow down the start of the app.
+        from columnar import build_tables, save_tables
+        with span('crawler.tables'):
+            self.tables = build_tables(ingested)
+            save_tables(self.tables, os.path.join(staging_dir, 'tables'))
+        return ingested
+
+    def search_author(self):
+        """
+        Searches for publications by the specified author on PubMed and saves them.
+
+        Only one crawl per author runs at a time, also over several sessions and processes: a later search of the same
+        author waits for the running crawl and then returns its results. The crawl writes to a staging directory which is
+        renamed to the author directory when it is complete, so the results are never seen half written.
+
+        Returns:
+            str: Path to the output directory with saved JSON files.
+        """
         # Check if the author has already been searched
         if os.path.exists(self.output_dir):
             print(f'Author {self.author} has been searched before. Skipping...')
             return self.output_dir
-        
-        os.makedirs(self.output_dir, exist_ok=True)
-        current_page = 1
-        while current_page < 6:
-            url_pubmed = self.author_url(current_page)
-            response = requests.get(url_pubmed, headers=headers)
-
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                parsed = PubMedRecord(str(soup.get_text()))  # Parse raw data into structured format
-                filtered_chunks, index = parsed.filter_abstract_4_names(self.author)
-
-                self.save_chunks(filtered_chunks)  # Save filtered results
-                
-                # Save raw response HTML
-                with open(os.path.join(self.raw_dir, f'{current_page}.html'), 'w') as file:
-                    file.write(str(soup))
-
-                sleep(random.uniform(1, 2))  # Simulate human-like delay
-            else:
-                break
-
-            current_page += 1
+        if self.background:
+            return self._search_author()
+        # background crawls abort at their next request, also one holding the lock of this author
+        with foreground.search():
+            return self._search_author()
+
+    def _search_author(self):
+        lock_dir = os.path.join(self.results_dir, '.locks')
+        with named_lock(self.dir_name, lock_dir):
+            # another session may have completed the crawl while this one was waiting for the lock
+            if os.path.exists(self.output_dir):
+                return self.output_dir
+            staging_root = os.path.join(self.results_dir, '.partial')
+            os.makedirs(staging_root, exist_ok=True)
+            staging_dir = tempfile.mkdtemp(prefix=f'{self.dir_name}-', dir=staging_root)
+            try:
+                ingested = self.crawl(staging_dir)
+                if os.path.exists(self.author_dir):
+                    shutil.rmtree(self.author_dir)  # remains of an interrupted crawl
+                os.rename(staging_dir, self.author_dir)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+        # Update the global co-author graph in place, one crawl at a time.
+        # Imported here, scipy is only needed after a crawl and would slow down the start of the app.
+        from coauthor_graph import CoauthorGraph
+        with named_lock('_graph', lock_dir), span('crawler.global_graph'):
+            # an author missing in the graph after a failed update is merged by load() and stored here as well
+            CoauthorGraph.load(self.results_dir).add_papers(ingested, [self.dir_name])
+        # The authorship positions of the new papers are appended to the index of the whole corpus as a new part
+        from authorship import AuthorshipIndex
+        with named_lock('_authorships', lock_dir), span('crawler.authorship_index'):
+            AuthorshipIndex.ingest(self.tables['authorships'], self.results_dir)
+        # The name index of the Summary tab is extended with the same papers instead of being rebuilt by every session
+        with named_lock('_names', lock_dir), span('crawler.name_index'):
+            NameIndex.load(self.results_dir).add_papers(ingested, [self.dir_name])
         return self.output_dir
 
 
@@ -0,0 +1,166 @@
+import sys
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import NamedTuple
+
+"""
+Typed, compact model of a PubMed record.
+
+PubMedRecord produces one dict per paper in which every field is a list, single valued fields like PMID, TI and DP included,
+and every author with an affiliation gets an own '<author>_AD' key. Paper stores single valued tags as plain strings, the
+authors as a tuple of Authorship (name, position, affiliations) and uses __slots__ and interned strings, so an author name
+which appears in many papers is stored only once. LegacyRecord is a read-only view of a Paper in the old dict-of-lists layout,
+so the existing tabs keep working on Papers.
+"""
+
+
+class Authorship(NamedTuple):
+    name: str
+    position: int
+    affiliations: tuple
+
+
+@dataclass(slots=True, frozen=True)
+class Paper:
+    """
+    One PubMed paper.
+
+    Attributes:
+        pmid (str): PubMed identifier.
+        title (str): Title ('TI').
+        date (str): Publication date ('DP'), e.g. '2021 Oct 5'.
+        authorships (tuple): Authorship of every author in the order of the author list ('FAU', 'AD').
+        grants (tuple): Grants ('GR').
+        abstract (str): Abstract ('AB').
+        journal (str): Journal title ('JT').
+        journal_abbreviation (str): Journal title abbreviation ('TA').
+        language (str): Language ('LA').
+        publication_types (tuple): Publication types ('PT').
+        mesh_terms (tuple): MeSH terms ('MH').
+        keywords (tuple): Author keywords ('OT').
+    """
+    pmid: str
+    title: str = ''
+    date: str = ''
+    authorships: tuple = ()
+    grants: tuple = ()
+    abstract: str = ''
+    journal: str = ''
+    journal_abbreviation: str = ''
+    language: str = ''
+    publication_types: tuple = ()
+    mesh_terms: tuple = ()
+    keywords: tuple = ()
+
+    @property
+    def year(self):
+        return self.date.split()[0] if self.date else ''
+
+    @property
+    def authors(self):
+        return tuple(authorship.name for authorship in self.authorships)
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        Converts a parsed record in the dict-of-lists layout.
+
+        Args:
+            record (dict): Record as produced by PubMedRecord or loaded from the processed JSON files.
+
+        Returns:
+            Paper: The compact record.
+        """
+        def first(key):
+            values = record.get(key)
+            return values[0] if values else ''
+
+        def strings(key):
+            return tuple(sys.intern(value) for value in record.get(key, ()))
+
+        # the affiliations of a name listed twice are stored under one key, they are assigned to its first position
+        authorships = []
+        seen = set()
+        for position, name in enumerate(record.get('FAU', ()), start=1):
+            affiliations = strings(f'{name}_AD') if name not in seen else ()
+            seen.add(name)
+            authorships.append(Authorship(sys.intern(name), position, affiliations))
+        return cls(
+            pmid=first('PMID'),
+            title=first('TI'),
+            date=sys.intern(first('DP')),
+            authorships=tuple(authorships),
+            grants=strings('GR'),
+            abstract=first('AB'),
+            journal=sys.intern(first('JT')),
+            journal_abbreviation=sys.intern(first('TA')),
+            language=sys.intern(first('LA')),
+            publication_types=strings('PT'),
+            mesh_terms=strings('MH'),
+            keywords=strings('OT'),
+        )
+
+
+# Tags of the dict-of-lists layout and how to read them from a Paper
+_LEGACY_FIELDS = {
+    'PMID': lambda paper: [paper.pmid] if paper.pmid else None,
+    'TI': lambda paper: [paper.title] if paper.title else None,
+    'DP': lambda paper: [paper.date] if paper.date else None,
+    'AB': lambda paper: [paper.abstract] if paper.abstract else None,
+    'FAU': lambda paper: [authorship.name for authorship in paper.authorships],
+    'AD': lambda paper: [affiliation for authorship in paper.authorships for affiliation in authorship.affiliations] or None,
+    'GR': lambda paper: list(paper.grants) or None,
+    'JT': lambda paper: [paper.journal] if paper.journal else None,
+    'TA': lambda paper: [paper.journal_abbreviation] if paper.journal_abbreviation else None,
+    'LA': lambda paper: [paper.language] if paper.language else None,
+    'PT': lambda paper: list(paper.publication_types) or None,
+    'MH': lambda paper: list(paper.mesh_terms) or None,
+    'OT': lambda paper: list(paper.keywords) or None,
+}
+
+
+class LegacyRecord(Mapping):
+    """
+    Read-only view of a Paper in the dict-of-lists layout of PubMedRecord, including the '<author>_AD' keys.
+    Missing fields raise KeyError like the original dicts, so code like "'GR' in record" keeps its meaning.
+    """
+    __slots__ = ('paper',)
+
+    def __init__(self, paper):
+        self.paper = paper
+
+    def __getitem__(self, key):
+        getter = _LEGACY_FIELDS.get(key)
+        if getter is not None:
+            value = getter(self.paper)
+        elif key.endswith('_AD'):
+            name = key[:-3]
+            value = [affiliation for authorship in self.paper.authorships if authorship.name == name for affiliation in authorship.affiliations] or None
+        else:
+            value = None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key, getter in _LEGACY_FIELDS.items():
+            if getter(self.paper) is not None:
+                yield key
+        seen = set()
+        for authorship in self.paper.authorships:
+            if authorship.affiliations and authorship.name not in seen:
+                seen.add(authorship.name)
+                yield f'{authorship.name}_AD'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'LegacyRecord({self.paper.pmid})'
+
+
+def to_legacy(papers):
+    """
+    Wraps Papers into LegacyRecord views for the tabs which work on the dict-of-lists layout.
+    """
+    return [LegacyRecord(paper) for paper in papers]
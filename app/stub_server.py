@@ -0,0 +1,241 @@
+"""
+Offline stand-in for pubmed.ncbi.nlm.nih.gov to load test the crawler.
+
+The server answers the same '?term=...&format=pubmed&size=200&page=N' URLs as PubMed. Pages are served from recorded
+fixtures (the raw HTML files the crawler stores in results/<author>/raw/<page>.html) or generated from synthetic records.
+Latency, error rate and a 429 rate limit are configurable, so crawl throughput, retries and rate limiting can be measured
+deterministically. The E-utilities ESearch and EFetch endpoints (esearch.fcgi, efetch.fcgi) are served as well, with the
+same synthetic records, for the 'eutils' backend of the crawler. Start it with
+
+    python stub_server.py --port 8765 --latency 0.2 --error-rate 0.05 --rate-limit 3
+
+and point the crawler at it with PUBMED_BASE_URL=http://127.0.0.1:8765/ or SinglePubMedSearcher(author, base_url=...), and
+for the E-utilities with PUBMED_EUTILS_URL=http://127.0.0.1:8765/ or SinglePubMedSearcher(author, backend='eutils', eutils_url=...).
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import zlib
+import json
+from html import escape
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from synthetic import make_records, to_medline
+
+class StubConfig:
+    """
+    Behaviour of the stub server.
+
+    Attributes:
+        fixtures_dir (str): Directory with recorded pages (<fixtures_dir>/<Last_First>/raw/<page>.html), or None.
+        papers (int): Number of synthetic papers per author if no fixture exists.
+        latency (float): Mean response delay in seconds.
+        jitter (float): Maximum random deviation of the delay in seconds.
+        error_rate (float): Probability of answering with a 500 error.
+        rate_limit (float): Allowed requests per second over all clients before answering 429, or None for no limit.
+        seed (int): Seed of the random latency and errors.
+    """
+
+    def __init__(self, fixtures_dir=None, papers=500, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, seed=42):
+        self.fixtures_dir = fixtures_dir
+        self.papers = papers
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.seed = seed
+
+
+class StubState:
+    """
+    Shared state of the request handlers: random generator, rate limiter, page cache and request statistics.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.tokens = config.rate_limit or 0
+        self.last_refill = time.monotonic()
+        self.records = {}  # author -> synthetic records
+        self.history = {}  # WebEnv -> author of a stored ESearch
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def draw(self):
+        """
+        Returns the delay and whether the request fails, drawn from the seeded generator.
+        """
+        with self.lock:
+            delay = max(0.0, self.config.latency + self.random.uniform(-self.config.jitter, self.config.jitter))
+            fail = self.random.random() < self.config.error_rate
+        return delay, fail
+
+    def allow(self):
+        """
+        Token bucket with rate_limit tokens per second and a burst of rate_limit requests.
+        """
+        if not self.config.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.config.rate_limit, self.tokens + (now - self.last_refill) * self.config.rate_limit)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def author_records(self, author):
+        """
+        Returns the synthetic records of an author. Every author gets their own but reproducible corpus.
+        """
+        with self.lock:
+            if author not in self.records:
+                self.records[author] = make_records(self.config.papers, author_name=author, seed=zlib.crc32(author.encode('utf-8')))
+            return self.records[author]
+
+    def page(self, author, page, size):
+        """
+        Returns the HTML of a result page, from a fixture if one exists, otherwise from synthetic records.
+        """
+        if self.config.fixtures_dir:
+            path = os.path.join(self.config.fixtures_dir, author.replace(', ', '_'), 'raw', f'{page}.html')
+            if os.path.exists(path):
+                with open(path, 'r') as file:
+                    return file.read()
+        records = self.author_records(author)[(page - 1) * size:page * size]
+        text = to_medline(records) if records else 'No results were found.'
+        return f'<html><body><pre class="search-results-chunk">{escape(text)}</pre></body></html>'
+
+    def esearch(self, author):
+        """
+        Returns the ESearch JSON of an author search and stores it on the stand-in history server.
+        """
+        webenv = f'STUB_{zlib.crc32(author.encode("utf-8")):08x}'
+        with self.lock:
+            self.history[webenv] = author
+        count = len(self.author_records(author))
+        return json.dumps({'esearchresult': {'count': str(count), 'retmax': '0', 'retstart': '0', 'querykey': '1', 'webenv': webenv, 'idlist': []}})
+
+    def efetch(self, webenv, start, size):
+        """
+        Returns a batch of a stored search as MEDLINE text, or None for an unknown WebEnv.
+        """
+        author = self.history.get(webenv)
+        if author is None:
+            return None
+        return to_medline(self.author_records(author)[start:start + size])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None  # set by make_server
+
+    def do_GET(self):
+        state = self.state
+        state.count('requests')
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        term = query.get('term', [''])[0]
+        author = term.replace('[author]', '').strip()
+        page = int(query.get('page', ['1'])[0])
+        size = int(query.get('size', ['200'])[0])
+
+        if not state.allow():
+            state.count('throttled')
+            self._send(429, 'Too Many Requests', {'Retry-After': '1'})
+            return
+        delay, fail = state.draw()
+        time.sleep(delay)
+        if url.path.endswith('efetch.fcgi') and not fail:
+            start = int(query.get('retstart', ['0'])[0])
+            size = int(query.get('retmax', ['20'])[0])
+            text = state.efetch(query.get('WebEnv', [''])[0], start, size)
+            if text is None:
+                state.count('errors')
+                self._send(400, 'Unknown WebEnv', content_type='text/plain')
+                return
+            state.count('ok')
+            self._send(200, text, content_type='text/plain')
+            return
+        if fail or not author:
+            state.count('errors')
+            self._send(500, 'Internal Server Error')
+            return
+        state.count('ok')
+        if url.path.endswith('esearch.fcgi'):
+            self._send(200, state.esearch(author), content_type='application/json')
+        else:
+            self._send(200, state.page(author, page, size))
+
+    def _send(self, status, body, headers=None, content_type='text/html'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep the output of load tests readable
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """
+    Creates the stub server. Port 0 picks a free port.
+
+    Args:
+        config (StubConfig): Behaviour of the server.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+
+    Returns:
+        ThreadingHTTPServer: The server. server.state holds the request statistics and server.base_url the URL for the crawler.
+    """
+    state = StubState(config)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.state = state
+    server.base_url = f'http://{host}:{server.server_address[1]}/'
+    return server
+
+
+def start_in_background(config, host='127.0.0.1', port=0):
+    """
+    Starts the stub server on a daemon thread, e.g. inside a benchmark. Stop it with server.shutdown().
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline stand-in for the PubMed search pages.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=None, help='Directory with recorded pages, e.g. results.')
+    parser.add_argument('--papers', type=int, default=500, help='Synthetic papers per author without fixture.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response delay in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random deviation of the delay in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 500 response.')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Requests per second before answering 429.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(sys.argv[1:])
+    server = make_server(StubConfig(args.fixtures, args.papers, args.latency, args.jitter, args.error_rate, args.rate_limit, args.seed), args.host, args.port)
+    print(f'Serving PubMed stand-in on {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.state.stats)
@@ -1,48 +1,108 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from collections import Counter
+from aggregate import aggregate, dataset_fingerprint
+from columnar import summary_stats, build_tables, build_index, select_pmids, breakdown
+from figure_cache import FigureCache
+from canonical import Canonicalizer
+from instrument import span
+from names import NameIndex
+from authorship import role_share_by_year, team_size_by_year
 
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_summary_stats(author_name, spellings, fingerprint, _data, _tables=None):
+    """
+    Aggregate the publication data of an author. The result is cached per author, spellings and dataset fingerprint, the data itself is not hashed.
+    If the columnar tables are available, the statistics are computed as vectorized group-bys over them.
+
+    Parameters:
+        author_name (str): Name of the author to analyze.
+        spellings (tuple): Spellings of the author which are counted as the author, see NameIndex.spellings.
+        fingerprint (str): Fingerprint of the dataset, see aggregate.dataset_fingerprint.
+        _data (list of dict): List of publication data, with each publication as a dictionary.
+        _tables (dict): Columnar tables of the same data, see columnar.build_tables.
+    """
+    if _tables is not None:
+        return summary_stats(_tables, author_name, spellings)
+    return aggregate(_data, author_name, spellings)
+
+
+@st.cache_resource(max_entries=1)
+def get_name_index(index_version):
+    """
+    Return the name index of all papers in the local results directory, as stored by the crawler. It is loaded again when
+    a crawl has extended it.
+
+    Parameters:
+        index_version (float): Modification time of the stored index.
+    """
+    return NameIndex.load()
+
+
+def load_name_index():
+    """
+    Return the cached name index, loaded again if the crawler has stored a newer one.
+    """
+    index_file = NameIndex(os.path.join('results', '_names')).path
+    return get_name_index(os.path.getmtime(index_file) if os.path.exists(index_file) else None)
+
+
+@st.cache_resource(max_entries=8)
+def get_field_index(fingerprint, _tables):
+    """
+    Return the inverted index (MeSH terms, journals, publication types, languages, years -> PMIDs) of a dataset.
+    It is built once per dataset fingerprint, so the filters of the Summary tab are answered with set lookups.
+
+    Parameters:
+        fingerprint (str): Fingerprint of the dataset, see aggregate.dataset_fingerprint.
+        _tables (dict): Columnar tables of the dataset, see columnar.build_tables.
+    """
+    return build_index(_tables)
+
+
+@st.cache_resource
+def get_canonicalizer(kind):
+    """
+    Return the affiliation or funder canonicalizer shared by all sessions. Every distinct string is resolved only once per server process.
+
+    Parameters:
+        kind (str): 'affiliation' or 'funder'.
+    """
+    return Canonicalizer(kind)
+
 
-def show_page(data, author_name):
+@st.cache_resource
+def get_figure_cache():
+    """
+    Return the figure cache shared by all sessions of the server process.
+    """
+    return FigureCache()
+
+
+def show_page(data, author_name, tables=None):
     """
     Display an interactive dashboard summarizing research metrics for a specific author.
 
     Parameters:
         data (list of dict): List of publication data, with each publication as a dictionary.
         author_name (str): Name of the author to analyze and highlight in the dashboard.
+        tables (dict): Columnar tables of the same data, see columnar.build_tables. Optional.
     """
 
     # Helper Functionss
 
-    def get_number_of_unique_authors(data):
-        """
-        Return the number of unique authors in the provided publication data. The serched author is excluded.
-
-        Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-        """
-        authors = []
-        for i in data:
-            authors.extend(i['FAU'])
-        return len(set(authors)) - 1 # exclude the author itself
-    
-    def plot_most_collaborated_authors(data):
+    def plot_most_collaborated_authors(stats):
         """
         Plot the top 10 most collaborated authors based on the provided publication data. The searched author is included to get an idea about the order of magnitude.
         
         parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
+            stats (SummaryStats): Aggregated statistics of the publication data.
         """
-        authors = []
-        for i in data:
-            authors.extend(i['FAU'])
-        # Number of counts for each author
-        author_counts = Counter(authors)
         # Get the top 10 authors
-        top_authors = author_counts.most_common(10)
-        top_author = top_authors[1][0]
+        top_authors = stats.author_counts.most_common(10)
+        top_author = next((name for name, _ in top_authors if name not in stats.spellings), None)
         # Create a DataFrame for the top 10 authors
         df = pd.DataFrame(top_authors, columns=['Author', 'Number of Papers']).sort_values('Number of Papers')
         # Plot the top 10 authors using Plotly
@@ -56,18 +116,14 @@ def show_page(data, author_name):
 
         return fig, top_author
 
-    def plot_history_published(data):
+    def plot_history_published(stats):
         """
         Plot the number of papers published each year based on the provided publication data. All papers include date of publication.
 
         Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
+            stats (SummaryStats): Aggregated statistics of the publication data.
         """
-        dates = []
-        for i in data:
-            dates.extend(i['DP'])
-        # Count the number of papers published in each year
-        year_counts = Counter([date.split()[0] for date in dates])
+        year_counts = stats.year_counts
         # Sort the years
         years = sorted(year_counts.keys())
         # Create a dataframe
@@ -79,81 +135,13 @@ def show_page(data, author_name):
         )
         return fig
 
-    def percentage_affiliation(data):
-        """
-        This returns the percentage of authors who have affiliation in each article. This is calculated by dividing the number of affiliations by the number of authors in the paper. 
-        This is done paperwise. If an author appears in many papers, but has only few times affiliation, this will be low.
-
-        Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-        """
-        # Count the number of affiliations and authors, 1 author can also have multiple affiliations
-        affiliations = 0
-        authors = 0
-        for i in data:
-            author_names = i['FAU']
-            authors += len(author_names)
-            for author in author_names:
-                # often affiliation not existent
-                try:
-                    affiliations += len(i[f'{author}_AD'])
-                except KeyError:
-                    pass
-        return affiliations / authors * 100
-
-    def author_percentage_affiliation(data, author_name):
-        """
-        This returns the precentage of affiliations of a specific author in the papers. I only use this for the author.
-
-        Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-            author_name (str): Name of the author to analyze and highlight in the dashboard.
-        """
-        # set the counters to 0
-        affiliations = 0
-        authors = 0
-        for i in data:
-            if author_name in i['FAU']: # only if the author is in the paper
-                authors += 1
-                try:
-                    i[f'{author_name}_AD'] # count the affiliations of the author, affiliation not always existent or one author has sometime multiplle affiliations.
-                    affiliations += 1
-                except KeyError:
-                    pass
-        return affiliations / authors * 100
-
-
-    def percentage_funding(data):
-        """
-        This returns how many percent of the papers contain funding information. One paper can also have multiple funding sources.
-        
-        Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-        """
-        counts = 0
-        for i in data:
-            if 'GR' in i:
-                counts += 1
-
-        perc_funding = counts / len(data) * 100
-
-        return perc_funding
-
-    def plot_funding(data):
+    def plot_funding(funder_counts):
         """
         Plot the top 10 most frequent funding sources based on the provided publication data.
 
         Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
+            funder_counts (Counter): Number of grants of each funding agency, spelling variants merged.
         """
-
-        funders = []
-        for i in data:
-            if 'GR' in i:
-                funders.extend(i['GR'])
-                
-        # Count occurrences of each funder
-        funder_counts = Counter(funders)
         ten_most_common_funders = funder_counts.most_common(10)
         
         # Create a bar chart of the top 10 funding sources
@@ -173,24 +161,14 @@ def show_page(data, author_name):
 
 
 
-    def plot_affiliation(data, author_name):
+    def plot_affiliation(affiliation_counts):
         """
         Plot the top 10 most frequent affiliations based on the provided publication data. This gives an idea what institutions are most frequent in the papers.
         This is done for a specific author. But here only used for te author searched for.
 
         Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-            author_name (str): Name of the author to analyze and highlight in the dashboard.
+            affiliation_counts (Counter): Number of occurrences of each institution of the author, spelling variants merged.
         """
-        affiliations = []
-        for i in data:
-            try:
-                affiliations.extend(i[f'{author_name}_AD'])
-            except KeyError:
-                pass
-
-        # Count occurrences of each affiliation
-        affiliation_counts = Counter(affiliations)
         ten_most_common_affiliations = affiliation_counts.most_common(10)
         
         # Create a bar chart of the top 10 affiliations
@@ -205,47 +183,31 @@ def show_page(data, author_name):
 
         return fig, most_freq_affiliation.replace('.', '')
 
-    def get_most_frequent_last_author(data):
+    def author_positions(stats):
         """
-        Return the most frequent last author name based on the provided publication data. Mostly professors or the head of the lab is the last author.
+        Plot the position of the author in the papers. This is done for the author searched for.
 
         Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
+            stats (SummaryStats): Aggregated statistics of the publication data.
         """
-        last_authors = []
-        for i in data:
-            last_authors.append(i['FAU'][-1])
-        return Counter(last_authors).most_common(1)[0][0]
-
-    def number_paper(data):
-        """
-        Return the number of papers has published, containing the authora name.
-
-        Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-        """
-        return len(data)
+        number_author = pd.DataFrame(stats.positions, columns=['Position']).groupby('Position').size().reset_index(name='Count')
+        # make histogram of positions
+        fig = px.bar(number_author, x='Position', y='Count')
+        return fig, stats.number_first_authorships
 
-    def author_positions(data, author_name):
+    def plot_roles_over_time(authorships):
         """
-        Plot the position of the author in the papers. This is done for the author searched for.
+        Plot the share of first, middle, last and single authorships of the author per year, and the team size of the papers per year.
 
         Parameters:
-            data (list of dict): List of publication data, with each publication as a dictionary.
-            author_name (str): Name of the author to analyze and highlight in the dashboard.
+            authorships (pandas.DataFrame): Authorships table of the columnar tables, with role and year.
         """
-        positions = []
-        for i in data:
-            if author_name in i['FAU']:
-                for idx, author in enumerate(i['FAU']):
-                    if author == author_name:
-                        positions.append(idx +1)
-        
-        number_first_author = len([pos for pos in positions if pos == 1])
-        number_author = pd.DataFrame(positions, columns=['Position']).groupby('Position').size().reset_index(name='Count')
-        # make histogram of positions
-        fig = px.bar(number_author, x='Position', y='Count')
-        return fig, number_first_author
+        shares = role_share_by_year(authorships, stats.spellings).reset_index().melt(id_vars='year', var_name='Role', value_name='Share')
+        fig_roles = px.bar(shares, x='year', y='Share', color='Role', labels={'year': 'Year'})
+        fig_roles.update_layout(yaxis_tickformat='.0%')
+        team_sizes = team_size_by_year(authorships).reset_index()
+        fig_team = px.line(team_sizes, x='year', y=['median', 'mean'], markers=True, labels={'year': 'Year', 'value': 'Number of Authors', 'variable': 'Team Size'})
+        return fig_roles, fig_team
 
     def write_titles_links(data):
         """
@@ -264,23 +226,37 @@ def show_page(data, author_name):
 
 
     with st.spinner('Creating Summary...'): # use spinner to show that the data is loading
-        number_of_paper = number_paper(data)
-        number_unique_collaborators = get_number_of_unique_authors(data)
-        fig_most_colaborated_authors, top_author = plot_most_collaborated_authors(data)
-        fig_publ_history = plot_history_published(data)
-        fig_funding, most_freq_funder = plot_funding(data)
-        fig_affiliation, most_freq_affiliation = plot_affiliation(data, author_name)
-        most_often_last_author = get_most_frequent_last_author(data)
-        fig_author_positions, number_first_author = author_positions(data, author_name)
-        perc_fund = percentage_funding(data)
-        perc_aff = percentage_affiliation(data)
-        perc_aff_author = author_percentage_affiliation(data, author_name)
+        # all statistics are collected in one pass over the data and cached per author and dataset
+        fingerprint = dataset_fingerprint(data)
+        # the spellings the crawler matched come from the name index built at ingest, only the block of the name is compared
+        name_index = load_name_index()
+        with span('summary.aggregate'):
+            stats = get_summary_stats(author_name, tuple(sorted(name_index.spellings(author_name))), fingerprint, data, tables)
+        # the figures are cached serialized per author and dataset and reused over reruns and sessions
+        figures = get_figure_cache()
+        number_of_paper = stats.number_papers
+        number_unique_collaborators = stats.number_unique_collaborators
+        # departments, addresses and spelling variants of the same institution or funding agency are merged
+        with span('summary.canonicalize'):
+            funder_counts = get_canonicalizer('funder').canonical_counts(stats.funder_counts)
+            affiliation_counts = get_canonicalizer('affiliation').canonical_counts(stats.affiliation_counts)
+        with span('summary.figures'):
+            fig_most_colaborated_authors, top_author = figures.get_or_build(author_name, fingerprint, 'most_collaborated_authors', lambda: plot_most_collaborated_authors(stats))
+            fig_publ_history = figures.get_or_build(author_name, fingerprint, 'published_papers', lambda: plot_history_published(stats))
+            fig_funding, most_freq_funder = figures.get_or_build(author_name, fingerprint, 'funding_sources', lambda: plot_funding(funder_counts))
+            fig_affiliation, most_freq_affiliation = figures.get_or_build(author_name, fingerprint, 'affiliations', lambda: plot_affiliation(affiliation_counts))
+            most_often_last_author = stats.last_author_counts.most_common(1)[0][0]
+            fig_author_positions, number_first_author = figures.get_or_build(author_name, fingerprint, 'author_positions', lambda: author_positions(stats))
+        perc_fund = stats.percentage_funding
+        perc_aff = stats.percentage_affiliation
+        perc_aff_author = stats.author_percentage_affiliation
 
         info_df = pd.DataFrame({
-            "Author Info": ["Number of Papers", "Number of Unique Collaborators", "Top Collaborator", 
+            "Author Info": ["Number of Papers", "Spellings Counted as the Author", "Number of Unique Collaborators", "Top Collaborator", 
                             "Most Frequent Funder", "Most Frequent Affiliation", "Most Often Last Author", 
                             "Number of First Authorships"],
-            "Value": [str(number_of_paper), str(number_unique_collaborators), str(top_author), 
+            "Value": [str(number_of_paper), ', '.join(f'{name} ({stats.author_counts[name]})' for name in sorted(stats.spellings, key=stats.author_counts.get, reverse=True)),
+                    str(number_unique_collaborators), str(top_author), 
                     f'{most_freq_funder} | {round(perc_fund)}% of papers have funding information.',
                     f'{most_freq_affiliation} | {round(perc_aff_author)}% of papers include authors affiliation.', 
                     str(most_often_last_author), str(number_first_author)]
@@ -288,7 +264,7 @@ def show_page(data, author_name):
 
     # display the summary
     st.write('## Author Overview')
-    st.write('This table provides an overview of the author and their research metrics. The rows "Most Frequent Funder" and "Most Frequent Affiliation" contain information about how often entrys for the papers were available.')
+    st.write('This table provides an overview of the author and their research metrics. The rows "Most Frequent Funder" and "Most Frequent Affiliation" contain information about how often entrys for the papers were available. The row "Spellings Counted as the Author" lists the spellings of the name (with their number of papers) which are counted as the author. If a spelling belongs to a namesake, e.g. another "Smith, J", their papers are counted as well, see Name Variants below.')
     st.dataframe(info_df, use_container_width=True)
     
     st.write('## History of Published Papers')
@@ -300,7 +276,7 @@ def show_page(data, author_name):
     st.plotly_chart(fig_most_colaborated_authors, key='most_collaborated_authors', use_container_width=True)
 
     st.write('## Funding Sources')
-    st.markdown(f'This graph shows the top 10 funding sources for the papers published with the author. One project can also have multiple grants. The funding identifier is explained in the expander below. **{round(perc_fund)}% of the papers have funding information.**')
+    st.markdown(f'This graph shows the top 10 funding sources for the papers published with the author. One project can also have multiple grants, they are counted per funding agency. **{round(perc_fund)}% of the papers have funding information.**')
     st.plotly_chart(fig_funding, key='funding_sources', use_container_width=True)
 
 
@@ -308,11 +284,50 @@ def show_page(data, author_name):
     st.write('This graph shows the position of the auhor in the papers. Usually the first author has done most work and the declining order of the author position is the contribution of the author.')
     st.plotly_chart(fig_author_positions, key='author_positions', use_container_width=True)
 
+    st.write('## Authorship Roles over Time')
+    st.write('The first graph shows how often the author was first, middle, last or single author per year. A growing share of last authorships usually goes along with leading a group. The second graph shows the median and mean number of authors of the papers per year.')
+    if tables is None:
+        tables = build_tables(data)
+    with span('summary.roles'):
+        fig_roles, fig_team = figures.get_or_build(author_name, fingerprint, 'roles_over_time', lambda: plot_roles_over_time(tables['authorships']))
+    st.plotly_chart(fig_roles, key='roles_over_time', use_container_width=True)
+    st.plotly_chart(fig_team, key='team_size', use_container_width=True)
+
     
     st.write('## Affiliations')
-    st.write(f'This plot shows the top 10 institutions which contributed to the autho papers. This is not the most frequent insitution of just the author. This are the most frequent institutions of all the authors. **{round(perc_aff)}% of the authors have affiliation information.**')
+    st.write(f'This plot shows the top 10 institutions which contributed to the autho papers. This is not the most frequent insitution of just the author. This are the most frequent institutions of all the authors. Departments, addresses and spelling variants of the same institution are counted together. **{round(perc_aff)}% of the authors have affiliation information.**')
     st.plotly_chart(fig_affiliation, key='affiliations', use_container_width=True)
 
     st.write('## List of Papers and Links')
     write_titles_links(data)
 
+    st.write('## Name Variants')
+    st.write('The search also keeps papers which list a spelling of the name without diacritics or with initials, and counts all of them as the author. This table shows spellings of the name in all locally stored papers (other authors searched before included) which could belong to the same person, e.g. with initials instead of first names or without diacritics. Spellings are grouped into persons by shared co-authors and affiliations, so namesakes end up in different rows. This is a heuristic.')
+    persons = name_index.cluster(author_name)
+    if persons:
+        st.dataframe(pd.DataFrame({
+            'Spellings': [', '.join(f'{name} ({count})' for name, count in person['names'].items()) for person in persons],
+            'Number of Papers': [len(person['pmids']) for person in persons],
+        }), use_container_width=True)
+
+    st.write('## Topics, Journals and Publication Types')
+    st.write('These graphs break the papers down by MeSH terms, journals and publication types. Use the filters to restrict them, e.g. to reviews published since 2015. Publication types and journals match if any of the selected values matches.')
+    with span('summary.field_index'):
+        field_index = get_field_index(fingerprint, tables)
+    years = sorted(int(year) for year in field_index['year'] if year.isdigit())
+    col1, col2 = st.columns(2)
+    with col1:
+        publication_types = st.multiselect('Publication Types', sorted(field_index['publication_type'], key=lambda value: -len(field_index['publication_type'][value])))
+        journals = st.multiselect('Journals', sorted(field_index['journal'], key=lambda value: -len(field_index['journal'][value])))
+    with col2:
+        mesh_terms = st.multiselect('MeSH Terms', sorted(field_index['mesh'], key=lambda value: -len(field_index['mesh'][value])))
+        since, until = st.slider('Years', years[0], years[-1], (years[0], years[-1])) if len(years) > 1 else (None, None)
+    with span('summary.field_filter'):
+        pmids = select_pmids(field_index, since=since, until=until, publication_type=publication_types, journal=journals, mesh=mesh_terms)
+    st.markdown(f'**{len(pmids)} of {number_of_paper} papers match the filters.**')
+    if pmids:
+        for field, title in [('mesh', 'MeSH Term'), ('journal', 'Journal'), ('publication_type', 'Publication Type')]:
+            counts = breakdown(tables, field, pmids)
+            fig = px.bar(pd.DataFrame({title: counts.index.astype(str), 'Number of Papers': counts.values}).sort_values('Number of Papers'),
+                         y=title, x='Number of Papers', title=f'Top 10 {title}s')
+            st.plotly_chart(fig, key=f'breakdown_{field}', use_container_width=True)
@@ -0,0 +1,159 @@
+"""
+Synthetic PubMed records for benchmarks. Nothing here touches the network, so benchmarks can run offline and are reproducible through the seed.
+"""
+
+import random
+
+# Vocabulary to build names, titles, affiliations and grants from
+LAST_NAMES = ['Smith', 'Müller', 'Garcia', 'Chen', 'Kumar', 'Nguyen', 'Rossi', 'Kowalski', 'Silva', 'Tanaka',
+              'Johnson', 'Schmidt', 'Martin', 'Ivanova', 'Brown', 'Wang', 'Lopez', 'Novak', 'Ahmed', 'Larsen']
+FIRST_NAMES = ['Anna', 'John', 'Wei', 'Maria', 'Ahmed', 'Sofia', 'Lukas', 'Priya', 'Kenji', 'Elena',
+               'David', 'Fatima', 'Jonas', 'Chloe', 'Rafael', 'Mei', 'Olga', 'Tom', 'Neha', 'Pierre']
+WORDS = ['cell', 'protein', 'expression', 'cancer', 'patients', 'clinical', 'gene', 'analysis', 'mouse', 'signaling',
+         'immune', 'response', 'cohort', 'risk', 'therapy', 'neural', 'receptor', 'model', 'tumor', 'metabolic']
+INSTITUTIONS = ['University of Heidelberg', 'Harvard Medical School', 'Karolinska Institutet', 'University of Tokyo',
+                'Institut Pasteur', 'Max Planck Institute for Biology', 'University of Oxford', 'Stanford University']
+DEPARTMENTS = ['Department of Medicine', 'Department of Biochemistry', 'Institute of Pathology', 'Center for Genomics']
+FUNDERS = ['NIH', 'NCI NIH HHS', 'Wellcome Trust', 'DFG', 'ERC', 'NIGMS NIH HHS', 'Cancer Research UK']
+PUBLICATION_TYPES = ['Journal Article', 'Review', 'Research Support, Non-U.S. Gov\'t', 'Randomized Controlled Trial', 'Comment']
+JOURNALS = [('Nature', 'Nature'), ('Cell', 'Cell'), ('PLoS One', 'PLoS One'), ('The Lancet', 'Lancet'),
+            ('Journal of Immunology', 'J Immunol'), ('Nucleic Acids Research', 'Nucleic Acids Res')]
+MESH_TERMS = ['Humans', 'Animals', 'Mice', 'Female', 'Male', 'Neoplasms', 'Gene Expression', 'Signal Transduction',
+              'Cohort Studies', 'Risk Factors', 'Immunity', 'Brain']
+
+
+def make_author_pool(size, rng):
+    """
+    Creates a pool of distinct 'Last, First' author names.
+
+    Args:
+        size (int): Number of names.
+        rng (random.Random): Random generator.
+
+    Returns:
+        list: Author names.
+    """
+    pool = set()
+    while len(pool) < size:
+        suffix = '' if len(pool) < len(LAST_NAMES) * len(FIRST_NAMES) else f'-{len(pool)}'
+        pool.add(f'{rng.choice(LAST_NAMES)}{suffix}, {rng.choice(FIRST_NAMES)}')
+    return sorted(pool)
+
+
+def make_records(n_papers, author_name='Mishra, Neha', authors_per_paper=8, abstract_words=200, grants_per_paper=2,
+                 affiliation_density=0.7, pool_size=None, seed=42):
+    """
+    Generates parsed PubMed records in the same dict-of-lists layout as PubMedRecord.parsed.
+
+    Args:
+        n_papers (int): Number of papers.
+        author_name (str): The searched author, who appears in every paper.
+        authors_per_paper (int): Average number of authors per paper.
+        abstract_words (int): Number of words in each abstract.
+        grants_per_paper (int): Maximum number of grants per paper.
+        affiliation_density (float): Probability that an authorship has an affiliation.
+        pool_size (int): Number of distinct co-authors. Defaults to a size which grows with the number of papers.
+        seed (int): Seed for reproducible data.
+
+    Returns:
+        list: Parsed records.
+    """
+    rng = random.Random(seed)
+    pool = make_author_pool(pool_size or max(50, n_papers // 2), rng)
+    records = []
+    for i in range(n_papers):
+        n_authors = max(1, int(rng.gauss(authors_per_paper, authors_per_paper / 3)))
+        authors = rng.sample(pool, min(n_authors - 1, len(pool)))
+        authors.insert(rng.randrange(len(authors) + 1), author_name)
+        year = rng.randint(1990, 2024)
+        journal, abbreviation = rng.choice(JOURNALS)
+        record = {
+            'PMID': [str(10000000 + i)],
+            'TI': [' '.join(rng.choices(WORDS, k=rng.randint(6, 16))).capitalize() + '.'],
+            'AB': [' '.join(rng.choices(WORDS, k=abstract_words))],
+            'DP': [f'{year} {rng.choice(["Jan", "Mar", "Jun", "Oct"])}'],
+            'LA': ['eng'],
+            'JT': [journal],
+            'TA': [abbreviation],
+            'PT': rng.sample(PUBLICATION_TYPES, rng.randint(1, 2)),
+            'MH': rng.sample(MESH_TERMS, rng.randint(2, 6)),
+            'FAU': [],
+            'AD': [],
+        }
+        keywords = rng.sample(WORDS, rng.randint(0, 4))
+        if keywords:
+            record['OT'] = keywords
+        n_grants = rng.randint(0, grants_per_paper)
+        if n_grants:
+            record['GR'] = [f'R{rng.randint(1, 99):02d} CA{rng.randint(1000, 9999)}/{rng.choice(FUNDERS)}' for _ in range(n_grants)]
+        for author in authors:
+            record['FAU'].append(author)
+            if rng.random() < affiliation_density:
+                affiliation = f'{rng.choice(DEPARTMENTS)}, {rng.choice(INSTITUTIONS)}.'
+                record['AD'].append(affiliation)
+                record.setdefault(f'{author}_AD', []).append(affiliation)
+        if not record['AD']:
+            del record['AD']
+        records.append(record)
+    return records
+
+
+# Order of the tags of a MEDLINE record as PubMed writes them. The author tags are written per author.
+MEDLINE_ORDER = ['PMID', 'OWN', 'STAT', 'DP', 'TI', 'AB', 'AUTHORS', 'LA', 'GR', 'PT', 'TA', 'JT', 'MH', 'OT']
+
+
+def _medline_field(tag, value, width=88):
+    """
+    Formats one MEDLINE field. The tag is padded to four characters and long values continue on lines indented by six spaces.
+    """
+    lines = []
+    line = f'{tag:<4}- '
+    for word in value.split(' '):
+        if len(line) + len(word) + 1 > width and line.strip():
+            lines.append(line.rstrip())
+            line = '      '
+        line += word + ' '
+    lines.append(line.rstrip())
+    return '\n'.join(lines)
+
+
+def to_medline(records):
+    """
+    Writes records in the MEDLINE text format, which is what PubMed returns with format=pubmed and what PubMedRecord parses.
+
+    Args:
+        records (list): Records as created by make_records.
+
+    Returns:
+        str: The MEDLINE text of all records, separated by blank lines.
+    """
+    texts = []
+    for record in records:
+        fields = []
+        for tag in MEDLINE_ORDER:
+            if tag == 'OWN':
+                fields.append(_medline_field('OWN', 'NLM'))
+            elif tag == 'STAT':
+                fields.append(_medline_field('STAT', 'MEDLINE'))
+            elif tag == 'AUTHORS':
+                for author in record['FAU']:
+                    last, _, first = author.partition(', ')
+                    fields.append(_medline_field('FAU', author))
+                    fields.append(_medline_field('AU', f'{last} {first[:1]}'))
+                    for affiliation in record.get(f'{author}_AD', []):
+                        fields.append(_medline_field('AD', affiliation))
+            else:
+                fields.extend(_medline_field(tag, value) for value in record.get(tag, []))
+        texts.append('\n'.join(fields))
+    return '\n\n'.join(texts) + '\n'
+
+
+def make_medline(n_papers, **kwargs):
+    """
+    Generates a synthetic MEDLINE corpus. Takes the same arguments as make_records.
+
+    Returns:
+        tuple: (text, records) with the MEDLINE text and the records it was written from.
+    """
+    records = make_records(n_papers, **kwargs)
+    return to_medline(records), records
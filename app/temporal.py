@@ -0,0 +1,212 @@
+import threading
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+import networkx as nx
+from metrics import to_csr, pagerank
+from instrument import span
+
+"""
+Co-author network over time.
+
+The papers are grouped by publication year ('DP') and the co-author pairs of every year are counted once. A snapshot is
+the graph of the papers of a range of years, either cumulative (all years up to the selected one) or a window of the last
+n years. The network keeps one live graph and moves it from snapshot to snapshot by adding the pairs of years entering the
+range and removing those of years leaving it, so scrubbing year by year touches only one year of edges per step.
+The snapshot is drawn from the live graph in place (view), a copy of the whole graph per step would cost more than
+building the snapshot from scratch.
+Communities and centrality of a snapshot are computed once and cached.
+"""
+
+
+def paper_year(record):
+    """
+    Returns the publication year of a record, or None if the date has no year.
+    """
+    date = record.get('DP', [''])
+    year = date[0].split()[0] if date and date[0] else ''
+    return int(year) if year.isdigit() else None
+
+
+class TemporalNetwork:
+    """
+    Co-author snapshots of a set of papers by publication year.
+
+    Attributes:
+        years (list): Publication years with at least one paper, sorted.
+        pairs (dict): Year -> Counter of (author, author) pairs, the number of papers of that year they share.
+        authors (dict): Year -> Counter of authors, the number of papers of that year.
+
+    Methods:
+        view(end, window):
+            Moves the live graph to the papers of the years (end - window, end], or all years up to end, and yields it.
+
+        snapshot(end, window):
+            Returns a copy of a snapshot, which later moves do not change.
+
+        stats(end, window):
+            Returns nodes, edges, communities, modularity and the most central authors of a snapshot (cached).
+
+        layout():
+            Returns the node positions of the graph of all years, shared by all snapshots.
+
+        timeline(window):
+            Returns the number of authors and co-author pairs of every snapshot, year by year.
+    """
+
+    def __init__(self, data):
+        self.pairs = defaultdict(Counter)
+        self.authors = defaultdict(Counter)
+        for record in data:
+            year = paper_year(record)
+            if year is None:
+                continue
+            author_list = list(dict.fromkeys(record.get('FAU', [])))
+            self.authors[year].update(author_list)
+            for i in range(len(author_list)):
+                for j in range(i + 1, len(author_list)):
+                    a, b = sorted((author_list[i], author_list[j]))
+                    self.pairs[year][(a, b)] += 1
+        self.years = sorted(self.authors)
+        self.graph = nx.Graph()
+        self._range = set()  # years contained in the live graph
+        self._stats = {}  # (end, window) -> stats of the snapshot
+        self._timelines = {}  # window -> timeline
+        self._layout = None
+        self._lock = threading.RLock()  # stats and layout may be called while a view is open
+
+    def _years(self, end, window=None):
+        return frozenset(year for year in self.years if year <= end and (window is None or year > end - window))
+
+    def _add_year(self, year, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) the papers of one year from the live graph.
+        """
+        G = self.graph
+        for author, count in self.authors[year].items():
+            if sign > 0:
+                if author in G:
+                    G.nodes[author]['papers'] += count
+                else:
+                    G.add_node(author, papers=count)
+        for (a, b), count in self.pairs[year].items():
+            if sign > 0:
+                if G.has_edge(a, b):
+                    G[a][b]['papers'] += count
+                else:
+                    G.add_edge(a, b, papers=count)
+            else:
+                G[a][b]['papers'] -= count
+                if G[a][b]['papers'] == 0:
+                    G.remove_edge(a, b)
+        if sign < 0:
+            for author, count in self.authors[year].items():
+                G.nodes[author]['papers'] -= count
+                if G.nodes[author]['papers'] == 0:
+                    G.remove_node(author)
+
+    def _move_to(self, years):
+        for year in self._range - years:
+            self._add_year(year, -1)
+        for year in sorted(years - self._range):
+            self._add_year(year, 1)
+        self._range = set(years)
+
+    @contextmanager
+    def view(self, end, window=None):
+        """
+        Moves the live graph to a snapshot and yields it without copying. The graph must not be changed, and it is only
+        valid inside the with block, which holds the lock of the network.
+
+        Args:
+            end (int): Last year of the snapshot.
+            window (int): Number of years of the snapshot, or None for all years up to end.
+
+        Yields:
+            nx.Graph: The live co-author graph of the snapshot. Nodes and edges store the number of papers in 'papers'.
+        """
+        with self._lock:
+            self._move_to(self._years(end, window))
+            yield self.graph
+
+    def snapshot(self, end, window=None):
+        """
+        Moves the live graph to a snapshot and returns a copy of it, so later moves do not change it. Copying costs
+        about as much as building the graph, use view where the graph is only read.
+
+        Args:
+            end (int): Last year of the snapshot.
+            window (int): Number of years of the snapshot, or None for all years up to end.
+
+        Returns:
+            nx.Graph: The co-author graph of the snapshot. Nodes and edges store the number of papers in 'papers'.
+        """
+        with self._lock:
+            self._move_to(self._years(end, window))
+            return self.graph.copy()
+
+    def stats(self, end, window=None, top=10):
+        """
+        Computes communities (greedy modularity), modularity, degree centrality and PageRank of a snapshot.
+        The result is cached per snapshot.
+
+        Args:
+            end (int): Last year of the snapshot.
+            window (int): Number of years of the snapshot, or None for all years up to end.
+            top (int): Number of most central authors to return.
+
+        Returns:
+            dict: 'nodes', 'edges', 'communities' (list of sets), 'modularity', 'new_authors' (first paper in end)
+                  and 'central' (DataFrame-ready list of (author, degree centrality, PageRank)).
+        """
+        key = (end, window)
+        with self._lock:
+            if key in self._stats:
+                return self._stats[key]
+            self._move_to(self._years(end, window))
+            G = self.graph
+            with span('temporal.communities'):
+                communities = list(nx.algorithms.community.greedy_modularity_communities(G)) if G.number_of_edges() else []
+                modularity = nx.algorithms.community.modularity(G, communities) if communities else 0.0
+            with span('temporal.centrality'):
+                degree = nx.degree_centrality(G)
+                ranks = pagerank(*to_csr(G)) if len(G) else {}
+            earlier = set().union(*(self.authors[year] for year in self.years if year < end)) if end in self.authors else set()
+            stats = {
+                'nodes': G.number_of_nodes(),
+                'edges': G.number_of_edges(),
+                'communities': communities,
+                'modularity': modularity,
+                'new_authors': len(set(self.authors.get(end, ())) - earlier),
+                'central': [(node, degree[node], ranks.get(node, 0.0)) for node in sorted(degree, key=degree.get, reverse=True)[:top]],
+            }
+            self._stats[key] = stats
+            return stats
+
+    def layout(self):
+        """
+        Returns the spring layout of the graph of all years. Every snapshot is drawn with it, so authors keep their
+        position while scrubbing through the years and the layout is only computed once.
+        """
+        with self._lock:
+            if self._layout is None:
+                self._move_to(frozenset(self.years))
+                with span('temporal.layout'):
+                    self._layout = nx.spring_layout(self.graph, seed=42, k=0.15, iterations=50)
+            return self._layout
+
+    def timeline(self, window=None):
+        """
+        Walks through all years once, adding one year at a time, and counts authors and co-author pairs of every snapshot.
+        The result is cached per window.
+
+        Returns:
+            list: (year, number of authors, number of pairs) per year.
+        """
+        with self._lock:
+            if window not in self._timelines:
+                rows = []
+                for end in self.years:
+                    self._move_to(self._years(end, window))
+                    rows.append((end, self.graph.number_of_nodes(), self.graph.number_of_edges()))
+                self._timelines[window] = rows
+            return self._timelines[window]
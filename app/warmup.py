@@ -0,0 +1,48 @@
+import os
+import threading
+import importlib
+from instrument import span
+
+"""
+Optional warm-up at server start. With PUBMED_WARMUP=1 the app starts a background thread on the first script run,
+which imports the tab modules and their heavy dependencies and loads the embedding model. Clicking into a tab afterwards
+does not pay the import and loading time anymore. PUBMED_WARMUP_MODEL=0 skips loading the model.
+"""
+
+# Modules in the order they are usually needed
+WARMUP_MODULES = ['pandas', 'plotly.express', 'summary', 'columnar', 'networkx', 'scipy.sparse', 'network', 'torch', 'transformers', 'sklearn.decomposition', 'embedd']
+
+
+def warm_up(load_model=True):
+    """
+    Imports the heavy modules and optionally loads the embedding model. Modules which can not be imported are skipped.
+
+    Args:
+        load_model (bool): Whether to load the embedding model as well.
+    """
+    for module in WARMUP_MODULES:
+        with span(f'warmup.import.{module}'):
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+    if load_model:
+        try:
+            import embedd
+            embedd.load_model()
+        except Exception as error:  # e.g. no network access, the tab will try again when it is opened
+            print(f'Warm-up could not load the embedding model: {error}')
+
+
+def start_warmup():
+    """
+    Starts the warm-up on a daemon thread if PUBMED_WARMUP=1.
+
+    Returns:
+        threading.Thread: The running warm-up thread, or None if the warm-up is disabled.
+    """
+    if os.environ.get('PUBMED_WARMUP') != '1':
+        return None
+    thread = threading.Thread(target=warm_up, kwargs={'load_model': os.environ.get('PUBMED_WARMUP_MODEL', '1') == '1'}, daemon=True, name='warmup')
+    thread.start()
+    return thread